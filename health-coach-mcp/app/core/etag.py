@@ -0,0 +1,56 @@
+"""
+Pre-serialized JSON payloads served with ETags
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+
+class ETagPayload:
+    """
+    A JSON payload built once per version and served as bytes.
+
+    The payload is rebuilt only when version() returns something new. The
+    ETag is a hash of the serialized bytes, so clients that send it back in
+    If-None-Match get 304 Not Modified without a body.
+    """
+
+    def __init__(self, name: str, builder: Callable[[], Any], version: Callable[[], str]):
+        self.name = name
+        self.builder = builder
+        self.version = version
+        self._built: Optional[Tuple[str, bytes, str]] = None
+
+    def get(self) -> Tuple[bytes, str]:
+        """Serialized payload and its ETag, rebuilding if the version changed"""
+        version = self.version()
+        if self._built is None or self._built[0] != version:
+            body = json.dumps(self.builder(), default=str).encode()
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            self._built = (version, body, etag)
+            logger.info(f"Built {self.name} payload for version {version} ({len(body)} bytes)")
+        return self._built[1], self._built[2]
+
+    def response(self, request: Request) -> Response:
+        """200 with the payload, or 304 if the client already has it"""
+        body, etag = self.get()
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
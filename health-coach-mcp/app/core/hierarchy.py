@@ -1,6 +1,8 @@
 """
 Hierarchical constraint system definitions
 """
+import hashlib
+import json
 from enum import Enum
 from typing import Dict, List, Optional, Set
 from pydantic import BaseModel
@@ -1026,6 +1028,31 @@ CONSTRAINT_HIERARCHY = {
 }
 
 
+def _compute_hierarchy_version() -> str:
+    """Content hash of the hierarchy definitions"""
+    payload = {
+        "cohorts": {
+            cohort.value: {
+                "description": data["description"],
+                "allowed_intents": [intent.value for intent in data["allowed_intents"]],
+                "complexity_level": data["complexity_level"],
+                "constraints": [c.dict() for c in data.get("constraints", [])]
+            }
+            for cohort, data in CONSTRAINT_HIERARCHY["cohorts"].items()
+        },
+        "sub_intents": {
+            sub_intent_id: sub_intent.dict()
+            for sub_intent_id, sub_intent in CONSTRAINT_HIERARCHY["sub_intents"].items()
+        }
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+# Changes whenever any cohort, sub-intent or constraint definition changes
+HIERARCHY_VERSION = _compute_hierarchy_version()
+
+
 def get_applicable_constraints(
     cohort: Cohort,
     intent: IntentClass,
@@ -0,0 +1,95 @@
+"""
+Compiled, read-only index over the constraint hierarchy
+
+Built once at import so that request paths never scan the sub-intent table
+or rebuild constraint lists.
+"""
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from app.core.hierarchy import (
+    Cohort, IntentClass, Category, Constraint, SubIntent,
+    CONSTRAINT_HIERARCHY, HIERARCHY_VERSION, get_applicable_constraints
+)
+
+RoutePath = Tuple[Cohort, IntentClass, Category, Optional[str]]
+
+
+class HierarchyIndex:
+    """Immutable lookup tables compiled from a constraint hierarchy"""
+
+    def __init__(self, hierarchy: Dict, version: str):
+        self.version = version
+
+        sub_intents: Dict[str, SubIntent] = dict(hierarchy["sub_intents"])
+        self.sub_intents: Mapping[str, SubIntent] = MappingProxyType(sub_intents)
+
+        # (category, intent) -> sub-intents, in hierarchy order
+        by_path: Dict[Tuple[Category, IntentClass], List[Tuple[str, SubIntent]]] = {
+            (category, intent): [] for category in Category for intent in IntentClass
+        }
+        by_category: Dict[Category, List[Tuple[str, SubIntent]]] = {
+            category: [] for category in Category
+        }
+        for sub_intent_id, sub_intent in sub_intents.items():
+            by_path[(sub_intent.parent_category, sub_intent.parent_intent)].append(
+                (sub_intent_id, sub_intent)
+            )
+            by_category[sub_intent.parent_category].append((sub_intent_id, sub_intent))
+        self.sub_intents_by_path = MappingProxyType(
+            {path: tuple(entries) for path, entries in by_path.items()}
+        )
+        self.sub_intents_by_category = MappingProxyType(
+            {category: tuple(entries) for category, entries in by_category.items()}
+        )
+
+        self.cohort_constraints = MappingProxyType({
+            cohort: tuple(data.get("constraints", []))
+            for cohort, data in hierarchy["cohorts"].items()
+        })
+        self.sub_intent_constraints = MappingProxyType({
+            sub_intent_id: tuple(sub_intent.constraints)
+            for sub_intent_id, sub_intent in sub_intents.items()
+        })
+
+        # (cohort, intent, category, sub_intent) -> frozen constraint tuples
+        constraints: Dict[RoutePath, Tuple[Constraint, ...]] = {}
+        for cohort in hierarchy["cohorts"]:
+            for intent in IntentClass:
+                for category in Category:
+                    sub_intent_ids = [None] + [
+                        sid for sid, _ in self.sub_intents_by_path[(category, intent)]
+                    ]
+                    for sub_intent_id in sub_intent_ids:
+                        constraints[(cohort, intent, category, sub_intent_id)] = tuple(
+                            get_applicable_constraints(cohort, intent, category, sub_intent_id)
+                        )
+        self.constraints = MappingProxyType(constraints)
+
+    def sub_intents_for(
+        self,
+        category: Category,
+        intent_class: IntentClass
+    ) -> Tuple[Tuple[str, SubIntent], ...]:
+        """Sub-intents under a category and intent"""
+        return self.sub_intents_by_path.get((category, intent_class), ())
+
+    def constraints_for(
+        self,
+        cohort: Cohort,
+        intent_class: IntentClass,
+        category: Category,
+        sub_intent_id: Optional[str] = None
+    ) -> Tuple[Constraint, ...]:
+        """Applicable constraints for a route"""
+        path = (cohort, intent_class, category, sub_intent_id)
+        if path in self.constraints:
+            return self.constraints[path]
+        # Sub-intent outside its own category/intent; resolve the slow way
+        return tuple(get_applicable_constraints(cohort, intent_class, category, sub_intent_id))
+
+    def serialize(self, constraints: Iterable[Constraint]) -> Tuple[Dict[str, Any], ...]:
+        """Serialized constraint dicts, fresh on every call"""
+        return tuple(constraint.model_dump() for constraint in constraints)
+
+HIERARCHY_INDEX = HierarchyIndex(CONSTRAINT_HIERARCHY, HIERARCHY_VERSION)
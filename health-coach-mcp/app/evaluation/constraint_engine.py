@@ -0,0 +1,276 @@
+"""
+Compiled constraint evaluation engine
+
+Each constraint type maps to rules that fire on phrases in the constraint
+description and look for terms in the response. The engine is compiled once
+from CONSTRAINT_HIERARCHY: every hierarchy constraint is bound to the rules
+whose trigger its description carries, and the terms of all rules go into one
+combined pattern. Each response is lowercased and matched in a single pass,
+and each constraint is decided from the set of rules whose terms were seen.
+Constraints from outside the hierarchy are bound on first use.
+
+StreamingConstraintMonitor applies the forbid rules incrementally while a
+response is still being generated, so a violation can stop generation early.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.core.hierarchy import CONSTRAINT_HIERARCHY
+
+# (id, type, description, severity), picklable for worker processes
+ConstraintSpec = Tuple[str, str, str, str]
+
+SEVERITY_WEIGHTS = {"high": 0.3, "medium": 0.2, "low": 0.1}
+
+
+@dataclass(frozen=True)
+class ConstraintRule:
+    """A response check that applies to constraints whose description has a trigger phrase"""
+    constraint_type: str
+    trigger: str
+    terms: Tuple[str, ...]
+    # "require": at least one term must appear; "forbid": none may appear
+    mode: str
+    violation: str
+    suggestion: str
+
+
+RULES: Tuple[ConstraintRule, ...] = (
+    ConstraintRule(
+        constraint_type="data_source",
+        trigger="peer-reviewed",
+        terms=("study", "research", "meta-analysis"),
+        mode="require",
+        violation="Response doesn't cite appropriate research sources",
+        suggestion="Include citations to peer-reviewed research"
+    ),
+    ConstraintRule(
+        constraint_type="scope_boundary",
+        trigger="anecdotes",
+        terms=("i know someone", "my friend", "personally"),
+        mode="forbid",
+        violation="Response includes anecdotal evidence",
+        suggestion="Remove anecdotal examples and focus on evidence"
+    ),
+    ConstraintRule(
+        constraint_type="tone",
+        trigger="simple",
+        terms=("bioavailability", "thermogenesis", "gluconeogenesis"),
+        mode="forbid",
+        violation="Response uses technical jargon",
+        suggestion="Simplify language and explain technical terms"
+    ),
+)
+
+
+class ConstraintEngine:
+    """Evaluate responses against constraints from a precompiled rule table"""
+
+    def __init__(
+        self,
+        rules: Sequence[ConstraintRule] = RULES,
+        hierarchy: Optional[Dict] = CONSTRAINT_HIERARCHY
+    ):
+        self.rules = tuple(rules)
+
+        self._terms: Tuple[Tuple[str, ...], ...] = tuple(
+            tuple(term.lower() for term in rule.terms) for rule in self.rules
+        )
+        # A match is credited to every term it contains, since it hides them
+        terms = {term for rule_terms in self._terms for term in rule_terms}
+        self._term_rules: Dict[str, FrozenSet[int]] = {
+            term: frozenset(
+                index for index, rule_terms in enumerate(self._terms)
+                if any(inner in term for inner in rule_terms)
+            )
+            for term in terms
+        }
+        self._pattern = re.compile(
+            "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        ) if terms else None
+
+        # (type, lowercased description) -> rule indexes, for every hierarchy constraint
+        self.bindings: Dict[Tuple[str, str], Tuple[int, ...]] = {}
+        for constraint in hierarchy_constraints(hierarchy or {}):
+            key = (constraint.type.value, constraint.description.lower())
+            self.bindings[key] = self._match(*key)
+
+    def scan(self, text: str) -> Set[int]:
+        """Indexes of the rules with at least one term in the text, in one pass"""
+        hits: Set[int] = set()
+        if self._pattern:
+            for term in set(self._pattern.findall(text.lower())):
+                hits |= self._term_rules[term]
+        return hits
+
+    def rules_for(self, constraint_type: str, description: str) -> Tuple[int, ...]:
+        """Indexes of the rules that apply to a constraint"""
+        key = (constraint_type, description.lower())
+        rules = self.bindings.get(key)
+        if rules is None:
+            rules = _rules_for(self, *key)
+        return rules
+
+    def _match(self, constraint_type: str, description: str) -> Tuple[int, ...]:
+        """Rules whose type and trigger match a lowercased description"""
+        return tuple(
+            index for index, rule in enumerate(self.rules)
+            if rule.constraint_type == constraint_type and rule.trigger in description
+        )
+
+    def evaluate(self, response: str, constraints: Iterable[ConstraintSpec]) -> Dict[str, Any]:
+        """Score a response against its constraints"""
+        applicable = [
+            (spec, self.rules_for(spec[1], spec[2])) for spec in constraints
+        ]
+        hits = self.scan(response) if response and any(rules for _, rules in applicable) else set()
+
+        violations = []
+        suggestions = []
+        score = 1.0
+        for (constraint_id, constraint_type, description, severity), rules in applicable:
+            for index in rules:
+                rule = self.rules[index]
+                matched = index in hits
+                if matched == (rule.mode == "forbid"):
+                    violations.append(self.violation(
+                        (constraint_id, constraint_type, description, severity), index
+                    ))
+                    suggestions.append(rule.suggestion)
+                    score -= SEVERITY_WEIGHTS.get(severity, 0.1)
+                    # One violation per constraint
+                    break
+
+        return {
+            "passed": not violations,
+            "violations": violations,
+            "suggestions": suggestions,
+            "score": max(0.0, score)
+        }
+
+    def violation(self, constraint: ConstraintSpec, rule_index: int) -> Dict[str, Any]:
+        """Violation entry for a constraint failing a rule"""
+        constraint_id, constraint_type, description, severity = constraint
+        return {
+            "constraint_id": constraint_id,
+            "type": constraint_type,
+            "description": description,
+            "violation": self.rules[rule_index].violation,
+            "severity": severity
+        }
+
+    def evaluate_many(
+        self,
+        items: Iterable[Tuple[str, Sequence[ConstraintSpec]]]
+    ) -> List[Dict[str, Any]]:
+        """Score a batch of (response, constraints) pairs"""
+        return [self.evaluate(response, constraints) for response, constraints in items]
+
+
+@lru_cache(maxsize=4096)
+def _rules_for(
+    engine: ConstraintEngine,
+    constraint_type: str,
+    description: str
+) -> Tuple[int, ...]:
+    """Rule lookup for constraints outside the hierarchy, memoized since they repeat"""
+    return engine._match(constraint_type, description)
+
+
+def hierarchy_constraints(hierarchy: Dict) -> List[Any]:
+    """Every constraint in a hierarchy, once each, cohorts first"""
+    constraints: Dict[str, Any] = {}
+    for cohort_data in hierarchy.get("cohorts", {}).values():
+        for constraint in cohort_data.get("constraints", []):
+            constraints.setdefault(constraint.id, constraint)
+    for sub_intent in hierarchy.get("sub_intents", {}).values():
+        for constraint in sub_intent.constraints:
+            constraints.setdefault(constraint.id, constraint)
+    return list(constraints.values())
+
+
+def constraint_specs(constraints: Iterable[Any]) -> Tuple[ConstraintSpec, ...]:
+    """Reduce Constraint models to the fields the engine reads"""
+    return tuple(
+        (constraint.id, constraint.type.value, constraint.description, constraint.severity)
+        for constraint in constraints
+    )
+
+
+CONSTRAINT_ENGINE = ConstraintEngine()
+
+
+class StreamingConstraintMonitor:
+    """
+    Check forbidden terms as response deltas arrive.
+
+    Only forbid rules can be decided before the response is complete. The
+    last few characters of each delta are kept so that a term split across
+    deltas is still found, and only the new text plus that tail is searched.
+    """
+
+    def __init__(
+        self,
+        constraints: Iterable[ConstraintSpec],
+        severities: Iterable[str] = ("high",),
+        engine: Optional[ConstraintEngine] = None
+    ):
+        self.engine = engine or CONSTRAINT_ENGINE
+        severities = set(severities)
+
+        # term -> (constraint, rule) pairs it would violate
+        self._terms: Dict[str, List[Tuple[ConstraintSpec, int]]] = {}
+        for constraint in constraints:
+            if constraint[3] not in severities:
+                continue
+            for index in self.engine.rules_for(constraint[1], constraint[2]):
+                if self.engine.rules[index].mode != "forbid":
+                    continue
+                for term in self.engine._terms[index]:
+                    self._terms.setdefault(term, []).append((constraint, index))
+
+        self._tail_size = max((len(term) for term in self._terms), default=1) - 1
+        self._tail = ""
+        self.violation: Optional[Dict[str, Any]] = None
+
+    @property
+    def active(self) -> bool:
+        """Whether any constraint can be violated mid-stream"""
+        return bool(self._terms)
+
+    def feed(self, delta: str) -> Optional[Dict[str, Any]]:
+        """Add a delta, returning the violation once one is found"""
+        if self.violation or not self._terms:
+            return self.violation
+        window = self._tail + delta.lower()
+        for term, watchers in self._terms.items():
+            if term in window:
+                constraint, index = watchers[0]
+                self.violation = self.engine.violation(constraint, index)
+                return self.violation
+        self._tail = window[-self._tail_size:] if self._tail_size else ""
+        return None
+
+    async def watch(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Pass deltas through until a violation is found, then close the source.
+
+        The violating delta is not passed on. Closing the source stops
+        upstream generation.
+        """
+        try:
+            async for delta in deltas:
+                if self.feed(delta):
+                    return
+                yield delta
+        finally:
+            await deltas.aclose()
+
+
+def evaluate_batch(
+    items: Sequence[Tuple[str, Sequence[ConstraintSpec]]]
+) -> List[Dict[str, Any]]:
+    """Process pool entry point; each worker compiles the engine once on import"""
+    return CONSTRAINT_ENGINE.evaluate_many(items)
@@ -7,8 +7,9 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 
 from app.core.config import settings
-from app.routers import chat, cohorts, intents, evaluation, health, component_testing
-from app.services.database import init_db
+from app.routers import chat, cohorts, intents, evaluation, health, component_testing, metrics
+from app.services.database import init_db, engine
+from app.services.container import ServiceContainer
 
 # Configure logging
 logging.basicConfig(
@@ -24,8 +25,17 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Health Coach MCP Service")
     # Initialize database
     await init_db()
+    # Create shared clients and services (builds the pre-router index)
+    services = ServiceContainer()
+    await services.startup()
+    app.state.services = services
+    # Serialize the polled hierarchy payloads before the first request
+    evaluation.HIERARCHY_PAYLOAD.get()
+    intents.INTENT_HIERARCHY_PAYLOAD.get()
     yield
     logger.info("Shutting down Health Coach MCP Service")
+    await services.shutdown()
+    await engine.dispose()
 
 
 app = FastAPI(
@@ -51,6 +61,7 @@ app.include_router(intents.router, prefix="/intents", tags=["intents"])
 app.include_router(evaluation.router, prefix="/evaluate", tags=["evaluation"])
 app.include_router(component_testing.router, prefix="/component", tags=["component-testing"])
 app.include_router(health.router, prefix="/health", tags=["health"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 
 @app.get("/")
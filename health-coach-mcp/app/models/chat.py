@@ -1,8 +1,9 @@
 """
 Chat models with provenance tracking
 """
+import bisect
 from typing import Dict, List, Optional, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from datetime import datetime
 from uuid import uuid4
 
@@ -25,6 +26,11 @@ class RoutingDecision(BaseModel):
     constraints: List[Constraint] = []
     confidence: float
     reasoning: str
+    metadata: Dict[str, Any] = {}
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a plain dict"""
+        return self.model_dump()
 
 
 class Provenance(BaseModel):
@@ -37,6 +43,7 @@ class Provenance(BaseModel):
     confidence: float
     trace_id: str
     reasoning: str
+    context_sources: Dict[str, str] = {}
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     
     def to_hierarchy_path(self) -> str:
@@ -69,6 +76,18 @@ class ChatResponse(BaseModel):
     metadata: Dict[str, Any] = {}
 
 
+class RouteBatchItem(BaseModel):
+    """Single query to classify in a batch routing request"""
+    query: str
+    cohort: Cohort = Cohort.HEALTH_ENTHUSIAST
+    id: Optional[str] = None
+
+
+class RouteBatchRequest(BaseModel):
+    """Request for the batch routing endpoint"""
+    items: List[RouteBatchItem]
+
+
 class ConversationTrace(BaseModel):
     """Full conversation trace for evaluation"""
     trace_id: str = Field(default_factory=lambda: str(uuid4()))
@@ -78,9 +97,31 @@ class ConversationTrace(BaseModel):
     routing_decisions: List[RoutingDecision] = []
     provenances: List[Provenance] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Entries per field already written by storage
+    _persisted: Dict[str, int] = PrivateAttr(default_factory=dict)
+    # Opened while its stored state could not be read; never saved
+    _detached: bool = PrivateAttr(default=False)
     
     def to_evaluation_format(self) -> Dict:
         """Convert to format for open coding evaluation"""
+        # Each assistant message gets the first provenance, in list order, at
+        # or after its timestamp. That is the first position where the
+        # running maximum of provenance timestamps reaches the message, so a
+        # single pass plus a binary search per message replaces the scan.
+        running_max = []
+        for provenance in self.provenances:
+            latest = running_max[-1] if running_max else provenance.timestamp
+            running_max.append(max(latest, provenance.timestamp))
+        serialized: Dict[int, Dict] = {}
+        
+        def provenance_for(msg: ChatMessage) -> Optional[Dict]:
+            position = bisect.bisect_left(running_max, msg.timestamp)
+            if position == len(running_max):
+                return None
+            if position not in serialized:
+                serialized[position] = self.provenances[position].model_dump()
+            return serialized[position]
+        
         return {
             "trace_id": self.trace_id,
             "session_id": self.session_id,
@@ -91,11 +132,7 @@ class ConversationTrace(BaseModel):
                     "role": msg.role,
                     "content": msg.content,
                     "timestamp": msg.timestamp.isoformat(),
-                    "provenance": next(
-                        (p.dict() for p in self.provenances 
-                         if p.timestamp >= msg.timestamp),
-                        None
-                    ) if msg.role == "assistant" else None
+                    "provenance": provenance_for(msg) if msg.role == "assistant" else None
                 }
                 for msg in self.messages
             ],
@@ -118,4 +155,24 @@ class EvaluationResult(BaseModel):
     passed: bool
     violations: List[Dict[str, Any]] = []
     suggestions: List[str] = []
-    score: float = 0.0
\ No newline at end of file
+    score: float = 0.0
+
+
+class BulkEvaluationItem(BaseModel):
+    """One response to score in a bulk evaluation"""
+    response: str
+    routing_decision: RoutingDecision
+
+
+class BulkEvaluationRequest(BaseModel):
+    """Many responses to score against their constraints"""
+    items: List[BulkEvaluationItem]
+
+
+class BulkEvaluationResult(BaseModel):
+    """Results of a bulk evaluation, in request order"""
+    results: List[EvaluationResult]
+    count: int
+    passed: int
+    mean_score: float
+    elapsed_ms: float
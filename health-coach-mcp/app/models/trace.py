@@ -0,0 +1,24 @@
+"""
+Database models for archived conversation traces
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import Column, String
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlmodel import Field, SQLModel
+
+
+class TraceRecord(SQLModel, table=True):
+    """A conversation trace persisted beyond the Redis retention window"""
+    __tablename__ = "conversation_traces"
+
+    trace_id: str = Field(primary_key=True)
+    session_id: str = Field(index=True, unique=True)
+    user_id: str = Field(index=True)
+    created_at: datetime
+    updated_at: datetime = Field(index=True)
+    message_count: int = 0
+    categories: List[str] = Field(default=[], sa_column=Column(ARRAY(String)))
+    intents: List[str] = Field(default=[], sa_column=Column(ARRAY(String)))
+    data: Dict[str, Any] = Field(sa_column=Column(JSONB, nullable=False))
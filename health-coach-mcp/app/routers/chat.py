@@ -1,23 +1,29 @@
 """
 Chat endpoint with hierarchical routing and provenance
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
-from typing import Optional, AsyncGenerator
+from starlette.background import BackgroundTask
+from typing import Optional, AsyncGenerator, List
 import logging
 import json
-import asyncio
 from uuid import uuid4
 from datetime import datetime
 
+from app.evaluation.constraint_engine import StreamingConstraintMonitor, constraint_specs
 from app.models.chat import (
     ChatRequest, ChatResponse, ChatMessage,
-    ConversationTrace, Provenance
+    ConversationTrace, Provenance, RouteBatchRequest, RoutingDecision
 )
-from app.services.router import SemanticRouter
-from app.services.coach import HealthCoach
-from app.services.storage import ConversationStorage
+from app.services.batch_router import BatchRouter, iter_ndjson
+from app.services.llm_governor import bind_llm_lane
+from app.services.container import ServiceContainer, get_services
+from app.services.context import CONTEXT_SOURCES
+from app.services.pipeline import ChatPipeline, PreparedChat
+from app.services.sse import SSEWriter
+from app.core.config import settings
 from app.core.auth import verify_api_key
+from app.core.hierarchy_index import HIERARCHY_INDEX
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -26,25 +32,32 @@ router = APIRouter()
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    _: str = Depends(verify_api_key)
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
 ) -> ChatResponse:
     """
     Main chat endpoint with hierarchical routing and provenance tracking
+    
+    Returns 503 with Retry-After when admission control is shedding load,
+    unless the request is admitted in degraded mode.
     """
+    ticket = services.admit("chat")
+    degraded = bool(ticket and ticket.degraded)
     try:
-        # Initialize services
-        semantic_router = SemanticRouter()
-        health_coach = HealthCoach()
-        storage = ConversationStorage()
+        semantic_router = services.router
+        health_coach = services.coach
+        storage = services.storage
         
         # Generate trace ID
         trace_id = str(uuid4())
         
-        # Load or create conversation trace
-        trace = await storage.get_or_create_trace(
-            session_id=request.session_id,
-            user_id=request.user_id
-        )
+        # Load the trace, route the query and gather context
+        pipeline = ChatPipeline(semantic_router, health_coach, storage, degraded=degraded)
+        prepared = await pipeline.prepare(request)
+        trace = prepared.trace
+        routing_decision = prepared.routing_decision
+        context_sources = prepared.context_sources
+        timer = prepared.timer
         
         # Add user message to trace
         user_message = ChatMessage(
@@ -53,13 +66,6 @@ async def chat(
             metadata={"cohort": request.cohort.value}
         )
         trace.messages.append(user_message)
-        
-        # Route the query
-        routing_decision = await semantic_router.route(
-            query=request.message,
-            user_cohort=request.cohort,
-            context=request.context
-        )
         trace.routing_decisions.append(routing_decision)
         
         # Generate response with constraints
@@ -67,8 +73,10 @@ async def chat(
             query=request.message,
             routing_decision=routing_decision,
             user_cohort=request.cohort,
-            context=request.context
+            context=request.context,
+            retrieval_context=prepared.retrieval_context
         )
+        timer.mark("generation")
         
         # Create provenance if requested
         provenance = None
@@ -76,7 +84,8 @@ async def chat(
             provenance = semantic_router.create_provenance(
                 routing_decision=routing_decision,
                 user_cohort=request.cohort,
-                trace_id=trace_id
+                trace_id=trace_id,
+                context_sources=context_sources
             )
             trace.provenances.append(provenance)
         
@@ -86,13 +95,14 @@ async def chat(
             content=response_content,
             metadata={
                 "provenance": provenance.dict() if provenance else None,
-                "routing": routing_decision.dict()
+                "routing": routing_decision.to_dict()
             }
         )
         trace.messages.append(assistant_message)
         
         # Save trace
         await storage.save_trace(trace)
+        timer.mark("save")
         
         # Log for monitoring
         logger.info(
@@ -101,7 +111,8 @@ async def chat(
             f"Session: {request.session_id}, "
             f"Route: {routing_decision.category.value} > "
             f"{routing_decision.intent_class.value} > "
-            f"{routing_decision.sub_intent_id or 'general'}"
+            f"{routing_decision.sub_intent_id or 'general'}, "
+            f"Timings: {timer.timings}"
         )
         
         return ChatResponse(
@@ -110,96 +121,189 @@ async def chat(
             provenance=provenance,
             metadata={
                 "trace_id": trace_id,
-                "confidence": routing_decision.confidence
+                "confidence": routing_decision.confidence,
+                "timings_ms": timer.timings,
+                **({"degraded": True} if degraded else {})
             }
         )
         
     except Exception as e:
         logger.error(f"Chat error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    finally:
+        if ticket:
+            ticket.release()
 
 
 @router.post("/stream")
 async def chat_stream(
     request: ChatRequest,
-    _: str = Depends(verify_api_key)
+    http_request: Request,
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
 ):
     """
     Streaming chat endpoint with real-time provenance updates
+    
+    If the client disconnects, upstream generation is cancelled and the
+    partial response is saved to the trace marked as truncated.
+    
+    While the response streams it is checked against the high-severity
+    constraints. On a violation, generation is stopped, a response_reset
+    event tells the client to discard the text so far, and the response is
+    regenerated with the violation as feedback.
+    
+    Returns 503 with Retry-After when admission control is shedding load,
+    unless the request is admitted in degraded mode.
     """
+    ticket = services.admit("stream")
+    degraded = bool(ticket and ticket.degraded)
+    
     async def generate_stream() -> AsyncGenerator[str, None]:
+        # Generate trace ID
+        trace_id = str(uuid4())
+        writer = SSEWriter(trace_id)
+        services.stream_stats["started"] += 1
+        prepared = None
+        routing_decision = None
+        stages = None
+        deltas = None
+        frames = None
+        finished = False
+        
         try:
-            # Initialize services
-            semantic_router = SemanticRouter()
-            health_coach = HealthCoach()
-            storage = ConversationStorage()
-            
-            # Generate trace ID
-            trace_id = str(uuid4())
+            semantic_router = services.router
+            health_coach = services.coach
+            storage = services.storage
             
             # Stage 1: Cohort Analysis
-            yield f"data: {json.dumps({'type': 'provenance', 'stage': 'cohort_analysis', 'data': {'cohort': request.cohort.value, 'description': f'Analyzing query for {request.cohort.value} cohort'}, 'timestamp': trace_id})}\n\n"
-            await asyncio.sleep(0.1)
+            yield writer.provenance("cohort_analysis", {
+                "cohort": request.cohort.value,
+                "description": f"Analyzing query for {request.cohort.value} cohort"
+            })
             
             # Stage 2: Intent Classification
-            yield f"data: {json.dumps({'type': 'provenance', 'stage': 'intent_classification', 'data': {'status': 'processing', 'description': 'Classifying intent and category'}, 'timestamp': trace_id})}\n\n"
-            await asyncio.sleep(0.2)
+            yield writer.provenance("intent_classification", {
+                "status": "processing",
+                "description": "Classifying intent and category"
+            })
             
-            # Route the query
-            routing_decision = await semantic_router.route(
-                query=request.message,
-                user_cohort=request.cohort,
-                context=request.context
-            )
+            # Load the trace, route the query and gather context, reporting
+            # each stage as soon as it completes
+            pipeline = ChatPipeline(semantic_router, health_coach, storage, degraded=degraded)
+            stages = pipeline.stages(request)
+            async for stage, prepared in stages:
+                if stage != "routing":
+                    continue
+                routing_decision = prepared.routing_decision
+                
+                # Stage 3: Routing Decision
+                yield writer.provenance("routing_decision", {
+                    "category": routing_decision.category.value,
+                    "intent": routing_decision.intent_class.value,
+                    "confidence": routing_decision.confidence,
+                    "description": f"Routed to {routing_decision.category.value} > {routing_decision.intent_class.value}"
+                })
+                
+                # Stage 4: Constraint Application
+                cohort_constraints = list(HIERARCHY_INDEX.serialize(routing_decision.constraints))
+                yield writer.provenance("constraint_application", {
+                    "constraints": cohort_constraints,
+                    "description": f"Applying {len(cohort_constraints)} constraints"
+                })
             
-            # Stage 3: Routing Decision
-            yield f"data: {json.dumps({'type': 'provenance', 'stage': 'routing_decision', 'data': {'category': routing_decision.category.value, 'intent': routing_decision.intent_class.value, 'confidence': routing_decision.confidence, 'description': f'Routed to {routing_decision.category.value} > {routing_decision.intent_class.value}'}, 'timestamp': trace_id})}\n\n"
-            await asyncio.sleep(0.1)
-            
-            # Stage 4: Constraint Application
-            cohort_constraints = [c.dict() for c in routing_decision.constraints]
-            yield f"data: {json.dumps({'type': 'provenance', 'stage': 'constraint_application', 'data': {'constraints': cohort_constraints, 'description': f'Applying {len(cohort_constraints)} constraints'}, 'timestamp': trace_id})}\n\n"
-            await asyncio.sleep(0.1)
+            context_sources = prepared.context_sources
+            timer = prepared.timer
             
             # Stage 5: Response Generation
-            yield f"data: {json.dumps({'type': 'provenance', 'stage': 'response_generation', 'data': {'status': 'generating', 'description': 'Generating personalized response with applied constraints'}, 'timestamp': trace_id})}\n\n"
+            yield writer.provenance("response_generation", {
+                "status": "generating",
+                "context_sources": context_sources,
+                "description": "Generating personalized response with applied constraints"
+            })
             
-            # Generate response with streaming (this is the slow part)
-            full_response = ""
-            async for chunk in health_coach.generate_response_stream(
-                query=request.message,
-                routing_decision=routing_decision,
-                user_cohort=request.cohort,
-                context=request.context
-            ):
-                full_response += chunk
-                # Stream each chunk as it comes
-                yield f"data: {json.dumps({'type': 'response_chunk', 'chunk': chunk, 'timestamp': trace_id})}\n\n"
+            # Generate response with streaming, coalescing deltas into frames
+            discarded = []
+            feedback = None
+            while True:
+                deltas = health_coach.generate_response_stream(
+                    query=request.message,
+                    routing_decision=routing_decision,
+                    user_cohort=request.cohort,
+                    context=request.context,
+                    retrieval_context=prepared.retrieval_context,
+                    feedback=feedback
+                )
+                # The last attempt allowed is streamed unchecked
+                monitor = None
+                if (
+                    settings.STREAM_MONITOR_ENABLED
+                    and len(discarded) < settings.STREAM_MONITOR_MAX_REGENERATIONS
+                ):
+                    monitor = StreamingConstraintMonitor(
+                        constraint_specs(routing_decision.constraints)
+                    )
+                    if monitor.active:
+                        deltas = monitor.watch(deltas)
+                
+                frames = writer.chunks(deltas)
+                async for frame in frames:
+                    if await http_request.is_disconnected():
+                        # Stop consuming; cleanup below closes the upstream stream
+                        return
+                    if "first_chunk" not in timer.timings:
+                        timer.mark("first_chunk")
+                    yield frame
+                
+                if not (monitor and monitor.violation):
+                    break
+                
+                # Upstream is already closed; start over with the violation as feedback
+                violation = monitor.violation
+                discarded.append({**violation, "discarded_chars": len(writer.text)})
+                services.stream_stats["regenerated"] += 1
+                timer.mark(f"regeneration_{len(discarded)}")
+                logger.info(
+                    f"Regenerating streamed response - Session: {request.session_id}, "
+                    f"violation: {violation['constraint_id']} ({violation['violation']})"
+                )
+                writer.reset()
+                yield writer.event(
+                    "response_reset",
+                    attempt=len(discarded),
+                    violation=violation
+                )
+                feedback = violation["violation"]
+            
+            timer.mark("generation")
+            full_response = writer.text
             
             # Stage 6: Response Ready
-            yield f"data: {json.dumps({'type': 'provenance', 'stage': 'response_ready', 'data': {'status': 'complete', 'description': 'Response generation complete'}, 'timestamp': trace_id})}\n\n"
+            yield writer.provenance("response_ready", {
+                "status": "complete",
+                "description": "Response generation complete"
+            })
             
             # Send final complete response
-            yield f"data: {json.dumps({'type': 'response_complete', 'content': full_response, 'timestamp': trace_id})}\n\n"
+            yield writer.event("response_complete", content=full_response)
             
             # Create final provenance
             if request.include_provenance:
                 provenance = semantic_router.create_provenance(
                     routing_decision=routing_decision,
                     user_cohort=request.cohort,
-                    trace_id=trace_id
+                    trace_id=trace_id,
+                    context_sources=context_sources
                 )
                 # Convert provenance to dict with ISO timestamp
                 provenance_dict = provenance.dict()
                 if 'timestamp' in provenance_dict and isinstance(provenance_dict['timestamp'], datetime):
                     provenance_dict['timestamp'] = provenance_dict['timestamp'].isoformat()
-                yield f"data: {json.dumps({'type': 'final_provenance', 'provenance': provenance_dict, 'timestamp': trace_id})}\n\n"
+                yield writer.event("final_provenance", provenance=provenance_dict)
             
             # Save to storage (async)
-            trace = await storage.get_or_create_trace(
-                session_id=request.session_id,
-                user_id=request.user_id
-            )
+            trace = prepared.trace
             
             user_message = ChatMessage(
                 role="user",
@@ -212,24 +316,61 @@ async def chat_stream(
                 role="assistant", 
                 content=full_response,
                 metadata={
-                    "routing": routing_decision.dict(),
-                    "trace_id": trace_id
+                    "routing": routing_decision.to_dict(),
+                    "trace_id": trace_id,
+                    **({"discarded_attempts": discarded} if discarded else {})
                 }
             )
             trace.messages.append(assistant_message)
             
             await storage.save_trace(trace)
+            timer.mark("save")
+            stream_metrics = writer.stats()
+            logger.info(
+                f"Streaming chat processed - Session: {request.session_id}, "
+                f"Timings: {timer.timings}, Stream: {stream_metrics}"
+            )
+            
+            finished = True
+            services.stream_stats["completed"] += 1
             
             # End stream
-            yield f"data: {json.dumps({'type': 'complete', 'session_id': request.session_id, 'timestamp': trace_id})}\n\n"
+            yield writer.event(
+                "complete",
+                session_id=request.session_id,
+                timings_ms=timer.timings,
+                stream_metrics=stream_metrics,
+                regenerations=len(discarded),
+                **({"degraded": True} if degraded else {})
+            )
             
         except Exception as e:
+            finished = True
+            services.stream_stats["failed"] += 1
             logger.error(f"Streaming chat error: {str(e)}", exc_info=True)
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e), 'timestamp': trace_id})}\n\n"
+            yield writer.event("error", error=str(e))
+        
+        finally:
+            if ticket:
+                ticket.release()
+            if not finished:
+                # The client went away; this generator may be cancelled, so
+                # cleanup runs as a task that outlives the request
+                services.stream_stats["aborted"] += 1
+                logger.info(
+                    f"Stream aborted by client - Session: {request.session_id}, "
+                    f"streamed {len(writer.text)} chars"
+                )
+                services.spawn(_abort_stream(
+                    services, request, trace_id, prepared, routing_decision,
+                    [stages, frames, deltas], writer.text
+                ))
     
     return StreamingResponse(
         generate_stream(),
         media_type="text/event-stream",
+        # Releases the ticket even if the client left before the stream started
+        background=BackgroundTask(ticket.release) if ticket else None,
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
@@ -239,14 +380,134 @@ async def chat_stream(
     )
 
 
+async def _abort_stream(
+    services: ServiceContainer,
+    request: ChatRequest,
+    trace_id: str,
+    prepared: Optional[PreparedChat],
+    routing_decision: Optional[RoutingDecision],
+    iterators: List[Optional[AsyncGenerator]],
+    partial_response: str
+) -> None:
+    """Close the upstream stream and save the partial response as truncated"""
+    for iterator in iterators:
+        if iterator is None:
+            continue
+        try:
+            await iterator.aclose()
+        except RuntimeError:
+            # Still unwinding from cancellation; it closes the stream itself
+            pass
+    
+    if routing_decision is None:
+        return
+    
+    try:
+        trace = prepared.trace if prepared and prepared.trace else (
+            await services.storage.open_trace(
+                session_id=request.session_id,
+                user_id=request.user_id
+            )
+        )
+        trace.messages.append(ChatMessage(
+            role="user",
+            content=request.message,
+            metadata={"cohort": request.cohort.value}
+        ))
+        trace.messages.append(ChatMessage(
+            role="assistant",
+            content=partial_response,
+            metadata={
+                "routing": routing_decision.to_dict(),
+                "trace_id": trace_id,
+                "truncated": True
+            }
+        ))
+        await services.storage.save_trace(trace)
+    except Exception as e:
+        logger.error(f"Failed to save truncated stream: {str(e)}")
+
+
+@router.post("/route-batch")
+async def route_batch(
+    request: Request,
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """
+    Route a batch of (query, cohort) pairs without generating responses.
+    
+    Accepts either a JSON body ({"items": [...]} or a bare list) or an
+    application/x-ndjson stream with one item per line, and streams one
+    NDJSON result line per item back in completion order.
+    """
+    content_type = request.headers.get("content-type", "")
+    
+    if "ndjson" in content_type:
+        # The streaming response listens for disconnects on the same receive
+        # channel, so the request body has to be consumed before it starts
+        entries = []
+        async for entry in iter_ndjson(request.stream()):
+            entries.append(entry)
+            if len(entries) > settings.ROUTE_BATCH_MAX_ITEMS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Batch exceeds {settings.ROUTE_BATCH_MAX_ITEMS} items"
+                )
+        
+        async def iter_items():
+            for entry in entries:
+                yield entry
+        
+        items = iter_items()
+    else:
+        try:
+            body = await request.json()
+            if isinstance(body, list):
+                body = {"items": body}
+            batch = RouteBatchRequest(**body)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Invalid batch request: {str(e)}")
+        if len(batch.items) > settings.ROUTE_BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch exceeds {settings.ROUTE_BATCH_MAX_ITEMS} items"
+            )
+        
+        async def iter_items():
+            for index, item in enumerate(batch.items):
+                yield index, item
+        
+        items = iter_items()
+    
+    batch_router = BatchRouter(
+        services.router,
+        concurrency=settings.ROUTE_BATCH_CONCURRENCY
+    )
+    
+    async def generate_results() -> AsyncGenerator[str, None]:
+        # Batch routing yields to interactive routing and generation
+        bind_llm_lane("batch")
+        routed = 0
+        async for result in batch_router.route_stream(items):
+            routed += 1
+            yield json.dumps(result, default=str) + "\n"
+        logger.info(f"Batch routing complete - {routed} items")
+    
+    return StreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.get("/session/{session_id}")
 async def get_session(
     session_id: str,
-    _: str = Depends(verify_api_key)
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
 ) -> ConversationTrace:
     """Get full conversation trace for a session"""
-    storage = ConversationStorage()
-    trace = await storage.get_trace(session_id)
+    trace = await services.storage.get_trace(session_id)
     
     if not trace:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -257,13 +518,77 @@ async def get_session(
 @router.get("/session/{session_id}/evaluation")
 async def get_session_for_evaluation(
     session_id: str,
-    _: str = Depends(verify_api_key)
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
 ):
     """Get session data formatted for open coding evaluation"""
-    storage = ConversationStorage()
-    trace = await storage.get_trace(session_id)
+    trace = await services.storage.get_trace(session_id)
     
     if not trace:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    return trace.to_evaluation_format()
\ No newline at end of file
+    return trace.to_evaluation_format()
+
+
+@router.get("/context-cache/stats")
+async def get_context_cache_stats(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Get retriever cache hit/miss counters"""
+    if not services.retriever_cache:
+        return {"enabled": False}
+    return services.retriever_cache.stats()
+
+
+@router.delete("/context-cache/{user_id}")
+async def invalidate_context_cache(
+    user_id: str,
+    source: Optional[str] = None,
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Drop cached context for a user after upstream data changes"""
+    if source and source not in CONTEXT_SOURCES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown source '{source}', expected one of {', '.join(CONTEXT_SOURCES)}"
+        )
+    if not services.retriever_cache:
+        return {"enabled": False, "invalidated": 0}
+    return {
+        "user_id": user_id,
+        "source": source,
+        "invalidated": services.retriever_cache.invalidate(user_id, source)
+    }
+
+
+@router.get("/stream/stats")
+async def get_stream_stats(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Get counts of started, completed, aborted and failed streams"""
+    return services.stream_stats
+
+
+@router.get("/routing-cache/stats")
+async def get_routing_cache_stats(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Get routing decision cache hit/miss counters"""
+    if not services.routing_cache:
+        return {"enabled": False}
+    return services.routing_cache.stats()
+
+
+@router.get("/response-cache/stats")
+async def get_response_cache_stats(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Get response cache hit/miss and bypass counters"""
+    if not services.response_cache:
+        return {"enabled": False}
+    return services.response_cache.stats()
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends
 from typing import List, Dict
 
 from app.core.hierarchy import Cohort, CONSTRAINT_HIERARCHY
+from app.core.hierarchy_index import HIERARCHY_INDEX
 from app.core.auth import verify_api_key
 
 router = APIRouter()
@@ -22,7 +23,7 @@ async def list_cohorts(_: str = Depends(verify_api_key)):
             "description": data["description"],
             "complexity_level": data["complexity_level"],
             "allowed_intents": [intent.value for intent in data["allowed_intents"]],
-            "constraints": [c.dict() for c in data.get("constraints", [])]
+            "constraints": list(HIERARCHY_INDEX.serialize(HIERARCHY_INDEX.cohort_constraints[cohort]))
         })
     
     return cohorts
@@ -44,7 +45,7 @@ async def get_cohort(
             "description": data["description"],
             "complexity_level": data["complexity_level"],
             "allowed_intents": [intent.value for intent in data["allowed_intents"]],
-            "constraints": [c.dict() for c in data.get("constraints", [])]
+            "constraints": list(HIERARCHY_INDEX.serialize(HIERARCHY_INDEX.cohort_constraints[cohort]))
         }
         
     except ValueError:
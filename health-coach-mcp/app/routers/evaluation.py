@@ -1,16 +1,23 @@
 """
 Evaluation endpoints for constraint validation
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import Dict, List, Optional
 import asyncio
 import json
+import time
 from datetime import datetime
 
-from app.models.chat import EvaluationRequest, EvaluationResult
-from app.services.storage import ConversationStorage
+from app.core.config import settings
+from app.core.etag import ETagPayload
+from app.evaluation.constraint_engine import CONSTRAINT_ENGINE, constraint_specs, evaluate_batch
+from app.models.chat import (
+    BulkEvaluationRequest, BulkEvaluationResult, EvaluationRequest, EvaluationResult
+)
+from app.services.container import ServiceContainer, get_services
 from app.core.auth import verify_api_key
 from app.core.hierarchy import CONSTRAINT_HIERARCHY, Cohort, IntentClass, Category
+from app.core.hierarchy_index import HIERARCHY_INDEX
 # from app.evaluation.test_suite import HealthCoachTestSuite
 # from app.evaluation.synthetic_data import SyntheticDataGenerator
 # from app.tools.registry import tool_registry
@@ -24,36 +31,48 @@ async def evaluate_response(
     _: str = Depends(verify_api_key)
 ) -> EvaluationResult:
     """Evaluate a response against its constraints"""
-    violations = []
-    score = 1.0
-    suggestions = []
-    
-    # Check each constraint
-    for constraint in request.routing_decision.constraints:
-        violation = await _check_constraint(
-            constraint,
-            request.response,
-            request.original_query
-        )
-        
-        if violation:
-            violations.append(violation)
-            # Reduce score based on severity
-            severity_weights = {"high": 0.3, "medium": 0.2, "low": 0.1}
-            score -= severity_weights.get(constraint.severity, 0.1)
+    return EvaluationResult(**CONSTRAINT_ENGINE.evaluate(
+        request.response,
+        constraint_specs(request.routing_decision.constraints)
+    ))
+
+
+@router.post("/bulk", response_model=BulkEvaluationResult)
+async def evaluate_bulk(
+    request: BulkEvaluationRequest,
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+) -> BulkEvaluationResult:
+    """
+    Evaluate many responses against their constraints.
     
-    # Ensure score doesn't go below 0
-    score = max(0.0, score)
+    Items are split into chunks that are scored in the evaluation process
+    pool, so large batches neither block the event loop nor share one core.
+    """
+    start = time.perf_counter()
+    items = [
+        (item.response, constraint_specs(item.routing_decision.constraints))
+        for item in request.items
+    ]
+    chunk_size = max(1, settings.EVALUATION_CHUNK_SIZE)
     
-    # Generate suggestions based on violations
-    if violations:
-        suggestions = _generate_suggestions(violations)
+    if services.evaluation_pool and len(items) > chunk_size:
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*[
+            loop.run_in_executor(services.evaluation_pool, evaluate_batch, items[i:i + chunk_size])
+            for i in range(0, len(items), chunk_size)
+        ])
+        scored = [result for chunk in chunks for result in chunk]
+    else:
+        scored = CONSTRAINT_ENGINE.evaluate_many(items)
     
-    return EvaluationResult(
-        passed=len(violations) == 0,
-        violations=violations,
-        suggestions=suggestions,
-        score=score
+    results = [EvaluationResult(**result) for result in scored]
+    return BulkEvaluationResult(
+        results=results,
+        count=len(results),
+        passed=sum(1 for result in results if result.passed),
+        mean_score=round(sum(result.score for result in results) / len(results), 4) if results else 0.0,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
     )
 
 
@@ -61,99 +80,88 @@ async def evaluate_response(
 async def get_evaluation_traces(
     user_id: str = None,
     limit: int = 50,
-    _: str = Depends(verify_api_key)
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[Category] = None,
+    intent: Optional[IntentClass] = None,
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
 ):
-    """Get conversation traces for evaluation"""
-    storage = ConversationStorage()
-    traces = await storage.get_traces_for_evaluation(user_id, limit)
+    """
+    Get conversation traces for evaluation, most recently updated first.
+    
+    Filter by user, time range (ISO timestamps) and route; pass next_cursor
+    from the previous page as cursor to continue.
+    """
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    traces = await services.storage.get_traces_for_evaluation(
+        user_id=user_id,
+        limit=limit,
+        cursor=cursor,
+        start=start,
+        end=end,
+        category=category.value if category else None,
+        intent=intent.value if intent else None
+    )
     return traces
 
 
+@router.post("/traces/reindex")
+async def reindex_evaluation_traces(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Build trace indexes for evaluation data stored before they existed"""
+    indexed = await services.storage.rebuild_indexes()
+    return {"indexed": indexed}
+
+
+@router.get("/archive/stats")
+async def get_archive_stats(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Write-behind queue depth and flush counters for the trace archive"""
+    if not services.trace_archive:
+        return {"enabled": False}
+    return {"enabled": True, **services.trace_archive.stats()}
+
+
 @router.get("/traces/{trace_id}")
 async def get_trace_for_evaluation(
     trace_id: str,
-    _: str = Depends(verify_api_key)
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
 ):
     """Get specific trace for evaluation"""
-    storage = ConversationStorage()
-    
-    # Try to get from evaluation cache
     try:
-        import redis.asyncio as redis
-        r = redis.from_url("redis://redis:6379/3")  # TODO: Use config
-        data = await r.get(f"evaluation:{trace_id}")
-        
-        if data:
-            import json
-            return json.loads(data)
-        else:
-            raise HTTPException(status_code=404, detail="Trace not found")
-            
+        data = await services.storage.get_evaluation_trace(trace_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-
-async def _check_constraint(constraint, response: str, query: str) -> Dict:
-    """Check if a response violates a constraint"""
-    # Simple constraint checking - in production, this would be more sophisticated
-    
-    if constraint.type.value == "data_source":
-        if "peer-reviewed" in constraint.description.lower():
-            if not any(term in response.lower() for term in ["study", "research", "meta-analysis"]):
-                return {
-                    "constraint_id": constraint.id,
-                    "type": constraint.type.value,
-                    "description": constraint.description,
-                    "violation": "Response doesn't cite appropriate research sources",
-                    "severity": constraint.severity
-                }
-    
-    elif constraint.type.value == "scope_boundary":
-        if "no anecdotes" in constraint.description.lower():
-            if any(term in response.lower() for term in ["i know someone", "my friend", "personally"]):
-                return {
-                    "constraint_id": constraint.id,
-                    "type": constraint.type.value,
-                    "description": constraint.description,
-                    "violation": "Response includes anecdotal evidence",
-                    "severity": constraint.severity
-                }
-    
-    elif constraint.type.value == "tone":
-        if "simple" in constraint.description.lower():
-            # Simple check for jargon
-            jargon_terms = ["bioavailability", "thermogenesis", "gluconeogenesis"]
-            if any(term in response.lower() for term in jargon_terms):
-                return {
-                    "constraint_id": constraint.id,
-                    "type": constraint.type.value,
-                    "description": constraint.description,
-                    "violation": "Response uses technical jargon",
-                    "severity": constraint.severity
-                }
     
-    return None
+    if not data:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return data
 
 
-def _generate_suggestions(violations: List[Dict]) -> List[str]:
-    """Generate improvement suggestions based on violations"""
-    suggestions = []
-    
-    for violation in violations:
-        if violation["type"] == "data_source":
-            suggestions.append("Include citations to peer-reviewed research")
-        elif violation["type"] == "scope_boundary":
-            suggestions.append("Remove anecdotal examples and focus on evidence")
-        elif violation["type"] == "tone":
-            suggestions.append("Simplify language and explain technical terms")
+@router.get("/hierarchy")
+async def get_evaluation_hierarchy(
+    request: Request,
+    _: str = Depends(verify_api_key)
+):
+    """
+    Get the complete evaluation hierarchy for the Agent Evaluation dashboard
     
-    return suggestions
+    Served pre-serialized with an ETag; send it back as If-None-Match to
+    get 304 Not Modified while the hierarchy is unchanged.
+    """
+    return HIERARCHY_PAYLOAD.response(request)
 
 
-@router.get("/hierarchy")
-async def get_evaluation_hierarchy(_: str = Depends(verify_api_key)):
-    """Get the complete evaluation hierarchy for the Agent Evaluation dashboard"""
-    
+def _build_evaluation_hierarchy() -> Dict:
+    """Build the hierarchy node tree for the UI"""
     # Build the hierarchy structure for the UI
     hierarchy_nodes = []
     
@@ -210,8 +218,7 @@ async def get_evaluation_hierarchy(_: str = Depends(verify_api_key)):
             for category in Category:
                 # Find sub-intents for this combination
                 matching_sub_intents = [
-                    sub_intent_id for sub_intent_id, sub_intent in CONSTRAINT_HIERARCHY["sub_intents"].items()
-                    if sub_intent.parent_category == category and sub_intent.parent_intent == intent
+                    sub_intent_id for sub_intent_id, _ in HIERARCHY_INDEX.sub_intents_for(category, intent)
                 ]
                 
                 # Category directly contains sub-intents
@@ -232,7 +239,7 @@ async def get_evaluation_hierarchy(_: str = Depends(verify_api_key)):
                     
                 # Individual sub-intents
                 for sub_intent_id in matching_sub_intents:
-                    sub_intent = CONSTRAINT_HIERARCHY["sub_intents"][sub_intent_id]
+                    sub_intent = HIERARCHY_INDEX.sub_intents[sub_intent_id]
                     hierarchy_nodes.append({
                         "id": f"{cohort.value}_{intent.value}_{category.value}_{sub_intent_id}",
                         "name": sub_intent.name,
@@ -271,11 +278,17 @@ async def get_evaluation_hierarchy(_: str = Depends(verify_api_key)):
         "metadata": {
             "generated_at": datetime.now().isoformat(),
             "version": "2.0",
+            "hierarchy_version": HIERARCHY_INDEX.version,
             "description": "Hierarchical constraint system for AI Health Coach evaluation"
         }
     }
 
 
+HIERARCHY_PAYLOAD = ETagPayload(
+    "evaluation hierarchy", _build_evaluation_hierarchy, lambda: HIERARCHY_INDEX.version
+)
+
+
 @router.get("/tools")
 async def get_available_tools(_: str = Depends(verify_api_key)):
     """Get available MCP tools for evaluation"""
@@ -1,20 +1,28 @@
 """
 Intent hierarchy endpoints
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from typing import List, Dict
 
-from app.core.hierarchy import (
-    IntentClass, Category, CONSTRAINT_HIERARCHY
-)
+from app.core.etag import ETagPayload
+from app.core.hierarchy import IntentClass, Category
+from app.core.hierarchy_index import HIERARCHY_INDEX
 from app.core.auth import verify_api_key
 
 router = APIRouter()
 
 
 @router.get("/", response_model=Dict)
-async def get_intent_hierarchy(_: str = Depends(verify_api_key)):
-    """Get the full intent hierarchy"""
+async def get_intent_hierarchy(
+    request: Request,
+    _: str = Depends(verify_api_key)
+):
+    """Get the full intent hierarchy, with ETag revalidation"""
+    return INTENT_HIERARCHY_PAYLOAD.response(request)
+
+
+def _build_intent_hierarchy() -> Dict:
+    """Build the intent hierarchy payload"""
     hierarchy = {
         "intent_classes": {
             intent.value: {
@@ -36,14 +44,14 @@ async def get_intent_hierarchy(_: str = Depends(verify_api_key)):
     }
     
     # Add sub-intents
-    for sub_intent_id, sub_intent in CONSTRAINT_HIERARCHY["sub_intents"].items():
+    for sub_intent_id, sub_intent in HIERARCHY_INDEX.sub_intents.items():
         hierarchy["sub_intents"][sub_intent_id] = {
             "id": sub_intent.id,
             "name": sub_intent.name,
             "description": sub_intent.description,
             "parent_category": sub_intent.parent_category.value,
             "parent_intent": sub_intent.parent_intent.value,
-            "constraints": [c.dict() for c in sub_intent.constraints],
+            "constraints": list(HIERARCHY_INDEX.serialize(HIERARCHY_INDEX.sub_intent_constraints[sub_intent_id])),
             "example_queries": sub_intent.example_queries,
             "excluded_patterns": sub_intent.excluded_patterns
         }
@@ -51,6 +59,11 @@ async def get_intent_hierarchy(_: str = Depends(verify_api_key)):
     return hierarchy
 
 
+INTENT_HIERARCHY_PAYLOAD = ETagPayload(
+    "intent hierarchy", _build_intent_hierarchy, lambda: HIERARCHY_INDEX.version
+)
+
+
 @router.get("/categories/{category}")
 async def get_category_sub_intents(
     category: str,
@@ -61,15 +74,14 @@ async def get_category_sub_intents(
         cat_enum = Category(category)
         sub_intents = []
         
-        for sub_intent_id, sub_intent in CONSTRAINT_HIERARCHY["sub_intents"].items():
-            if sub_intent.parent_category == cat_enum:
-                sub_intents.append({
-                    "id": sub_intent.id,
-                    "name": sub_intent.name,
-                    "description": sub_intent.description,
-                    "parent_intent": sub_intent.parent_intent.value,
-                    "example_queries": sub_intent.example_queries[:3]  # Limit examples
-                })
+        for sub_intent_id, sub_intent in HIERARCHY_INDEX.sub_intents_by_category[cat_enum]:
+            sub_intents.append({
+                "id": sub_intent.id,
+                "name": sub_intent.name,
+                "description": sub_intent.description,
+                "parent_intent": sub_intent.parent_intent.value,
+                "example_queries": sub_intent.example_queries[:3]  # Limit examples
+            })
         
         return {
             "category": category,
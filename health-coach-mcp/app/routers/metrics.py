@@ -0,0 +1,57 @@
+"""
+Prometheus metrics endpoint
+"""
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.core.auth import verify_api_key
+from app.services.container import ServiceContainer, get_services
+from app.services.metrics import COMPONENT_METRICS
+from app.services.model_tiers import MODEL_TIERS
+from app.services.prompt_templates import PROMPT_CACHE_STATS
+
+router = APIRouter()
+
+PREFIX = "health_coach"
+
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics(
+    _: str = Depends(verify_api_key),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Component latency, outcome and cache metrics in Prometheus text format"""
+    lines = COMPONENT_METRICS.prometheus(PREFIX)
+    
+    lines.append(f"# HELP {PREFIX}_streams_total Chat streams by outcome")
+    lines.append(f"# TYPE {PREFIX}_streams_total counter")
+    for outcome, count in services.stream_stats.items():
+        lines.append(f'{PREFIX}_streams_total{{outcome="{outcome}"}} {count}')
+    
+    lines.extend(MODEL_TIERS.prometheus(PREFIX))
+    lines.extend(PROMPT_CACHE_STATS.prometheus(PREFIX))
+    
+    if services.llm_governor:
+        lines.extend(services.llm_governor.prometheus(PREFIX))
+    
+    if services.admission:
+        lines.append(f"# HELP {PREFIX}_admission_in_flight Chat requests in flight by endpoint")
+        lines.append(f"# TYPE {PREFIX}_admission_in_flight gauge")
+        for endpoint, controller in services.admission.items():
+            lines.append(f'{PREFIX}_admission_in_flight{{endpoint="{endpoint}",mode="full"}} {controller.in_flight}')
+            lines.append(f'{PREFIX}_admission_in_flight{{endpoint="{endpoint}",mode="degraded"}} {controller.degraded_in_flight}')
+        lines.append(f"# HELP {PREFIX}_admission_requests_total Chat requests by admission outcome")
+        lines.append(f"# TYPE {PREFIX}_admission_requests_total counter")
+        for endpoint, controller in services.admission.items():
+            for outcome, count in controller.counters.items():
+                lines.append(f'{PREFIX}_admission_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}')
+    
+    if services.trace_archive:
+        lines.append(f"# HELP {PREFIX}_trace_archive_queue_depth Traces waiting to be archived")
+        lines.append(f"# TYPE {PREFIX}_trace_archive_queue_depth gauge")
+        lines.append(f"{PREFIX}_trace_archive_queue_depth {services.trace_archive.stats()['queue_depth']}")
+    
+    return PlainTextResponse(
+        "\n".join(lines) + "\n",
+        media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,120 @@
+"""
+Inbound admission control for the chat endpoints
+
+Each endpoint has its own controller with a cap on requests in flight and
+on the estimated wait for upstream LLM capacity. A request over either
+limit is rejected at once with 503 and Retry-After rather than queueing
+behind everyone else, or, when degrading is enabled, admitted on a cheaper
+path (routing without LLM calls and no context retrieval) up to a separate
+cap.
+"""
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(HTTPException):
+    """503 for a request turned away by admission control"""
+
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"{endpoint} is overloaded ({reason}), retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+class AdmissionTicket:
+    """An admitted request; release it when the response is finished"""
+
+    def __init__(self, controller: "AdmissionController", degraded: bool):
+        self.controller = controller
+        self.degraded = degraded
+        self.admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self) -> None:
+        """Free the request's slot; safe to call more than once"""
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """In-flight and queue-wait limits for one endpoint"""
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_in_flight: int,
+        max_queue_wait_ms: float = 0,
+        degrade_max_in_flight: int = 0,
+        wait_estimator: Optional[Callable[[], float]] = None
+    ):
+        self.endpoint = endpoint
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue_wait_ms = max_queue_wait_ms
+        self.degrade_max_in_flight = degrade_max_in_flight
+        self.wait_estimator = wait_estimator
+        self.in_flight = 0
+        self.degraded_in_flight = 0
+        # EWMA of how long admitted requests take, for Retry-After
+        self.avg_duration_ms = 0.0
+        self.counters = {
+            "admitted": 0,
+            "degraded": 0,
+            "rejected": 0
+        }
+
+    def estimated_wait_ms(self) -> float:
+        """Expected wait for upstream capacity if a request were admitted now"""
+        return self.wait_estimator() if self.wait_estimator else 0.0
+
+    def admit(self) -> AdmissionTicket:
+        """Admit a request, possibly degraded, or raise Overloaded"""
+        wait_ms = self.estimated_wait_ms()
+        if self.in_flight >= self.max_in_flight:
+            reason = f"{self.in_flight} requests in flight"
+        elif self.max_queue_wait_ms and wait_ms > self.max_queue_wait_ms:
+            reason = f"estimated queue wait {wait_ms:.0f}ms"
+        else:
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return AdmissionTicket(self, degraded=False)
+
+        if self.degraded_in_flight < self.degrade_max_in_flight:
+            self.degraded_in_flight += 1
+            self.counters["degraded"] += 1
+            return AdmissionTicket(self, degraded=True)
+
+        self.counters["rejected"] += 1
+        retry_after = max(1, math.ceil(max(wait_ms, self.avg_duration_ms) / 1000))
+        logger.warning(f"Rejecting {self.endpoint} request: {reason}")
+        raise Overloaded(self.endpoint, reason, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current load and counters"""
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "degraded_in_flight": self.degraded_in_flight,
+            "estimated_queue_wait_ms": round(self.estimated_wait_ms(), 1),
+            "avg_duration_ms": round(self.avg_duration_ms, 1)
+        }
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        if ticket.degraded:
+            self.degraded_in_flight -= 1
+            return
+        self.in_flight -= 1
+        duration_ms = (time.perf_counter() - ticket.admitted_at) * 1000
+        if self.avg_duration_ms:
+            self.avg_duration_ms += 0.1 * (duration_ms - self.avg_duration_ms)
+        else:
+            self.avg_duration_ms = duration_ms
@@ -0,0 +1,131 @@
+"""
+Batch routing for offline classification of large query sets
+"""
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.models.chat import RouteBatchItem, RoutingDecision
+from app.services.router import SemanticRouter
+from app.services.routing_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class BatchRouter:
+    """Route many (query, cohort) pairs through a bounded worker pool"""
+
+    def __init__(self, semantic_router: SemanticRouter, concurrency: int = 8):
+        self.semantic_router = semantic_router
+        self.concurrency = max(1, concurrency)
+        self._inflight: Dict[Tuple[str, str], "asyncio.Future[RoutingDecision]"] = {}
+
+    async def route_stream(
+        self,
+        items: AsyncIterator[Tuple[int, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Route items and yield one result per item in completion order.
+
+        Items are (index, payload) pairs where the payload is a RouteBatchItem
+        or a raw dict to validate. Identical queries for the same cohort that
+        are in flight at the same time share a single routing call; repeats
+        after that are served by the router's routing cache.
+        """
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for entry in items:
+                    await pending.put(entry)
+            finally:
+                for _ in range(self.concurrency):
+                    await pending.put(_DONE)
+
+        async def work():
+            while True:
+                entry = await pending.get()
+                if entry is _DONE:
+                    await results.put(_DONE)
+                    return
+                index, payload = entry
+                await results.put(await self._route_one(index, payload))
+
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        try:
+            finished = 0
+            while finished < self.concurrency:
+                result = await results.get()
+                if result is _DONE:
+                    finished += 1
+                    continue
+                yield result
+            await producer
+        finally:
+            for task in [producer, *workers]:
+                if not task.done():
+                    task.cancel()
+
+    async def _route_one(self, index: int, payload: Any) -> Dict[str, Any]:
+        """Route a single item, sharing in-flight work for duplicates"""
+        if not isinstance(payload, (RouteBatchItem, dict)):
+            return {"index": index, "error": "Invalid item: expected a JSON object"}
+        try:
+            item = payload if isinstance(payload, RouteBatchItem) else RouteBatchItem(**payload)
+        except ValidationError as e:
+            return {"index": index, "error": f"Invalid item: {str(e)}"}
+
+        key = (normalize_query(item.query), item.cohort.value)
+        future = self._inflight.get(key)
+        deduplicated = future is not None
+        if future is None:
+            future = asyncio.ensure_future(
+                self.semantic_router.route(query=item.query, user_cohort=item.cohort)
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        try:
+            decision = await asyncio.shield(future)
+        except Exception as e:
+            logger.error(f"Batch routing error for item {index}: {str(e)}")
+            return {"index": index, "id": item.id, "error": str(e)}
+
+        return {
+            "index": index,
+            "id": item.id,
+            "query": item.query,
+            "cohort": item.cohort.value,
+            "deduplicated": deduplicated,
+            "decision": decision.to_dict()
+        }
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Parse an NDJSON byte stream into (index, payload) pairs"""
+    buffer = b""
+    index = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, _parse_line(line)
+                index += 1
+    if buffer.strip():
+        yield index, _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> Optional[Any]:
+    """Decode one NDJSON line, leaving invalid lines for validation to reject"""
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
@@ -1,44 +1,80 @@
 """
 Health Coach service for generating constraint-based responses
 """
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List, AsyncGenerator
+import re
+import time
+from typing import Dict, Any, Optional, List, AsyncGenerator, Tuple
 from openai import AsyncOpenAI
 import httpx
 
 from app.core.config import settings
-from app.core.hierarchy import Cohort, CONSTRAINT_HIERARCHY
+from app.core.hierarchy import Cohort
 from app.models.chat import RoutingDecision
 from app.services.retrievers import (
     ProfileRetriever, BeliefRetriever, HealthDataRetriever
 )
+from app.services.context import ContextFetch
+from app.services.metrics import COMPONENT_METRICS
+from app.services.model_tiers import MODEL_TIERS
+from app.services.prompt_templates import PROMPT_CACHE_STATS, PROMPT_TEMPLATES, format_constraints
+from app.services.response_cache import ResponseCache
+from app.services.retriever_cache import RetrieverCache
 
 logger = logging.getLogger(__name__)
 
+# Words with their trailing whitespace, for replaying cached responses
+_REPLAY_PATTERN = re.compile(r"\s*\S+\s*")
+
 
 class HealthCoach:
     """Generate health coaching responses with constraints"""
     
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.OPENAI_MODEL
-        self.profile_retriever = ProfileRetriever()
-        self.belief_retriever = BeliefRetriever()
-        self.health_retriever = HealthDataRetriever()
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        retriever_cache: Optional[RetrieverCache] = None,
+        response_cache: Optional[ResponseCache] = None
+    ):
+        self.client = client or AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None
+        )
+        self.models = MODEL_TIERS
+        self.temperature = settings.GENERATION_TEMPERATURE
+        self.response_cache = response_cache
+        self.profile_retriever = ProfileRetriever(client=http_client, cache=retriever_cache)
+        self.belief_retriever = BeliefRetriever(client=http_client, cache=retriever_cache)
+        self.health_retriever = HealthDataRetriever(client=http_client, cache=retriever_cache)
         
     async def generate_response(
         self,
         query: str,
         routing_decision: RoutingDecision,
         user_cohort: Cohort,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        retrieval_context: Optional[Dict[str, Any]] = None
     ) -> str:
-        """Generate response based on routing decision and constraints"""
+        """
+        Generate response based on routing decision and constraints.
+        
+        Non-personalized responses are served from the response cache when
+        one is configured.
+        """
         try:
-            # Get relevant context from retrievers
-            retrieval_context = await self._gather_context(
-                routing_decision, user_cohort, context
+            # Get relevant context from retrievers unless already gathered
+            if retrieval_context is None:
+                retrieval_context, _ = await self.gather_context(
+                    routing_decision, user_cohort, context
+                )
+            
+            cache_key, cached = await self._lookup_response(
+                "generation", query, routing_decision, user_cohort, retrieval_context
             )
+            if cached is not None:
+                return cached
             
             # Build system prompt with constraints
             system_prompt = self._build_system_prompt(
@@ -51,17 +87,22 @@ class HealthCoach:
             )
             
             # Generate response
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=800
-            )
+            with COMPONENT_METRICS.timed("generation", "complete"):
+                response = await self.models.create(
+                    self.client,
+                    "generation",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=self.temperature
+                )
+            PROMPT_CACHE_STATS.record(system_prompt, getattr(response, "usage", None))
             
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if cache_key and content:
+                await self.response_cache.set(cache_key, content)
+            return content
             
         except Exception as e:
             logger.error(f"Response generation error: {str(e)}")
@@ -72,19 +113,45 @@ class HealthCoach:
         query: str,
         routing_decision: RoutingDecision,
         user_cohort: Cohort,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        retrieval_context: Optional[Dict[str, Any]] = None,
+        feedback: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
-        """Stream response generation in real-time"""
+        """
+        Stream response generation in real-time.
+        
+        feedback explains why a previous attempt was discarded and is added
+        to the system prompt when regenerating. Cached non-personalized
+        responses are replayed word by word, and responses streamed to
+        completion are cached.
+        """
+        start = None
+        stream = None
         try:
-            # Get relevant context from retrievers
-            retrieval_context = await self._gather_context(
-                routing_decision, user_cohort, context
+            # Get relevant context from retrievers unless already gathered
+            if retrieval_context is None:
+                retrieval_context, _ = await self.gather_context(
+                    routing_decision, user_cohort, context
+                )
+            
+            cache_key, cached = await self._lookup_response(
+                "stream_generation", query, routing_decision, user_cohort,
+                retrieval_context, feedback
             )
+            if cached is not None:
+                for piece in _REPLAY_PATTERN.findall(cached):
+                    yield piece
+                return
             
             # Build system prompt with constraints
             system_prompt = self._build_system_prompt(
                 routing_decision, user_cohort
             )
+            if feedback:
+                system_prompt += (
+                    f"\n\nA previous draft of this answer was discarded: {feedback}. "
+                    "Do not repeat that mistake."
+                )
             
             # Build user prompt with context
             user_prompt = self._build_user_prompt(
@@ -92,110 +159,127 @@ class HealthCoach:
             )
             
             # Generate streaming response
-            stream = await self.client.chat.completions.create(
-                model=self.model,
+            start = time.perf_counter()
+            stream = await self.models.create(
+                self.client,
+                "stream_generation",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                temperature=0.7,
-                max_tokens=800,
-                stream=True
+                temperature=self.temperature,
+                stream=True,
+                # Usage, including cached prompt tokens, arrives in a final chunk
+                extra_body={"stream_options": {"include_usage": True}}
             )
             
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+            first_token = True
+            failed = False
+            usage = None
+            parts = []
+            try:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token:
+                            first_token = False
+                            COMPONENT_METRICS.record(
+                                "generation", "first_token", (time.perf_counter() - start) * 1000
+                            )
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # Closing the HTTP response stops generation upstream; shielded
+                # so it completes even when the consumer is being cancelled
+                await asyncio.shield(stream.close())
+                PROMPT_CACHE_STATS.record(system_prompt, usage)
+                COMPONENT_METRICS.record(
+                    "generation", "stream", (time.perf_counter() - start) * 1000,
+                    success=not failed
+                )
+            
+            # Only reached when the stream ran to completion
+            if cache_key and parts:
+                await self.response_cache.set(cache_key, "".join(parts))
                     
         except Exception as e:
             logger.error(f"Streaming response generation error: {str(e)}")
+            if stream is None and start is not None:
+                # The request itself failed; failures mid-stream are already recorded
+                COMPONENT_METRICS.record(
+                    "generation", "stream", (time.perf_counter() - start) * 1000, success=False
+                )
             # Fallback to non-streaming response
             fallback = self._get_fallback_response(routing_decision)
             for word in fallback.split():
                 yield word + " "
     
-    async def _gather_context(
+    async def _lookup_response(
         self,
+        stage: str,
+        query: str,
         routing_decision: RoutingDecision,
         user_cohort: Cohort,
-        context: Optional[Dict[str, Any]] = None
-    ) -> Dict[str, Any]:
-        """Gather relevant context from various sources"""
-        gathered_context = {}
-        
-        # Get user profile if available
-        if context and context.get("user_id"):
-            profile = await self.profile_retriever.get_user_profile(
-                context["user_id"]
-            )
-            if profile:
-                gathered_context["user_profile"] = profile
+        retrieval_context: Dict[str, Any],
+        feedback: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Response cache key and cached response for a generation.
         
-        # Get relevant beliefs based on category
-        if context and context.get("user_id"):
-            beliefs = await self.belief_retriever.get_relevant_beliefs(
-                user_id=context["user_id"],
-                category=routing_decision.category
-            )
-            if beliefs:
-                gathered_context["user_beliefs"] = beliefs
-        
-        # Get health data for certain intents
-        if (routing_decision.intent_class.value in ["plan", "task"] and 
-            context and context.get("user_id")):
-            health_data = await self.health_retriever.get_recent_data(
-                user_id=context["user_id"],
-                category=routing_decision.category
-            )
-            if health_data:
-                gathered_context["health_data"] = health_data
+        The key is None when there is no cache or the generation bypasses it.
+        """
+        if not self.response_cache or self.response_cache.bypass(
+            retrieval_context, self.temperature, feedback
+        ):
+            return None, None
+        key = self.response_cache.make_key(
+            query, routing_decision, user_cohort, retrieval_context, self.models.select(stage)
+        )
+        cached = await self.response_cache.get(key)
+        COMPONENT_METRICS.record_cache(
+            "generation", "complete" if stage == "generation" else "stream", cached is not None
+        )
+        return key, cached
+    
+    def start_context_fetch(
+        self,
+        context: Optional[Dict[str, Any]] = None
+    ) -> ContextFetch:
+        """Create a context fan-out for a request"""
+        return ContextFetch(
+            self.profile_retriever,
+            self.belief_retriever,
+            self.health_retriever,
+            user_id=(context or {}).get("user_id")
+        )
+    
+    async def gather_context(
+        self,
+        routing_decision: RoutingDecision,
+        user_cohort: Cohort,
+        context: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Gather relevant context from all sources concurrently.
         
-        return gathered_context
+        Returns the gathered context and the status of each source
+        (included, empty, skipped, timed_out or failed).
+        """
+        fetch = self.start_context_fetch(context)
+        fetch.start_decision(routing_decision)
+        return await fetch.collect()
     
     def _build_system_prompt(
         self,
         routing_decision: RoutingDecision,
         user_cohort: Cohort
     ) -> str:
-        """Build system prompt with constraints"""
-        # Get cohort info
-        cohort_data = CONSTRAINT_HIERARCHY["cohorts"][user_cohort]
-        
-        # Get sub-intent info if available
-        sub_intent_info = ""
-        if routing_decision.sub_intent_id:
-            sub_intent = CONSTRAINT_HIERARCHY["sub_intents"].get(
-                routing_decision.sub_intent_id
-            )
-            if sub_intent:
-                sub_intent_info = f"""
-                
-Specific Focus: {sub_intent.name}
-Description: {sub_intent.description}
-                """
-        
-        # Format constraints
-        constraint_text = self._format_constraints(routing_decision.constraints)
-        
-        prompt = f"""You are a health coach specializing in {routing_decision.category.value} 
-for a {user_cohort.value} user ({cohort_data['description']}).
-
-Intent Type: {routing_decision.intent_class.value}
-{sub_intent_info}
-
-CONSTRAINTS YOU MUST FOLLOW:
-{constraint_text}
-
-Guidelines:
-- Stay within the scope of the identified intent
-- Use language appropriate for the user's cohort level
-- Be specific and actionable when possible
-- If the query is outside your constraints, politely redirect
-
-Remember: You are focused on {routing_decision.category.value} and the 
-{routing_decision.intent_class.value} intent type."""
-        
-        return prompt
+        """Precompiled system prompt for the route"""
+        return PROMPT_TEMPLATES.system_prompt(routing_decision, user_cohort)
     
     def _build_user_prompt(
         self,
@@ -225,20 +309,6 @@ Remember: You are focused on {routing_decision.category.value} and the
         
         return "\n".join(prompt_parts)
     
-    def _format_constraints(self, constraints: List) -> str:
-        """Format constraints for the prompt"""
-        if not constraints:
-            return "- No specific constraints"
-            
-        formatted = []
-        for constraint in constraints:
-            severity_marker = "!" if constraint.severity == "high" else ""
-            formatted.append(
-                f"- [{constraint.type.value}] {constraint.description} {severity_marker}"
-            )
-            
-        return "\n".join(formatted)
-    
     async def _generate_response(
         self,
         query: str,
@@ -249,7 +319,7 @@ Remember: You are focused on {routing_decision.category.value} and the
         """Generate response with specific constraints (for component testing)"""
         try:
             # Build a simplified system prompt with just the constraints
-            constraint_text = self._format_constraints(constraints)
+            constraint_text = format_constraints(constraints)
             
             system_prompt = f"""You are a health coach providing evidence-based advice.
 
@@ -275,8 +345,9 @@ Guidelines:
                     user_prompt += f"\nHealth Data: {context['health_data']}"
             
             # Generate response
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            response = await self.models.create(
+                self.client,
+                "generation",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
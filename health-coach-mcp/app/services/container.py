@@ -0,0 +1,233 @@
+"""
+App-scoped service container
+
+Creates the OpenAI client, the shared HTTP client used by the retrievers and
+the Redis connection pool once per process, and closes them on shutdown.
+The trace archive worker is started here too and drained before Redis
+closes. Router and coach share one LLM governor, each in its own lane, and
+the chat endpoints admit requests through per-endpoint admission control.
+"""
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Dict, Optional, Set
+
+import httpx
+import redis.asyncio as redis
+from fastapi import Request
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.evaluation.constraint_engine import evaluate_batch
+from app.services.admission import AdmissionController, AdmissionTicket
+from app.services.coach import HealthCoach
+from app.services.database import AsyncSessionLocal
+from app.services.llm_governor import GovernedClient, LLMGovernor
+from app.services.pre_router import get_pre_router
+from app.services.response_cache import ResponseCache
+from app.services.retriever_cache import RetrieverCache
+from app.services.router import SemanticRouter
+from app.services.routing_cache import RoutingCache
+from app.services.storage import ConversationStorage
+from app.services.trace_archive import TraceArchive
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package"""
+    return settings.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+class ServiceContainer:
+    """Long-lived services and connection pools shared across requests"""
+
+    def __init__(self):
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.openai_client: Optional[AsyncOpenAI] = None
+        self.llm_governor: Optional[LLMGovernor] = None
+        self.admission: Dict[str, AdmissionController] = {}
+        self.redis: Optional[redis.Redis] = None
+        self.routing_cache: Optional[RoutingCache] = None
+        self.retriever_cache: Optional[RetrieverCache] = None
+        self.response_cache: Optional[ResponseCache] = None
+        self.router: Optional[SemanticRouter] = None
+        self.coach: Optional[HealthCoach] = None
+        self.storage: Optional[ConversationStorage] = None
+        self.trace_archive: Optional[TraceArchive] = None
+        self.evaluation_pool: Optional[ProcessPoolExecutor] = None
+        self.stream_stats = {
+            "started": 0,
+            "completed": 0,
+            "aborted": 0,
+            "failed": 0,
+            "regenerated": 0
+        }
+        self._background: Set[asyncio.Task] = set()
+
+    async def startup(self) -> None:
+        """Create clients, pools and services"""
+        http2 = _http2_available()
+
+        self.http_client = httpx.AsyncClient(
+            timeout=settings.HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            http2=http2
+        )
+
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            # The governor retries itself so that it sees every 429
+            max_retries=0 if settings.LLM_GOVERNOR_ENABLED else 2,
+            http_client=httpx.AsyncClient(
+                timeout=settings.OPENAI_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS
+                ),
+                http2=http2
+            )
+        )
+
+        self.redis = redis.Redis(
+            connection_pool=redis.ConnectionPool.from_url(
+                settings.REDIS_URL,
+                max_connections=settings.REDIS_MAX_CONNECTIONS
+            )
+        )
+
+        if settings.ROUTING_CACHE_ENABLED:
+            self.routing_cache = RoutingCache(
+                max_entries=settings.ROUTING_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.ROUTING_CACHE_TTL_SECONDS,
+                redis_client=self.redis if settings.ROUTING_CACHE_REDIS_ENABLED else None
+            )
+
+        if settings.CONTEXT_CACHE_ENABLED:
+            self.retriever_cache = RetrieverCache(
+                ttl_seconds={
+                    "user_profile": settings.CONTEXT_CACHE_PROFILE_TTL_SECONDS,
+                    "user_beliefs": settings.CONTEXT_CACHE_BELIEFS_TTL_SECONDS,
+                    "health_data": settings.CONTEXT_CACHE_HEALTH_DATA_TTL_SECONDS
+                },
+                stale_seconds=settings.CONTEXT_CACHE_STALE_SECONDS,
+                max_entries=settings.CONTEXT_CACHE_MAX_ENTRIES
+            )
+
+        if settings.RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+                ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                max_temperature=settings.RESPONSE_CACHE_MAX_TEMPERATURE,
+                redis_client=self.redis if settings.RESPONSE_CACHE_REDIS_ENABLED else None
+            )
+        
+        routing_client = generation_client = self.openai_client
+        if settings.LLM_GOVERNOR_ENABLED:
+            self.llm_governor = LLMGovernor(
+                requests_per_minute=settings.LLM_RPM_LIMIT,
+                tokens_per_minute=settings.LLM_TPM_LIMIT,
+                initial_concurrency=settings.LLM_CONCURRENCY_INITIAL,
+                min_concurrency=settings.LLM_CONCURRENCY_MIN,
+                max_concurrency=settings.LLM_CONCURRENCY_MAX,
+                latency_tolerance=settings.LLM_LATENCY_TOLERANCE,
+                max_retries=settings.LLM_MAX_RETRIES
+            )
+            routing_client = GovernedClient(self.openai_client, self.llm_governor, "routing")
+            generation_client = GovernedClient(self.openai_client, self.llm_governor, "generation")
+        
+        if settings.ADMISSION_CONTROL_ENABLED:
+            for endpoint, max_in_flight in (
+                ("chat", settings.CHAT_MAX_IN_FLIGHT),
+                ("stream", settings.STREAM_MAX_IN_FLIGHT)
+            ):
+                self.admission[endpoint] = AdmissionController(
+                    endpoint,
+                    max_in_flight=max_in_flight,
+                    max_queue_wait_ms=settings.ADMISSION_MAX_QUEUE_WAIT_MS,
+                    degrade_max_in_flight=(
+                        settings.ADMISSION_DEGRADE_MAX_IN_FLIGHT
+                        if settings.ADMISSION_DEGRADE_ENABLED else 0
+                    ),
+                    wait_estimator=self.llm_governor.estimated_wait_ms if self.llm_governor else None
+                )
+        
+        self.router = SemanticRouter(
+            pre_router=get_pre_router() if settings.PRE_ROUTER_ENABLED else None,
+            cache=self.routing_cache,
+            client=routing_client
+        )
+        self.coach = HealthCoach(
+            client=generation_client,
+            http_client=self.http_client,
+            retriever_cache=self.retriever_cache,
+            response_cache=self.response_cache
+        )
+        if settings.TRACE_ARCHIVE_ENABLED:
+            self.trace_archive = TraceArchive(
+                AsyncSessionLocal,
+                max_queue=settings.TRACE_ARCHIVE_QUEUE_SIZE,
+                batch_size=settings.TRACE_ARCHIVE_BATCH_SIZE,
+                flush_interval_seconds=settings.TRACE_ARCHIVE_FLUSH_INTERVAL_SECONDS,
+                max_attempts=settings.TRACE_ARCHIVE_MAX_ATTEMPTS
+            )
+        self.storage = ConversationStorage(redis_client=self.redis, archive=self.trace_archive)
+        if self.trace_archive:
+            self.trace_archive.start(self.storage.load_for_archive)
+
+        if settings.EVALUATION_WORKERS > 0:
+            # Spawned rather than forked: the event loop and pools are already running
+            self.evaluation_pool = ProcessPoolExecutor(
+                max_workers=settings.EVALUATION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            # Start the workers now rather than on the first bulk request
+            for _ in range(settings.EVALUATION_WORKERS):
+                self.evaluation_pool.submit(evaluate_batch, [])
+
+        logger.info(f"Service container started (HTTP/2: {http2})")
+
+    def admit(self, endpoint: str) -> Optional[AdmissionTicket]:
+        """Admit a request to an endpoint, raising Overloaded beyond its limits"""
+        controller = self.admission.get(endpoint)
+        return controller.admit() if controller else None
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        """Run work that must outlive the request, such as cleanup after a disconnect"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+    
+    async def shutdown(self) -> None:
+        """Close pooled connections"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self.retriever_cache:
+            await self.retriever_cache.close()
+        if self.evaluation_pool:
+            self.evaluation_pool.shutdown(wait=False, cancel_futures=True)
+        if self.trace_archive:
+            # Flushing reads from Redis, so this runs before the pool closes
+            await self.trace_archive.stop()
+        if self.openai_client:
+            await self.openai_client.close()
+        if self.http_client:
+            await self.http_client.aclose()
+        if self.redis:
+            await self.redis.aclose(close_connection_pool=True)
+        logger.info("Service container stopped")
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """FastAPI dependency returning the app's service container"""
+    return request.app.state.services
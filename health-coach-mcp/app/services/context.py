@@ -0,0 +1,173 @@
+"""
+Concurrent context retrieval with per-source deadlines
+
+Each retriever runs as its own task with its own deadline, and collection
+waits at most for the overall latency budget, counted from when the routing
+decision is known. Whatever has not arrived by then is cancelled and the
+response goes ahead with partial context.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.hierarchy import Category
+from app.models.chat import RoutingDecision
+from app.services.retrievers import (
+    ProfileRetriever, BeliefRetriever, HealthDataRetriever
+)
+
+logger = logging.getLogger(__name__)
+
+# Source status values recorded in provenance
+INCLUDED = "included"
+EMPTY = "empty"
+SKIPPED = "skipped"
+TIMED_OUT = "timed_out"
+FAILED = "failed"
+
+CONTEXT_SOURCES = ("user_profile", "user_beliefs", "health_data")
+
+
+class ContextFetch:
+    """
+    Fan-out of context retrieval for a single request.
+
+    Sources can be started as soon as their inputs are known: the profile at
+    request entry, beliefs once the category is known and health data once
+    the intent is known. collect() then joins whatever is running.
+    """
+
+    def __init__(
+        self,
+        profile_retriever: ProfileRetriever,
+        belief_retriever: BeliefRetriever,
+        health_retriever: HealthDataRetriever,
+        user_id: Optional[str],
+        budget_ms: Optional[int] = None
+    ):
+        self.profile_retriever = profile_retriever
+        self.belief_retriever = belief_retriever
+        self.health_retriever = health_retriever
+        self.user_id = user_id
+        self.budget_ms = budget_ms if budget_ms is not None else settings.CONTEXT_BUDGET_MS
+        # Restarted by start_decision, so slow routing does not eat the budget
+        self.started_at = time.perf_counter()
+        self.deadlines_ms = {
+            "user_profile": settings.CONTEXT_PROFILE_DEADLINE_MS,
+            "user_beliefs": settings.CONTEXT_BELIEFS_DEADLINE_MS,
+            "health_data": settings.CONTEXT_HEALTH_DATA_DEADLINE_MS
+        }
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._status: Dict[str, str] = {}
+        self._durations: Dict[str, float] = {}
+
+    def start_profile(self) -> None:
+        """Start profile retrieval; it depends only on the user"""
+        if not self.user_id:
+            self._status["user_profile"] = SKIPPED
+            return
+        self._start(
+            "user_profile",
+            self.profile_retriever.get_user_profile(self.user_id)
+        )
+
+    def start_category(self, category: Category) -> None:
+        """Start retrieval that depends on the category"""
+        if not self.user_id:
+            self._status["user_beliefs"] = SKIPPED
+            return
+        self._start(
+            "user_beliefs",
+            self.belief_retriever.get_relevant_beliefs(
+                user_id=self.user_id,
+                category=category
+            )
+        )
+
+    def start_decision(self, routing_decision: RoutingDecision) -> None:
+        """Start retrieval that depends on the full routing decision"""
+        self.started_at = time.perf_counter()
+        if "user_profile" not in self._tasks and "user_profile" not in self._status:
+            self.start_profile()
+        if "user_beliefs" not in self._tasks and "user_beliefs" not in self._status:
+            self.start_category(routing_decision.category)
+
+        # Health data is only relevant for planning and task intents
+        if not self.user_id or routing_decision.intent_class.value not in ["plan", "task"]:
+            self._status["health_data"] = SKIPPED
+            return
+        self._start(
+            "health_data",
+            self.health_retriever.get_recent_data(
+                user_id=self.user_id,
+                category=routing_decision.category
+            )
+        )
+
+    async def collect(self) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Wait for started sources within the overall budget.
+
+        Returns the gathered context and a status per source.
+        """
+        gathered_context: Dict[str, Any] = {}
+        status = dict(self._status)
+
+        if self._tasks:
+            elapsed = time.perf_counter() - self.started_at
+            remaining = max(0.0, self.budget_ms / 1000 - elapsed)
+            done, pending = await asyncio.wait(self._tasks.values(), timeout=remaining)
+            for task in pending:
+                task.cancel()
+
+            for source, task in self._tasks.items():
+                if task in pending:
+                    status[source] = TIMED_OUT
+                    continue
+                try:
+                    result = task.result()
+                except asyncio.TimeoutError:
+                    status[source] = TIMED_OUT
+                    continue
+                except Exception as e:
+                    logger.error(f"Context source {source} failed: {str(e)}")
+                    status[source] = FAILED
+                    continue
+                if result:
+                    gathered_context[source] = result
+                    status[source] = INCLUDED
+                else:
+                    status[source] = EMPTY
+
+        status = {source: status.get(source, SKIPPED) for source in CONTEXT_SOURCES}
+
+        timed_out = [s for s, v in status.items() if v == TIMED_OUT]
+        if timed_out:
+            logger.warning(f"Context sources timed out: {', '.join(timed_out)}")
+
+        return gathered_context, status
+
+    def durations_ms(self) -> Dict[str, float]:
+        """How long each finished source took, in milliseconds"""
+        return dict(self._durations)
+
+    def cancel(self) -> None:
+        """Cancel any retrieval still running"""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    def _start(self, source: str, coro: Awaitable) -> None:
+        """Run a source under its own deadline"""
+        started_at = time.perf_counter()
+
+        def record(_):
+            self._durations[source] = round((time.perf_counter() - started_at) * 1000, 1)
+
+        task = asyncio.create_task(
+            asyncio.wait_for(coro, timeout=self.deadlines_ms[source] / 1000)
+        )
+        task.add_done_callback(record)
+        self._tasks[source] = task
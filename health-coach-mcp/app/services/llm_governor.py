@@ -0,0 +1,375 @@
+"""
+Outbound governor for OpenAI calls
+
+Every chat completion goes through one governor per process, which:
+
+- paces requests and tokens with requests-per-minute and tokens-per-minute
+  token buckets, charging each call its estimated prompt tokens plus
+  max_tokens as the OpenAI rate limiter does;
+- bounds concurrent calls with an AIMD limit: the limit grows by one per
+  window of successful calls and is cut on 429s and on latency well above
+  the lane's baseline;
+- queues callers in priority lanes, so routing calls are dispatched before
+  generation calls and batch routing goes last;
+- retries 429s, 5xx responses and connection errors itself, honouring
+  Retry-After, so that every 429 reaches the concurrency limit.
+
+Services keep calling client.chat.completions.create(); GovernedClient
+routes those calls through the governor in the service's lane.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from app.services.metrics import COMPONENT_METRICS
+
+logger = logging.getLogger(__name__)
+
+# Lower values are dispatched first
+LANES = {"routing": 0, "generation": 1, "batch": 2}
+
+# Lane override for the current request, e.g. batch routing reusing the router
+_lane: ContextVar[Optional[str]] = ContextVar("llm_lane", default=None)
+
+
+def bind_llm_lane(lane: str) -> None:
+    """Send LLM calls made by the current request through another lane"""
+    if lane not in LANES:
+        raise ValueError(f"Unknown LLM lane: {lane}")
+    _lane.set(lane)
+
+
+def estimate_tokens(request: Dict[str, Any]) -> int:
+    """Tokens a request counts against the TPM limit: prompt estimate plus max_tokens"""
+    chars = sum(len(str(message.get("content") or "")) for message in request.get("messages", []))
+    chars += len(str(request.get("tools") or ""))
+    return chars // 4 + int(request.get("max_tokens") or 0)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header, if the error carries one"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most one minute's worth"""
+
+    def __init__(self, rate_per_minute: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until amount can be taken; requests above capacity wait for a full bucket"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("lane", "tokens", "future", "queued_at")
+
+    def __init__(self, lane: str, tokens: int):
+        self.lane = lane
+        self.tokens = tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+
+class LLMGovernor:
+    """Rate limits, adaptive concurrency and priority lanes for outbound LLM calls"""
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        initial_concurrency: int = 16,
+        min_concurrency: int = 2,
+        max_concurrency: int = 64,
+        latency_tolerance: float = 2.0,
+        max_retries: int = 2
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.latency_tolerance = latency_tolerance
+        self.max_retries = max_retries
+        self.in_flight = 0
+
+        self._queue: List[Any] = []
+        self._order = itertools.count()
+        self._queued = {lane: 0 for lane in LANES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # No dispatch before this monotonic time, set from Retry-After
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        # Per-lane latency EWMAs: slow-moving baseline and recent
+        self._baseline: Dict[str, float] = {}
+        self._recent: Dict[str, float] = {}
+        self.counters = {
+            "calls": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "latency_backoffs": 0
+        }
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """Limit, queue depth per lane and counters"""
+        return {
+            **self.counters,
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self.in_flight,
+            "queued": dict(self._queued),
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "baseline_latency_ms": {lane: round(ms, 1) for lane, ms in self._baseline.items()}
+        }
+
+    def estimated_wait_ms(self) -> float:
+        """Expected wait for a new call: the queue ahead of it spread over the limit"""
+        pause_ms = max(0.0, self._paused_until - time.monotonic()) * 1000
+        queued = sum(self._queued.values())
+        if not queued or not self._baseline:
+            return pause_ms
+        latency_ms = sum(self._baseline.values()) / len(self._baseline)
+        return pause_ms + queued * latency_ms / self.concurrency_limit
+
+    async def create(self, client: Any, lane: str, **request: Any) -> Any:
+        """Make a chat completion call through the governor, retrying transient errors"""
+        response, _ = await self.create_timed(client, lane, **request)
+        return response
+
+    async def create_timed(self, client: Any, lane: str, **request: Any) -> Tuple[Any, float]:
+        """
+        create(), also returning the upstream latency in milliseconds.
+        
+        The latency is that of the successful attempt alone, without queueing,
+        pauses or earlier attempts; streams are timed until they open.
+        """
+        lane = _lane.get() or lane
+        tokens = estimate_tokens(request)
+        attempt = 0
+        while True:
+            await self._acquire(lane, tokens)
+            start = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(**request)
+            except RateLimitError as e:
+                self._release()
+                self._on_rate_limited(_retry_after(e) or min(2.0 ** attempt, 30.0))
+                error = e
+            except (InternalServerError, APIConnectionError) as e:
+                self._release()
+                if isinstance(e, APITimeoutError):
+                    raise
+                error = e
+            except BaseException:
+                self._release()
+                raise
+            else:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self._on_success(lane, elapsed_ms)
+                if request.get("stream"):
+                    # The slot is held until the stream is consumed or closed
+                    return _GovernedStream(response, self._release), elapsed_ms
+                self._release()
+                return response, elapsed_ms
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            self.counters["retries"] += 1
+            logger.warning(f"Retrying {lane} LLM call after {type(error).__name__} (attempt {attempt})")
+            if not isinstance(error, RateLimitError):
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 8.0))
+
+    async def _acquire(self, lane: str, tokens: int) -> None:
+        """Wait for a concurrency slot and rate budget in the lane's priority order"""
+        waiter = _Waiter(lane, tokens)
+        heapq.heappush(self._queue, (LANES[lane], next(self._order), waiter))
+        self._queued[lane] += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller gave up
+                self._release()
+            else:
+                remaining = [entry for entry in self._queue if entry[2] is not waiter]
+                if len(remaining) < len(self._queue):
+                    self._queue = remaining
+                    heapq.heapify(self._queue)
+                    self._queued[lane] -= 1
+                # The head may have been the one holding up the queue
+                self._dispatch()
+            raise
+        COMPONENT_METRICS.record(
+            "llm_governor", f"wait_{lane}", (time.perf_counter() - waiter.queued_at) * 1000
+        )
+
+    def _dispatch(self) -> None:
+        """Grant slots to waiting callers, highest priority first"""
+        while self._queue and self.in_flight < self.concurrency_limit:
+            waiter = self._queue[0][2]
+            if waiter.future.done():
+                # Cancelled while waiting
+                heapq.heappop(self._queue)
+                self._queued[waiter.lane] -= 1
+                continue
+            delay = max(
+                self._paused_until - time.monotonic(),
+                self.requests.delay(1),
+                self.tokens.delay(waiter.tokens)
+            )
+            if delay > 0:
+                self._schedule(delay)
+                return
+            heapq.heappop(self._queue)
+            self._queued[waiter.lane] -= 1
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            self.counters["calls"] += 1
+            waiter.future.set_result(None)
+
+    def _schedule(self, delay: float) -> None:
+        """Dispatch again once the rate budget has refilled"""
+        loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            if self._timer.when() <= loop.time() + delay:
+                return
+            self._timer.cancel()
+
+        def fire():
+            self._timer = None
+            self._dispatch()
+        self._timer = loop.call_later(delay, fire)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _on_success(self, lane: str, elapsed_ms: float) -> None:
+        """Additive increase, or a decrease when recent latency far exceeds the baseline"""
+        baseline = self._baseline.get(lane)
+        if baseline is None:
+            self._baseline[lane] = self._recent[lane] = elapsed_ms
+            return
+        self._baseline[lane] = baseline + 0.02 * (elapsed_ms - baseline)
+        recent = self._recent[lane] = self._recent[lane] + 0.2 * (elapsed_ms - self._recent[lane])
+        if recent > baseline * self.latency_tolerance:
+            if self._decrease(0.9):
+                self.counters["latency_backoffs"] += 1
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def _on_rate_limited(self, retry_after: float) -> None:
+        """Halve the limit and pause dispatch for the Retry-After period"""
+        self.counters["rate_limited"] += 1
+        self._decrease(0.5)
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def _decrease(self, factor: float) -> bool:
+        """Multiplicative decrease, at most once per second so a burst counts once"""
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return False
+        self._last_decrease = now
+        previous = self.concurrency_limit
+        self.limit = max(float(self.min_concurrency), self.limit * factor)
+        if self.concurrency_limit != previous:
+            logger.warning(f"LLM concurrency limit lowered from {previous} to {self.concurrency_limit}")
+        return True
+
+    def prometheus(self, prefix: str = "health_coach") -> List[str]:
+        """Prometheus text exposition lines for the limit, in-flight calls and queues"""
+        lines = [
+            f"# TYPE {prefix}_llm_concurrency_limit gauge",
+            f"{prefix}_llm_concurrency_limit {self.concurrency_limit}",
+            f"# TYPE {prefix}_llm_in_flight gauge",
+            f"{prefix}_llm_in_flight {self.in_flight}",
+            f"# TYPE {prefix}_llm_queue_depth gauge"
+        ]
+        lines.extend(f'{prefix}_llm_queue_depth{{lane="{lane}"}} {depth}' for lane, depth in self._queued.items())
+        lines.append(f"# TYPE {prefix}_llm_rate_limited_total counter")
+        lines.append(f"{prefix}_llm_rate_limited_total {self.counters['rate_limited']}")
+        return lines
+
+
+class _GovernedStream:
+    """Chat completion stream that frees its governor slot when done"""
+
+    def __init__(self, stream: Any, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def _done(self) -> None:
+        if not self._released:
+            self._released = True
+            self._release()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._done()
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            self._done()
+
+
+class GovernedClient:
+    """Stand-in for an OpenAI client whose chat completions use one governor lane"""
+
+    def __init__(self, client: Any, governor: LLMGovernor, lane: str):
+        self.client = client
+        self.governor = governor
+        self.lane = lane
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request: Any) -> Any:
+        return await self.governor.create(self.client, self.lane, **request)
+
+    async def create_timed(self, **request: Any) -> Tuple[Any, float]:
+        """Chat completion with its upstream latency, excluding time in the governor"""
+        return await self.governor.create_timed(self.client, self.lane, **request)
@@ -0,0 +1,295 @@
+"""
+In-process latency histograms and counters per component
+
+Every router stage, retriever call and generation call records its latency
+into a log-linear histogram (HDR-style: 32 linear sub-buckets per power of
+two, so any recorded value is within about 3% of its bucket midpoint) with
+success/failure and cache hit/miss counters. Series are kept per component,
+stage, cohort and sub-intent; the cohort and sub-intent come from labels
+bound to the current request, so deeply nested calls need not pass them.
+Recording is a dict update with no locking, which is safe on the event loop.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Values below 2**_SUB_BITS microseconds get exact buckets
+_SUB_BITS = 6
+_HALF = 1 << (_SUB_BITS - 1)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+UNLABELED = "unknown"
+
+# Labels of the request being served; a dict so that values bound after
+# background tasks start (such as the sub-intent) are still seen by them
+_labels: ContextVar[Optional[Dict[str, str]]] = ContextVar("metric_labels", default=None)
+
+SeriesKey = Tuple[str, str, str, str]
+
+
+def bind_metric_labels(**labels: str) -> Dict[str, str]:
+    """Bind labels for metrics recorded by the current request"""
+    bound = {"cohort": UNLABELED, "sub_intent": UNLABELED, **labels}
+    _labels.set(bound)
+    return bound
+
+
+def _bucket(micros: int) -> int:
+    """Histogram bucket index for a value in microseconds"""
+    if micros < 2 * _HALF:
+        return micros
+    shift = micros.bit_length() - _SUB_BITS
+    return shift * _HALF + (micros >> shift)
+
+
+def _bucket_value(index: int) -> float:
+    """Midpoint of a bucket, in microseconds"""
+    if index < 2 * _HALF:
+        return float(index)
+    shift = index // _HALF - 1
+    lower = (index - shift * _HALF) << shift
+    return lower + (1 << shift) / 2
+
+
+class LatencyHistogram:
+    """Sparse log-linear latency histogram"""
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float) -> None:
+        """Add one observation"""
+        index = _bucket(max(0, int(elapsed_ms * 1000)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Add another histogram's observations to this one"""
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentiles(self, quantiles: Iterable[float] = QUANTILES) -> Dict[float, Optional[float]]:
+        """Latency in milliseconds at each quantile, from one pass over the buckets"""
+        quantiles = sorted(quantiles)
+        if not self.count:
+            return {q: None for q in quantiles}
+        results = {}
+        pending = iter(quantiles)
+        quantile = next(pending)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            while quantile is not None and seen >= quantile * self.count:
+                results[quantile] = round(min(_bucket_value(index) / 1000, self.max_ms), 2)
+                quantile = next(pending, None)
+            if quantile is None:
+                break
+        for quantile in quantiles:
+            results.setdefault(quantile, round(self.max_ms, 2))
+        return results
+
+
+class ComponentSeries:
+    """Latency and outcome counters for one component stage and label set"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.success = 0
+        self.failure = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def merge(self, other: "ComponentSeries") -> None:
+        """Add another series' counts to this one"""
+        self.latency.merge(other.latency)
+        self.success += other.success
+        self.failure += other.failure
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts, rates and latency percentiles"""
+        calls = self.success + self.failure
+        lookups = self.cache_hits + self.cache_misses
+        p50, p95, p99 = (self.latency.percentiles()[q] for q in QUANTILES)
+        return {
+            "count": calls,
+            "success_rate": round(self.success / calls, 4) if calls else None,
+            "cache_hit_rate": round(self.cache_hits / lookups, 4) if lookups else None,
+            "avg_latency_ms": round(self.latency.total_ms / self.latency.count, 2) if self.latency.count else None,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "max_ms": round(self.latency.max_ms, 2) if self.latency.count else None
+        }
+
+
+class _Call:
+    """Outcome of a timed call; set success False to record a failure"""
+
+    def __init__(self):
+        self.success = True
+        self.cache_hit: Optional[bool] = None
+
+
+class ComponentMetrics:
+    """Registry of component series"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.series: Dict[SeriesKey, ComponentSeries] = {}
+
+    def _series(
+        self,
+        component: str,
+        stage: str,
+        cohort: Optional[str],
+        sub_intent: Optional[str]
+    ) -> ComponentSeries:
+        bound = _labels.get() or {}
+        key = (
+            component,
+            stage,
+            cohort or bound.get("cohort", UNLABELED),
+            sub_intent or bound.get("sub_intent", UNLABELED)
+        )
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = ComponentSeries()
+        return series
+
+    def record(
+        self,
+        component: str,
+        stage: str,
+        elapsed_ms: float,
+        success: bool = True,
+        cohort: Optional[str] = None,
+        sub_intent: Optional[str] = None
+    ) -> None:
+        """Record one call's latency and outcome"""
+        series = self._series(component, stage, cohort, sub_intent)
+        series.latency.record(elapsed_ms)
+        if success:
+            series.success += 1
+        else:
+            series.failure += 1
+
+    def record_cache(
+        self,
+        component: str,
+        stage: str,
+        hit: bool,
+        cohort: Optional[str] = None,
+        sub_intent: Optional[str] = None
+    ) -> None:
+        """Record a cache lookup"""
+        series = self._series(component, stage, cohort, sub_intent)
+        if hit:
+            series.cache_hits += 1
+        else:
+            series.cache_misses += 1
+
+    @contextmanager
+    def timed(self, component: str, stage: str, **labels: Optional[str]) -> Iterator[_Call]:
+        """Time a block, recording a failure if it raises or marks one"""
+        call = _Call()
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            call.success = False
+            raise
+        finally:
+            self.record(
+                component, stage, (time.perf_counter() - start) * 1000,
+                success=call.success, **labels
+            )
+            if call.cache_hit is not None:
+                self.record_cache(component, stage, call.cache_hit, **labels)
+
+    def aggregate(self, *dimensions: int) -> Dict[Tuple[str, ...], ComponentSeries]:
+        """Merge series that share the given key positions"""
+        merged: Dict[Tuple[str, ...], ComponentSeries] = {}
+        for key, series in list(self.series.items()):
+            group = tuple(key[d] for d in dimensions)
+            if group not in merged:
+                merged[group] = ComponentSeries()
+            merged[group].merge(series)
+        return merged
+
+    def combined(self, component: str, stages: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Summary of a component merged over the given stages, or all of them"""
+        stages = set(stages) if stages is not None else None
+        merged = ComponentSeries()
+        for key, series in list(self.series.items()):
+            if key[0] == component and (stages is None or key[1] in stages):
+                merged.merge(series)
+        return merged.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        """Per stage, per cohort and per sub-intent breakdowns"""
+        stages: Dict[str, Dict[str, Any]] = {}
+        for (component, stage), series in sorted(self.aggregate(0, 1).items()):
+            stages.setdefault(component, {})[stage] = series.summary()
+
+        def breakdown(dimension: int) -> Dict[str, Dict[str, Any]]:
+            result: Dict[str, Dict[str, Any]] = {}
+            for (component, stage, label), series in sorted(self.aggregate(0, 1, dimension).items()):
+                result.setdefault(label, {})[f"{component}.{stage}"] = series.summary()
+            return result
+
+        return {
+            "stages": stages,
+            "by_cohort": breakdown(2),
+            "by_sub_intent": breakdown(3),
+            "since": self.started_at
+        }
+
+    def prometheus(self, prefix: str = "health_coach") -> List[str]:
+        """Prometheus text exposition lines: a latency summary and counters per series"""
+        lines = [
+            f"# HELP {prefix}_component_latency_seconds Component call latency",
+            f"# TYPE {prefix}_component_latency_seconds summary"
+        ]
+        calls = [
+            f"# HELP {prefix}_component_calls_total Component calls by outcome",
+            f"# TYPE {prefix}_component_calls_total counter"
+        ]
+        cache = [
+            f"# HELP {prefix}_component_cache_lookups_total Component cache lookups by result",
+            f"# TYPE {prefix}_component_cache_lookups_total counter"
+        ]
+        for (component, stage, cohort, sub_intent), series in sorted(self.series.items()):
+            labels = (
+                f'component="{component}",stage="{stage}",'
+                f'cohort="{cohort}",sub_intent="{sub_intent}"'
+            )
+            if series.latency.count:
+                for quantile, value in series.latency.percentiles().items():
+                    lines.append(
+                        f'{prefix}_component_latency_seconds{{{labels},quantile="{quantile}"}} '
+                        f"{value / 1000:.6f}"
+                    )
+                lines.append(f"{prefix}_component_latency_seconds_sum{{{labels}}} {series.latency.total_ms / 1000:.6f}")
+                lines.append(f"{prefix}_component_latency_seconds_count{{{labels}}} {series.latency.count}")
+                calls.append(f'{prefix}_component_calls_total{{{labels},outcome="success"}} {series.success}')
+                calls.append(f'{prefix}_component_calls_total{{{labels},outcome="failure"}} {series.failure}')
+            if series.cache_hits or series.cache_misses:
+                cache.append(f'{prefix}_component_cache_lookups_total{{{labels},result="hit"}} {series.cache_hits}')
+                cache.append(f'{prefix}_component_cache_lookups_total{{{labels},result="miss"}} {series.cache_misses}')
+        return lines + calls + cache
+
+
+COMPONENT_METRICS = ComponentMetrics()
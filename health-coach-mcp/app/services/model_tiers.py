@@ -0,0 +1,265 @@
+"""
+Per-stage model selection with latency SLOs
+
+Each LLM call belongs to a stage (category, intent and sub-intent
+classification, joint routing, generation and streaming generation) with
+its own model, max_tokens, timeout, fallback model and p95 latency budget.
+Latencies are kept per stage and model over a rolling window. When the
+primary model's p95 exceeds the stage budget, calls switch to the fallback
+model. A fraction of calls, and at least one call per window_seconds /
+min_samples, still go to the primary as probes. Calls return to it once its
+p95 is within budget over min_samples fresh samples, or, when traffic is
+too light for that, over the probes of the last full window. A call that times out or fails to connect is retried once on the
+fallback model.
+
+Latencies are upstream service times: with a governed client, time spent
+queued in the governor or backing off from 429s is not counted. Streaming
+calls are timed until the stream opens, which is close to the time to
+first token. Timeouts count as the full timeout.
+"""
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError
+
+from app.core.config import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+STAGES = (
+    "category",
+    "intent",
+    "sub_intent",
+    "joint",
+    "generation",
+    "stream_generation"
+)
+
+
+@dataclass(frozen=True)
+class StageModel:
+    """Model configuration for one stage"""
+    stage: str
+    model: str
+    fallback_model: Optional[str]
+    max_tokens: int
+    timeout_seconds: float
+    p95_budget_ms: float
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+class LatencyWindow:
+    """Latencies observed over the last window_seconds"""
+
+    def __init__(self, window_seconds: float, max_samples: int = 1000):
+        self.window_seconds = window_seconds
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+
+    def add(self, elapsed_ms: float) -> None:
+        self.samples.append((time.monotonic(), elapsed_ms))
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+
+    def count(self) -> int:
+        """Samples in the window"""
+        self._expire()
+        return len(self.samples)
+
+    def p95(self, min_samples: int = 1) -> Optional[float]:
+        """p95 latency in the window, or None with fewer than min_samples"""
+        self._expire()
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(ms for _, ms in self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class ModelTiers:
+    """Choose each stage's model and fall back when its latency SLO is breached"""
+
+    def __init__(
+        self,
+        stages: Dict[str, StageModel],
+        window_seconds: float = 300.0,
+        min_samples: int = 20,
+        probe_fraction: float = 0.05
+    ):
+        self.stages = stages
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.probe_fraction = probe_fraction
+        # Light stages still get min_samples probes per window
+        self.probe_interval = window_seconds / max(1, min_samples)
+        self._windows: Dict[Tuple[str, str], LatencyWindow] = {}
+        # Stages on their fallback model, with when they switched
+        self._breached: Dict[str, float] = {}
+        # Fallback calls per stage since the primary was last probed, and when that was
+        self._since_probe: Dict[str, int] = {}
+        self._last_probe: Dict[str, float] = {}
+        self.counters = {
+            "fallback_calls": 0,
+            "error_fallbacks": 0,
+            "probe_calls": 0
+        }
+
+    @classmethod
+    def from_settings(cls, config: Settings) -> "ModelTiers":
+        """Stage table from the <STAGE>_MODEL, _FALLBACK_MODEL, ... settings"""
+        stages = {}
+        for stage in STAGES:
+            prefix = stage.upper() if "generation" in stage else f"ROUTER_{stage.upper()}"
+            stages[stage] = StageModel(
+                stage=stage,
+                model=getattr(config, f"{prefix}_MODEL") or config.OPENAI_MODEL,
+                fallback_model=getattr(config, f"{prefix}_FALLBACK_MODEL") or None,
+                max_tokens=getattr(config, f"{prefix}_MAX_TOKENS"),
+                timeout_seconds=getattr(config, f"{prefix}_TIMEOUT_SECONDS"),
+                p95_budget_ms=getattr(config, f"{prefix}_P95_BUDGET_MS")
+            )
+        return cls(
+            stages,
+            window_seconds=config.MODEL_SLO_WINDOW_SECONDS,
+            min_samples=config.MODEL_SLO_MIN_SAMPLES,
+            probe_fraction=config.MODEL_SLO_PROBE_FRACTION
+        )
+
+    def window(self, stage: str, model: str) -> LatencyWindow:
+        key = (stage, model)
+        if key not in self._windows:
+            self._windows[key] = LatencyWindow(self.window_seconds)
+        return self._windows[key]
+
+    def active_model(self, stage: str) -> str:
+        """The model a stage is on, without re-evaluating its SLO"""
+        tier = self.stages[stage]
+        if stage in self._breached and tier.fallback_model:
+            return tier.fallback_model
+        return tier.model
+
+    def select(self, stage: str) -> str:
+        """Re-evaluate a stage's SLO, switching models if needed, and return the model to use"""
+        tier = self.stages[stage]
+        if not tier.fallback_model or tier.fallback_model == tier.model:
+            return tier.model
+        window = self.window(stage, tier.model)
+        if stage in self._breached:
+            # Only probes reach the primary. After a full window in breach every
+            # sample left is a probe, so a light stage need not wait for min_samples
+            settled = time.monotonic() - self._breached[stage] >= self.window_seconds
+            p95 = window.p95(1 if settled else self.min_samples)
+            breached = p95 is None or p95 > tier.p95_budget_ms
+        else:
+            p95 = window.p95(self.min_samples)
+            breached = p95 is not None and p95 > tier.p95_budget_ms
+        if breached != (stage in self._breached):
+            if breached:
+                self._breached[stage] = self._last_probe[stage] = time.monotonic()
+                self._since_probe[stage] = 0
+                logger.warning(
+                    f"{stage} p95 {p95:.0f}ms over its {tier.p95_budget_ms:.0f}ms budget, "
+                    f"using {tier.fallback_model}"
+                )
+            else:
+                del self._breached[stage]
+                logger.info(f"{stage} back on {tier.model} ({window.count()} samples in budget)")
+        return self.active_model(stage)
+
+    def _choose(self, stage: str) -> str:
+        """The model for the next call, sending probes to a primary over budget"""
+        tier = self.stages[stage]
+        model = self.select(stage)
+        if model == tier.model:
+            return model
+        now = time.monotonic()
+        since_probe = self._since_probe.get(stage, 0) + 1
+        if (
+            (self.probe_fraction > 0 and since_probe * self.probe_fraction >= 1)
+            or now - self._last_probe.get(stage, now) >= self.probe_interval
+        ):
+            # Keep sampling the primary so the stage can switch back
+            self._since_probe[stage] = 0
+            self._last_probe[stage] = now
+            self.counters["probe_calls"] += 1
+            return tier.model
+        self._since_probe[stage] = since_probe
+        self.counters["fallback_calls"] += 1
+        return model
+
+    async def create(self, client: Any, stage: str, **request: Any) -> Any:
+        """Chat completion for a stage with its model, max_tokens and timeout"""
+        tier = self.stages[stage]
+        request.setdefault("max_tokens", tier.max_tokens)
+        model = self._choose(stage)
+
+        try:
+            response, elapsed_ms = await self._call(
+                client, model=model, timeout=tier.timeout_seconds, **request
+            )
+        except (APIConnectionError, InternalServerError) as e:
+            if isinstance(e, APITimeoutError):
+                # Timeouts count against the budget like any other slow call
+                self.window(stage, model).add(tier.timeout_seconds * 1000)
+            if not tier.fallback_model or model == tier.fallback_model:
+                raise
+            self.counters["error_fallbacks"] += 1
+            logger.warning(f"{stage} call on {model} failed ({type(e).__name__}), retrying on {tier.fallback_model}")
+            model = tier.fallback_model
+            response, elapsed_ms = await self._call(
+                client, model=model, timeout=tier.timeout_seconds, **request
+            )
+        self.window(stage, model).add(elapsed_ms)
+        return response
+
+    async def _call(self, client: Any, **request: Any) -> Tuple[Any, float]:
+        """A chat completion and its upstream latency in milliseconds"""
+        create_timed = getattr(client, "create_timed", None)
+        if create_timed:
+            # Governed clients time the call itself, leaving out queueing
+            return await create_timed(**request)
+        start = time.perf_counter()
+        response = await client.chat.completions.create(**request)
+        return response, (time.perf_counter() - start) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        """Model in use, p95 and budget per stage"""
+        stages = {}
+        for stage, tier in self.stages.items():
+            stages[stage] = {
+                "model": tier.model,
+                "fallback_model": tier.fallback_model,
+                "active_model": self.active_model(stage),
+                "p95_ms": _round(self.window(stage, tier.model).p95()),
+                "fallback_p95_ms": (
+                    _round(self.window(stage, tier.fallback_model).p95()) if tier.fallback_model else None
+                ),
+                "p95_budget_ms": tier.p95_budget_ms,
+                "max_tokens": tier.max_tokens,
+                "timeout_seconds": tier.timeout_seconds
+            }
+        return {**self.counters, "stages": stages}
+
+    def prometheus(self, prefix: str = "health_coach") -> List[str]:
+        """Prometheus text exposition lines for the rolling p95 and fallback state per stage"""
+        p95_lines = [f"# TYPE {prefix}_model_stage_p95_seconds gauge"]
+        fallback_lines = [f"# TYPE {prefix}_model_stage_fallback_active gauge"]
+        for stage, tier in self.stages.items():
+            p95 = self.window(stage, tier.model).p95()
+            if p95 is not None:
+                p95_lines.append(
+                    f'{prefix}_model_stage_p95_seconds{{stage="{stage}",model="{tier.model}"}} {p95 / 1000:.6f}'
+                )
+            active = self.active_model(stage) != tier.model
+            fallback_lines.append(f'{prefix}_model_stage_fallback_active{{stage="{stage}"}} {int(active)}')
+        return p95_lines + fallback_lines
+
+
+MODEL_TIERS = ModelTiers.from_settings(settings)
@@ -0,0 +1,212 @@
+"""
+Chat request pipeline: trace loading, routing and context retrieval
+
+In pipelined mode work starts as soon as its inputs are known. The trace
+load and profile fetch begin at request entry, category-dependent
+retrieval begins the moment routing knows the category, and everything is
+joined just before prompt assembly. Sequential mode runs the same stages
+one after another. Degraded mode, used when admission control is shedding
+load, routes without LLM calls and skips retrieval altogether.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.models.chat import ChatRequest, ConversationTrace, RoutingDecision
+from app.services.coach import HealthCoach
+from app.services.context import CONTEXT_SOURCES, SKIPPED
+from app.services.metrics import bind_metric_labels
+from app.services.router import SemanticRouter
+from app.services.storage import ConversationStorage
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    """Per-stage timings relative to request entry, in milliseconds"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since request entry"""
+        return round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    def mark(self, stage: str) -> None:
+        """Record that a stage finished now"""
+        self.timings[stage] = self.elapsed_ms()
+
+
+class PreparedChat:
+    """Everything prompt assembly needs, filled in as stages complete"""
+
+    def __init__(self, timer: StageTimer):
+        self.timer = timer
+        self.trace: Optional[ConversationTrace] = None
+        self.routing_decision: Optional[RoutingDecision] = None
+        self.retrieval_context: Dict[str, Any] = {}
+        self.context_sources: Dict[str, str] = {}
+
+
+class ChatPipeline:
+    """Prepare a chat request for generation"""
+
+    def __init__(
+        self,
+        semantic_router: SemanticRouter,
+        health_coach: HealthCoach,
+        storage: ConversationStorage,
+        pipelined: Optional[bool] = None,
+        degraded: bool = False
+    ):
+        self.semantic_router = semantic_router
+        self.health_coach = health_coach
+        self.storage = storage
+        self.pipelined = settings.CHAT_PIPELINE_ENABLED if pipelined is None else pipelined
+        self.degraded = degraded
+
+    async def prepare(self, request: ChatRequest) -> PreparedChat:
+        """Load the trace, route the query and gather context"""
+        prepared = None
+        async for _, prepared in self.stages(request):
+            pass
+        return prepared
+
+    async def stages(
+        self,
+        request: ChatRequest
+    ) -> AsyncIterator[Tuple[str, PreparedChat]]:
+        """
+        Run the pipeline, yielding each stage as it completes.
+
+        Yields ("routing", prepared) once the routing decision is known and
+        ("context", prepared) once context and the trace are ready. Closing
+        the iterator early cancels any retrieval still running.
+        
+        Component metrics recorded while serving the request are labelled
+        with its cohort and, once routed, its sub-intent.
+        """
+        labels = bind_metric_labels(cohort=request.cohort.value)
+        if self.degraded:
+            stages = self._degraded_stages(request)
+        elif self.pipelined:
+            stages = self._pipelined_stages(request)
+        else:
+            stages = self._sequential_stages(request)
+        try:
+            async for stage, prepared in stages:
+                if stage == "routing":
+                    labels["sub_intent"] = prepared.routing_decision.sub_intent_id or "general"
+                yield stage, prepared
+        finally:
+            await stages.aclose()
+
+    async def _pipelined_stages(
+        self,
+        request: ChatRequest
+    ) -> AsyncIterator[Tuple[str, PreparedChat]]:
+        """Overlap trace loading and retrieval with routing"""
+        timer = StageTimer()
+        prepared = PreparedChat(timer)
+
+        async def load_trace() -> ConversationTrace:
+            trace = await self.storage.open_trace(
+                session_id=request.session_id,
+                user_id=request.user_id
+            )
+            timer.mark("trace_load")
+            return trace
+
+        def on_category(category) -> None:
+            timer.mark("category")
+            fetch.start_category(category)
+
+        # Nothing here depends on the routing decision
+        trace_task = asyncio.create_task(load_trace())
+        fetch = self.health_coach.start_context_fetch(request.context)
+        fetch.start_profile()
+
+        try:
+            prepared.routing_decision = await self.semantic_router.route(
+                query=request.message,
+                user_cohort=request.cohort,
+                context=request.context,
+                on_category=on_category
+            )
+            timer.mark("routing")
+
+            # Health data needs the intent; anything not yet started starts here
+            fetch.start_decision(prepared.routing_decision)
+            yield "routing", prepared
+
+            prepared.retrieval_context, prepared.context_sources = await fetch.collect()
+            timer.mark("context")
+
+            prepared.trace = await trace_task
+        finally:
+            fetch.cancel()
+            trace_task.cancel()
+
+        timer.timings["context_sources_ms"] = fetch.durations_ms()
+        yield "context", prepared
+
+    async def _sequential_stages(
+        self,
+        request: ChatRequest
+    ) -> AsyncIterator[Tuple[str, PreparedChat]]:
+        """Run each stage after the previous one has finished"""
+        timer = StageTimer()
+        prepared = PreparedChat(timer)
+
+        prepared.trace = await self.storage.open_trace(
+            session_id=request.session_id,
+            user_id=request.user_id
+        )
+        timer.mark("trace_load")
+
+        prepared.routing_decision = await self.semantic_router.route(
+            query=request.message,
+            user_cohort=request.cohort,
+            context=request.context
+        )
+        timer.mark("routing")
+        yield "routing", prepared
+
+        fetch = self.health_coach.start_context_fetch(request.context)
+        fetch.start_decision(prepared.routing_decision)
+        prepared.retrieval_context, prepared.context_sources = await fetch.collect()
+        timer.mark("context")
+
+        timer.timings["context_sources_ms"] = fetch.durations_ms()
+        yield "context", prepared
+
+    async def _degraded_stages(
+        self,
+        request: ChatRequest
+    ) -> AsyncIterator[Tuple[str, PreparedChat]]:
+        """Route without LLM calls and skip context retrieval"""
+        timer = StageTimer()
+        prepared = PreparedChat(timer)
+
+        trace_task = asyncio.create_task(self.storage.open_trace(
+            session_id=request.session_id,
+            user_id=request.user_id
+        ))
+        try:
+            prepared.routing_decision = await self.semantic_router.route_without_llm(
+                query=request.message,
+                user_cohort=request.cohort
+            )
+            timer.mark("routing")
+            yield "routing", prepared
+
+            prepared.context_sources = {source: SKIPPED for source in CONTEXT_SOURCES}
+            prepared.trace = await trace_task
+            timer.mark("trace_load")
+        finally:
+            trace_task.cancel()
+
+        yield "context", prepared
@@ -0,0 +1,243 @@
+"""
+Lexical pre-router for fast, CPU-only intent classification
+
+Builds a TF-IDF index over the example queries and excluded patterns of every
+sub-intent in the constraint hierarchy so that confident matches can skip the
+LLM classification cascade entirely.
+"""
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.hierarchy import (
+    Cohort, IntentClass, Category, SubIntent, CONSTRAINT_HIERARCHY
+)
+from app.core.hierarchy_index import HIERARCHY_INDEX
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "be", "can", "do", "does", "for", "how", "i",
+    "in", "is", "it", "me", "my", "of", "on", "or", "should", "the", "to",
+    "what", "with", "you"
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into unigram and bigram terms"""
+    words = [w for w in _TOKEN_PATTERN.findall(text.lower()) if w not in _STOPWORDS]
+    bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return words + bigrams
+
+
+class PreRouteMatch(BaseModel):
+    """Candidate route produced by the lexical pre-router"""
+    category: Category
+    intent_class: IntentClass
+    sub_intent_id: str
+    score: float
+    confidence: float
+
+
+class PreRouteResult:
+    """Scores for a single query against every indexed sub-intent"""
+
+    def __init__(
+        self,
+        matches: List[PreRouteMatch],
+        scores: Dict[str, float]
+    ):
+        self.matches = matches
+        self.scores = scores
+
+    @property
+    def best(self) -> Optional[PreRouteMatch]:
+        """Highest-confidence candidate, if any"""
+        return self.matches[0] if self.matches else None
+
+    def rank_categories(self) -> List[Category]:
+        """Categories ordered by their best-scoring sub-intent"""
+        best: Dict[Category, float] = {category: 0.0 for category in Category}
+        for sid, score in self.scores.items():
+            category = HIERARCHY_INDEX.sub_intents[sid].parent_category
+            best[category] = max(best[category], score)
+        # sorted() is stable, so unscored categories keep enum order
+        return sorted(best, key=lambda category: -best[category])
+
+    def support(
+        self,
+        category: Category,
+        intent_class: IntentClass,
+        sub_intent_id: Optional[str] = None
+    ) -> float:
+        """
+        Fraction of the strongest lexical evidence that supports a route.
+
+        Returns 1.0 when the route contains the best-scoring sub-intent and
+        0.0 when nothing in the index resembles the query.
+        """
+        top = max(self.scores.values(), default=0.0)
+        if top <= 0.0:
+            return 0.0
+
+        if sub_intent_id:
+            path_score = self.scores.get(sub_intent_id, 0.0)
+        else:
+            path_score = max(
+                (
+                    score for sid, score in self.scores.items()
+                    if HIERARCHY_INDEX.sub_intents[sid].parent_category == category
+                    and HIERARCHY_INDEX.sub_intents[sid].parent_intent == intent_class
+                ),
+                default=0.0
+            )
+        return path_score / top
+
+
+class LexicalPreRouter:
+    """TF-IDF nearest-neighbour router over sub-intent example queries"""
+
+    def __init__(
+        self,
+        sub_intents: Dict[str, SubIntent],
+        exclusion_weight: float = 0.5
+    ):
+        self.exclusion_weight = exclusion_weight
+        self.sub_intent_ids: List[str] = list(sub_intents.keys())
+        self.sub_intents = sub_intents
+
+        positive_docs: List[Tuple[int, str]] = []
+        negative_docs: List[Tuple[int, str]] = []
+        for index, sub_intent in enumerate(sub_intents.values()):
+            positive_docs.extend((index, q) for q in sub_intent.example_queries)
+            negative_docs.extend((index, p) for p in sub_intent.excluded_patterns)
+
+        # Vocabulary and IDF are fitted over every indexed document
+        all_tokens = [tokenize(text) for _, text in positive_docs + negative_docs]
+        self.vocabulary: Dict[str, int] = {}
+        document_frequency: Dict[str, int] = {}
+        for tokens in all_tokens:
+            for term in set(tokens):
+                if term not in self.vocabulary:
+                    self.vocabulary[term] = len(self.vocabulary)
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        doc_count = len(all_tokens)
+        self.idf = np.zeros(len(self.vocabulary), dtype=np.float64)
+        for term, column in self.vocabulary.items():
+            self.idf[column] = math.log((1 + doc_count) / (1 + document_frequency[term])) + 1.0
+        # Unseen query terms count as maximally rare so they dilute similarity
+        self.unseen_idf = math.log(1 + doc_count) + 1.0
+
+        self.positive_matrix, self.positive_owner = self._build_matrix(positive_docs)
+        self.negative_matrix, self.negative_owner = self._build_matrix(negative_docs)
+
+        logger.info(
+            f"Pre-router index built: {len(self.sub_intent_ids)} sub-intents, "
+            f"{len(positive_docs)} examples, {len(negative_docs)} exclusions, "
+            f"{len(self.vocabulary)} terms"
+        )
+
+    def _build_matrix(
+        self,
+        docs: List[Tuple[int, str]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Build an L2-normalised TF-IDF matrix and its row owners"""
+        matrix = np.zeros((len(docs), len(self.vocabulary)), dtype=np.float64)
+        owners = np.zeros(len(docs), dtype=np.int64)
+        for row, (owner, text) in enumerate(docs):
+            vector, _ = self._vectorize(text)
+            matrix[row] = vector
+            owners[row] = owner
+        return matrix, owners
+
+    def _vectorize(self, text: str) -> Tuple[np.ndarray, float]:
+        """Return the normalised in-vocabulary vector and the full norm"""
+        counts: Dict[str, int] = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+
+        vector = np.zeros(len(self.vocabulary), dtype=np.float64)
+        unseen_mass = 0.0
+        for term, count in counts.items():
+            weight = 1.0 + math.log(count)
+            column = self.vocabulary.get(term)
+            if column is None:
+                unseen_mass += (weight * self.unseen_idf) ** 2
+            else:
+                vector[column] = weight * self.idf[column]
+
+        norm = math.sqrt(float(vector @ vector) + unseen_mass)
+        if norm == 0.0:
+            return vector, 0.0
+        return vector / norm, norm
+
+    def _max_by_owner(self, matrix: np.ndarray, owners: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Maximum cosine similarity per sub-intent"""
+        result = np.zeros(len(self.sub_intent_ids), dtype=np.float64)
+        if matrix.shape[0]:
+            np.maximum.at(result, owners, matrix @ query)
+        return result
+
+    def score(self, query: str, user_cohort: Cohort) -> PreRouteResult:
+        """Score a query against sub-intents allowed for the cohort"""
+        query_vector, norm = self._vectorize(query)
+        if norm == 0.0:
+            return PreRouteResult(matches=[], scores={})
+
+        positive = self._max_by_owner(self.positive_matrix, self.positive_owner, query_vector)
+        negative = self._max_by_owner(self.negative_matrix, self.negative_owner, query_vector)
+        scores = np.clip(positive - self.exclusion_weight * negative, 0.0, 1.0)
+
+        allowed_intents = CONSTRAINT_HIERARCHY["cohorts"][user_cohort]["allowed_intents"]
+        for index, sub_intent in enumerate(self.sub_intents.values()):
+            if sub_intent.parent_intent not in allowed_intents:
+                scores[index] = 0.0
+
+        top_k = min(settings.PRE_ROUTER_TOP_K, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        runner_up = float(scores[candidates[1]]) if len(candidates) > 1 else 0.0
+
+        matches = []
+        for rank, index in enumerate(candidates):
+            value = float(scores[index])
+            if value <= 0.0:
+                break
+            sub_intent = self.sub_intents[self.sub_intent_ids[index]]
+            # Discount the top match by how close the runner-up is
+            margin = (value - runner_up) / value if rank == 0 else 0.0
+            matches.append(PreRouteMatch(
+                category=sub_intent.parent_category,
+                intent_class=sub_intent.parent_intent,
+                sub_intent_id=self.sub_intent_ids[index],
+                score=round(value, 4),
+                confidence=round(value * (0.5 + 0.5 * margin), 4)
+            ))
+
+        return PreRouteResult(
+            matches=matches,
+            scores={
+                sid: float(scores[i])
+                for i, sid in enumerate(self.sub_intent_ids)
+                if scores[i] > 0.0
+            }
+        )
+
+
+@lru_cache(maxsize=1)
+def get_pre_router() -> LexicalPreRouter:
+    """Get the process-wide pre-router, building its index on first use"""
+    return LexicalPreRouter(
+        HIERARCHY_INDEX.sub_intents,
+        exclusion_weight=settings.PRE_ROUTER_EXCLUSION_WEIGHT
+    )
@@ -0,0 +1,192 @@
+"""
+Precompiled system prompts for every route
+
+The coaching system prompt depends only on the route (cohort, intent,
+category, sub-intent) and its constraints, so one prompt per route is
+rendered at import. Each prompt starts with a preamble shared by every
+route, followed by the route in hierarchy order (cohort, intent, category,
+sub-intent, constraints). Routes with the same cohort therefore share a
+longer byte-identical prefix. Everything per request (regeneration
+feedback, then the query and retrieved context) is appended after it. That
+keeps the prefix stable for provider-side prompt caching, which applies
+once a prompt reaches PROMPT_CACHE_MIN_TOKENS.
+
+PromptCacheStats records how many generation calls had a cacheable prefix
+and how many prompt tokens the API reported as served from its cache.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.hierarchy import Category, Cohort, CONSTRAINT_HIERARCHY, IntentClass
+from app.core.hierarchy_index import HIERARCHY_INDEX, HierarchyIndex, RoutePath
+from app.models.chat import RoutingDecision
+
+logger = logging.getLogger(__name__)
+
+# OpenAI caches prompt prefixes from this length up
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+PREAMBLE = """You are a health coach giving guidance within a structured coaching hierarchy.
+
+Guidelines:
+- Stay within the scope of the identified intent
+- Use language appropriate for the user's cohort level
+- Be specific and actionable when possible
+- If the query is outside your constraints, politely redirect
+- Constraints marked ! are high severity"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token"""
+    return len(text) // 4
+
+
+def format_constraints(constraints: Iterable[Any]) -> str:
+    """Constraint lines for a prompt, high severity marked with !"""
+    formatted = [
+        f"- [{constraint.type.value}] {constraint.description}"
+        + (" !" if constraint.severity == "high" else "")
+        for constraint in constraints
+    ]
+    return "\n".join(formatted) if formatted else "- No specific constraints"
+
+
+def render_system_prompt(
+    index: HierarchyIndex,
+    cohort: Cohort,
+    intent_class: IntentClass,
+    category: Category,
+    sub_intent_id: Optional[str],
+    constraints: Iterable[Any]
+) -> str:
+    """System prompt for a route"""
+    cohort_data = CONSTRAINT_HIERARCHY["cohorts"][cohort]
+    lines = [
+        PREAMBLE,
+        "",
+        f"User Cohort: {cohort.value} ({cohort_data['description']})",
+        f"Intent Type: {intent_class.value}",
+        f"Category: {category.value}"
+    ]
+    sub_intent = index.sub_intents.get(sub_intent_id) if sub_intent_id else None
+    if sub_intent:
+        lines.append(f"Specific Focus: {sub_intent.name}")
+        lines.append(f"Description: {sub_intent.description}")
+    lines.extend([
+        "",
+        "CONSTRAINTS YOU MUST FOLLOW:",
+        format_constraints(constraints),
+        "",
+        f"Remember: You are focused on {category.value} and the {intent_class.value} intent type."
+    ])
+    return "\n".join(lines)
+
+
+class PromptTemplates:
+    """System prompts for every route, rendered once"""
+
+    def __init__(self, index: HierarchyIndex):
+        self.index = index
+        # route -> (constraint ids the prompt was rendered with, prompt)
+        self.prompts: Dict[RoutePath, Tuple[Tuple[str, ...], str]] = {}
+        for path, constraints in index.constraints.items():
+            self.prompts[path] = (
+                tuple(constraint.id for constraint in constraints),
+                render_system_prompt(index, *path, constraints)
+            )
+
+        digest = hashlib.sha256(PREAMBLE.encode())
+        for path in sorted(self.prompts, key=str):
+            digest.update(self.prompts[path][1].encode())
+        # Changes whenever any prompt's text changes
+        self.version = digest.hexdigest()[:16]
+
+        logger.info(f"Precompiled {len(self.prompts)} system prompts (version {self.version})")
+
+    def system_prompt(self, routing_decision: RoutingDecision, user_cohort: Cohort) -> str:
+        """
+        Precompiled prompt for a decision's route.
+
+        Decisions whose constraints differ from the route's own, such as
+        routing fallbacks, are rendered on the spot.
+        """
+        compiled = self.prompts.get((
+            user_cohort,
+            routing_decision.intent_class,
+            routing_decision.category,
+            routing_decision.sub_intent_id
+        ))
+        if compiled and compiled[0] == tuple(c.id for c in routing_decision.constraints):
+            return compiled[1]
+        return render_system_prompt(
+            self.index,
+            user_cohort,
+            routing_decision.intent_class,
+            routing_decision.category,
+            routing_decision.sub_intent_id,
+            routing_decision.constraints
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Template count, sizes and how many reach the prompt cache minimum"""
+        sizes = [estimate_tokens(prompt) for _, prompt in self.prompts.values()]
+        return {
+            "version": self.version,
+            "templates": len(sizes),
+            "shared_prefix_tokens": estimate_tokens(PREAMBLE),
+            "min_tokens": min(sizes, default=0),
+            "max_tokens": max(sizes, default=0),
+            "cache_eligible_templates": sum(size >= PROMPT_CACHE_MIN_TOKENS for size in sizes)
+        }
+
+
+class PromptCacheStats:
+    """Prompt cache eligibility and cached-token counts from API usage"""
+
+    def __init__(self):
+        self.counters = {
+            "calls": 0,
+            "eligible_calls": 0,
+            "usage_reported": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0
+        }
+
+    def record(self, system_prompt: str, usage: Any) -> None:
+        """Count a generation call and the usage the API returned for it"""
+        self.counters["calls"] += 1
+        if estimate_tokens(system_prompt) >= PROMPT_CACHE_MIN_TOKENS:
+            self.counters["eligible_calls"] += 1
+        if usage is None:
+            return
+        self.counters["usage_reported"] += 1
+        self.counters["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.counters["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+
+    def prometheus(self, prefix: str = "health_coach") -> List[str]:
+        """Prometheus text exposition lines for the counters"""
+        return [
+            f"# TYPE {prefix}_generation_prompts_total counter",
+            f'{prefix}_generation_prompts_total{{prompt_cache="eligible"}} {self.counters["eligible_calls"]}',
+            f'{prefix}_generation_prompts_total{{prompt_cache="ineligible"}} '
+            f'{self.counters["calls"] - self.counters["eligible_calls"]}',
+            f"# TYPE {prefix}_generation_prompt_tokens_total counter",
+            f"{prefix}_generation_prompt_tokens_total {self.counters['prompt_tokens']}",
+            f"# TYPE {prefix}_generation_cached_prompt_tokens_total counter",
+            f"{prefix}_generation_cached_prompt_tokens_total {self.counters['cached_tokens']}"
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        prompt_tokens = self.counters["prompt_tokens"]
+        return {
+            **self.counters,
+            "cached_token_ratio": (
+                round(self.counters["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else None
+            )
+        }
+
+
+PROMPT_TEMPLATES = PromptTemplates(HIERARCHY_INDEX)
+PROMPT_CACHE_STATS = PromptCacheStats()
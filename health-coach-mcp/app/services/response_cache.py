@@ -0,0 +1,170 @@
+"""
+Two-tier cache for non-personalized coaching responses
+
+Users without profile, belief or health context who ask the same question
+on the same route get the same prompt, so the generation can be reused.
+Entries are keyed by normalized query, cohort, route and constraint set, a
+hash of the retrieved context, the model and the prompt template version.
+The first tier is an in-process LRU bounded by the size of the cached text,
+the second a shared Redis tier with TTL.
+
+Generations are never cached when retrieved context is present, when they
+regenerate a discarded draft or when the temperature is above the
+configured maximum.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.core.hierarchy import Cohort
+from app.models.chat import RoutingDecision
+from app.services.prompt_templates import PROMPT_TEMPLATES
+from app.services.routing_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """In-process LRU, bounded in bytes, in front of a shared Redis tier"""
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: int = 3600,
+        max_temperature: float = 0.3,
+        redis_client: Optional[redis.Redis] = None
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self.redis = redis_client
+        # key -> (expires_at, response, size in bytes)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self.bytes = 0
+        self.counters = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "bypassed_personalized": 0,
+            "bypassed_feedback": 0,
+            "bypassed_temperature": 0,
+            "redis_errors": 0
+        }
+
+    def bypass(
+        self,
+        retrieval_context: Optional[Dict[str, Any]],
+        temperature: float,
+        feedback: Optional[str] = None
+    ) -> bool:
+        """Whether a generation must skip the cache, counting the reason"""
+        if retrieval_context:
+            reason = "personalized"
+        elif feedback:
+            reason = "feedback"
+        elif temperature > self.max_temperature:
+            reason = "temperature"
+        else:
+            return False
+        self.counters[f"bypassed_{reason}"] += 1
+        return True
+
+    def make_key(
+        self,
+        query: str,
+        routing_decision: RoutingDecision,
+        user_cohort: Cohort,
+        retrieval_context: Optional[Dict[str, Any]],
+        model: str
+    ) -> str:
+        """Build the cache key for a generation"""
+        parts = [
+            normalize_query(query),
+            user_cohort.value,
+            routing_decision.intent_class.value,
+            routing_decision.category.value,
+            routing_decision.sub_intent_id,
+            sorted(constraint.id for constraint in routing_decision.constraints),
+            json.dumps(retrieval_context or {}, sort_keys=True, default=str)
+        ]
+        digest = hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+        return f"response:{PROMPT_TEMPLATES.version}:{model}:{digest}"
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a response, promoting Redis hits into the LRU"""
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, response, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return response
+            self._forget(key)
+
+        if self.redis:
+            try:
+                data = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"Response cache read failed: {str(e)}")
+                self.counters["redis_errors"] += 1
+                data = None
+            if data:
+                response = data.decode() if isinstance(data, bytes) else data
+                self._remember(key, response)
+                self.counters["redis_hits"] += 1
+                return response
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: str) -> None:
+        """Store a response in both tiers"""
+        self._remember(key, response)
+        self.counters["stores"] += 1
+
+        if self.redis:
+            try:
+                await self.redis.set(key, response, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Response cache write failed: {str(e)}")
+                self.counters["redis_errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss and bypass counters and current occupancy"""
+        hits = self.counters["memory_hits"] + self.counters["redis_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "max_temperature": self.max_temperature,
+            "template_version": PROMPT_TEMPLATES.version
+        }
+
+    def _remember(self, key: str, response: str) -> None:
+        """Insert into the LRU tier, evicting least recently used entries"""
+        size = len(key) + len(response.encode())
+        if size > self.max_bytes:
+            return
+        self._forget(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, response, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.counters["evictions"] += 1
+
+    def _forget(self, key: str) -> None:
+        """Remove one entry"""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.bytes -= entry[2]
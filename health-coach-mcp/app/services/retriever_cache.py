@@ -0,0 +1,197 @@
+"""
+Stale-while-revalidate cache for retriever results
+
+Entries are keyed by (source, user_id, category, window). A fresh entry is
+returned as is; an entry past its source's TTL but still inside the stale
+window is returned immediately while a background refresh replaces it.
+Concurrent misses for the same key share one upstream fetch. Invalidation
+detaches fetches already in flight, so later misses start a new fetch and
+the detached ones do not store their results.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from app.services.metrics import COMPONENT_METRICS
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, Optional[str], Optional[Hashable]]
+
+
+class RetrieverCache:
+    """Bounded in-process LRU with per-source TTLs and background refresh"""
+
+    def __init__(
+        self,
+        ttl_seconds: Dict[str, float],
+        stale_seconds: float = 600,
+        max_entries: int = 10000
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[CacheKey]] = {}
+        # key -> the fetch that may store its result; detached on invalidation
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        # Every running fetch, detached or not, so close() can cancel them
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {
+            "fresh_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    def make_key(
+        self,
+        source: str,
+        user_id: str,
+        category: Optional[str] = None,
+        window: Optional[Hashable] = None
+    ) -> CacheKey:
+        """Build the cache key for a retriever call"""
+        return (source, user_id, category, window)
+
+    async def get_or_fetch(
+        self,
+        key: CacheKey,
+        fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return a cached value, fetching it on a miss.
+
+        Stale values are served immediately and refreshed in the background.
+        Empty results are not cached because the retrievers also report
+        upstream failures as empty.
+        """
+        entry = self._entries.get(key)
+        if entry:
+            fetched_at, value = entry
+            age = time.monotonic() - fetched_at
+            ttl = self.ttl_seconds.get(key[0], 0)
+            if age <= ttl:
+                self._entries.move_to_end(key)
+                self.counters["fresh_hits"] += 1
+                COMPONENT_METRICS.record_cache("retriever", key[0], True)
+                return value
+            if age <= ttl + self.stale_seconds:
+                self._entries.move_to_end(key)
+                self.counters["stale_hits"] += 1
+                COMPONENT_METRICS.record_cache("retriever", key[0], True)
+                if key not in self._inflight:
+                    self.counters["refreshes"] += 1
+                    self._start_fetch(key, fetch)
+                return value
+            self._forget(key)
+
+        self.counters["misses"] += 1
+        COMPONENT_METRICS.record_cache("retriever", key[0], False)
+        task = self._inflight.get(key) or self._start_fetch(key, fetch)
+        # Shielded so that a caller's deadline does not cancel a fetch that
+        # other callers share or that would warm the cache for the next turn
+        return await asyncio.shield(task)
+
+    def invalidate(self, user_id: str, source: Optional[str] = None) -> int:
+        """Drop a user's entries, optionally for one source only"""
+        keys = [
+            key for key in self._keys_by_user.get(user_id, ())
+            if source is None or key[0] == source
+        ]
+        for key in keys:
+            self._forget(key)
+        # Fetches already in flight must not repopulate invalidated data or
+        # be joined by later misses
+        for key in [
+            key for key in self._inflight
+            if key[1] == user_id and (source is None or key[0] == source)
+        ]:
+            del self._inflight[key]
+        self.counters["invalidations"] += len(keys)
+        logger.info(f"Invalidated {len(keys)} context cache entries for user {user_id}")
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        self._entries.clear()
+        self._keys_by_user.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current occupancy"""
+        hits = self.counters["fresh_hits"] + self.counters["stale_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "refreshing": len(self._inflight)
+        }
+
+    async def close(self) -> None:
+        """Cancel background refreshes"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start_fetch(
+        self,
+        key: CacheKey,
+        fetch: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Task:
+        """Fetch from upstream and store the result"""
+        async def run():
+            try:
+                value = await fetch()
+            except Exception as e:
+                logger.warning(f"Context cache refresh failed for {key[0]}: {str(e)}")
+                self.counters["refresh_errors"] += 1
+                raise
+            if value and self._inflight.get(key) is asyncio.current_task():
+                self._remember(key, value)
+            return value
+
+        def done(task: asyncio.Task) -> None:
+            self._tasks.discard(task)
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            # Background refreshes have no awaiting caller to see the error
+            if not task.cancelled():
+                task.exception()
+
+        task = asyncio.create_task(run())
+        self._inflight[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(done)
+        return task
+
+    def _remember(self, key: CacheKey, value: Any) -> None:
+        """Insert into the LRU, evicting the least recently used entry"""
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(key[1], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._discard_user_key(oldest)
+            self.counters["evictions"] += 1
+
+    def _forget(self, key: CacheKey) -> None:
+        """Remove one entry"""
+        self._entries.pop(key, None)
+        self._discard_user_key(key)
+
+    def _discard_user_key(self, key: CacheKey) -> None:
+        """Remove a key from the per-user index"""
+        keys = self._keys_by_user.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[1]]
@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 
 from app.core.config import settings
 from app.core.hierarchy import Category
+from app.services.metrics import COMPONENT_METRICS
+from app.services.retriever_cache import RetrieverCache
 
 logger = logging.getLogger(__name__)
 
@@ -15,17 +17,33 @@ logger = logging.getLogger(__name__)
 class ProfileRetriever:
     """Retrieve user profile data from profile-mcp"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[RetrieverCache] = None
+    ):
         self.base_url = settings.PROFILE_MCP_URL
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.client = client or httpx.AsyncClient(timeout=10.0)
+        self.cache = cache
         
     async def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user profile summary"""
-        try:
-            response = await self.client.get(
-                f"{self.base_url}/users/{user_id}/profile",
-                headers={"Authorization": f"Bearer {settings.API_KEY}"}
+        if self.cache:
+            return await self.cache.get_or_fetch(
+                self.cache.make_key("user_profile", user_id),
+                lambda: self._fetch_user_profile(user_id)
             )
+        return await self._fetch_user_profile(user_id)
+    
+    async def _fetch_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch user profile summary from profile-mcp"""
+        try:
+            with COMPONENT_METRICS.timed("retriever", "user_profile") as call:
+                response = await self.client.get(
+                    f"{self.base_url}/users/{user_id}/profile",
+                    headers={"Authorization": f"Bearer {settings.API_KEY}"}
+                )
+                call.success = response.status_code == 200
             
             if response.status_code == 200:
                 profile = response.json()
@@ -62,9 +80,14 @@ class ProfileRetriever:
 class BeliefRetriever:
     """Retrieve relevant beliefs from em-mcp"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[RetrieverCache] = None
+    ):
         self.base_url = settings.EM_MCP_URL
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.client = client or httpx.AsyncClient(timeout=10.0)
+        self.cache = cache
         
     async def get_relevant_beliefs(
         self,
@@ -72,6 +95,19 @@ class BeliefRetriever:
         category: Category
     ) -> List[Dict[str, Any]]:
         """Get beliefs relevant to the health category"""
+        if self.cache:
+            return await self.cache.get_or_fetch(
+                self.cache.make_key("user_beliefs", user_id, category.value),
+                lambda: self._fetch_relevant_beliefs(user_id, category)
+            )
+        return await self._fetch_relevant_beliefs(user_id, category)
+    
+    async def _fetch_relevant_beliefs(
+        self,
+        user_id: str,
+        category: Category
+    ) -> List[Dict[str, Any]]:
+        """Fetch beliefs relevant to the health category from em-mcp"""
         try:
             # Map health categories to belief topics
             topic_map = {
@@ -82,15 +118,17 @@ class BeliefRetriever:
             
             topic = topic_map.get(category, "health")
             
-            response = await self.client.get(
-                f"{self.base_url}/beliefs",
-                params={
-                    "user_id": user_id,
-                    "topic": topic,
-                    "limit": 5
-                },
-                headers={"Authorization": f"Bearer {settings.API_KEY}"}
-            )
+            with COMPONENT_METRICS.timed("retriever", "user_beliefs") as call:
+                response = await self.client.get(
+                    f"{self.base_url}/beliefs",
+                    params={
+                        "user_id": user_id,
+                        "topic": topic,
+                        "limit": 5
+                    },
+                    headers={"Authorization": f"Bearer {settings.API_KEY}"}
+                )
+                call.success = response.status_code == 200
             
             if response.status_code == 200:
                 beliefs = response.json().get("beliefs", [])
@@ -116,9 +154,14 @@ class BeliefRetriever:
 class HealthDataRetriever:
     """Retrieve health data from dd-mcp"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[RetrieverCache] = None
+    ):
         self.base_url = settings.DD_MCP_URL
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.client = client or httpx.AsyncClient(timeout=10.0)
+        self.cache = cache
         
     async def get_recent_data(
         self,
@@ -127,6 +170,20 @@ class HealthDataRetriever:
         days: int = 7
     ) -> Optional[Dict[str, Any]]:
         """Get recent health data for the category"""
+        if self.cache:
+            return await self.cache.get_or_fetch(
+                self.cache.make_key("health_data", user_id, category.value, days),
+                lambda: self._fetch_recent_data(user_id, category, days)
+            )
+        return await self._fetch_recent_data(user_id, category, days)
+    
+    async def _fetch_recent_data(
+        self,
+        user_id: str,
+        category: Category,
+        days: int
+    ) -> Optional[Dict[str, Any]]:
+        """Fetch recent health data for the category from dd-mcp"""
         try:
             # Map categories to biomarker types
             biomarker_map = {
@@ -137,16 +194,18 @@ class HealthDataRetriever:
             
             biomarkers = biomarker_map.get(category, [])
             
-            response = await self.client.get(
-                f"{self.base_url}/biomarkers",
-                params={
-                    "user_id": user_id,
-                    "types": ",".join(biomarkers),
-                    "start_date": (datetime.utcnow() - timedelta(days=days)).isoformat(),
-                    "end_date": datetime.utcnow().isoformat()
-                },
-                headers={"Authorization": f"Bearer {settings.API_KEY}"}
-            )
+            with COMPONENT_METRICS.timed("retriever", "health_data") as call:
+                response = await self.client.get(
+                    f"{self.base_url}/biomarkers",
+                    params={
+                        "user_id": user_id,
+                        "types": ",".join(biomarkers),
+                        "start_date": (datetime.utcnow() - timedelta(days=days)).isoformat(),
+                        "end_date": datetime.utcnow().isoformat()
+                    },
+                    headers={"Authorization": f"Bearer {settings.API_KEY}"}
+                )
+                call.success = response.status_code == 200
             
             if response.status_code == 200:
                 data = response.json()
@@ -187,9 +246,9 @@ class HealthDataRetriever:
 class MemoryRetriever:
     """Retrieve from conversation memory and history"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.base_url = settings.PROFILE_MCP_URL
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.client = client or httpx.AsyncClient(timeout=10.0)
         
     async def get_conversation_context(
         self,
@@ -198,11 +257,13 @@ class MemoryRetriever:
     ) -> List[Dict[str, Any]]:
         """Get recent conversation context"""
         try:
-            response = await self.client.get(
-                f"{self.base_url}/conversations/{session_id}/messages",
-                params={"limit": limit},
-                headers={"Authorization": f"Bearer {settings.API_KEY}"}
-            )
+            with COMPONENT_METRICS.timed("retriever", "conversation_memory") as call:
+                response = await self.client.get(
+                    f"{self.base_url}/conversations/{session_id}/messages",
+                    params={"limit": limit},
+                    headers={"Authorization": f"Bearer {settings.API_KEY}"}
+                )
+                call.success = response.status_code == 200
             
             if response.status_code == 200:
                 messages = response.json().get("messages", [])
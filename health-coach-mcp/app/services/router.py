@@ -1,64 +1,224 @@
 """
 Semantic router for hierarchical intent classification
 """
+import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 from openai import AsyncOpenAI
 import json
 
 from app.core.config import settings
 from app.core.hierarchy import (
     Cohort, IntentClass, Category, SubIntent,
-    CONSTRAINT_HIERARCHY, get_applicable_constraints,
-    validate_intent_for_cohort
+    CONSTRAINT_HIERARCHY, validate_intent_for_cohort
 )
+from app.core.hierarchy_index import HIERARCHY_INDEX
 from app.models.chat import RoutingDecision, Provenance
+from app.services.metrics import COMPONENT_METRICS
+from app.services.model_tiers import MODEL_TIERS
+from app.services.pre_router import LexicalPreRouter, PreRouteResult, get_pre_router
+from app.services.routing_cache import RoutingCache
 
 logger = logging.getLogger(__name__)
 
+ROUTING_MODES = ("cascade", "joint", "speculative")
+
+_INTENT_DESCRIPTIONS = {
+    IntentClass.PLAN: "Creating plans, goals, or structured approaches",
+    IntentClass.TASK: "Automating tasks, setting reminders, tracking",
+    IntentClass.OPINION_RESEARCH: "Gathering opinions, comparing philosophies",
+    IntentClass.EVIDENCE_RESEARCH: "Scientific research, studies, evidence"
+}
+
+_CATEGORY_DESCRIPTIONS = {
+    Category.SLEEP: "Related to sleep, rest, recovery, circadian rhythms",
+    Category.NUTRITION: "Related to diet, food, supplements, meal planning",
+    Category.EXERCISE: "Related to physical activity, training, movement"
+}
+
+
+def _default_intent(user_cohort: Cohort) -> IntentClass:
+    """Fallback intent when classification picks a disallowed one"""
+    allowed_intents = CONSTRAINT_HIERARCHY["cohorts"][user_cohort]["allowed_intents"]
+    return allowed_intents[0] if allowed_intents else IntentClass.PLAN
+
 
 class SemanticRouter:
     """Multi-level semantic router for health coaching queries"""
     
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.OPENAI_MODEL
+    def __init__(
+        self,
+        pre_router: Optional[LexicalPreRouter] = None,
+        mode: Optional[str] = None,
+        cache: Optional[RoutingCache] = None,
+        client: Optional[AsyncOpenAI] = None
+    ):
+        self.client = client or AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None
+        )
+        self.models = MODEL_TIERS
+        self.mode = mode or settings.ROUTER_MODE
+        if self.mode not in ROUTING_MODES:
+            logger.warning(f"Unknown routing mode '{self.mode}', using cascade")
+            self.mode = "cascade"
+        self.pre_router = pre_router
+        if self.pre_router is None and settings.PRE_ROUTER_ENABLED:
+            self.pre_router = get_pre_router()
+        self.cache = cache
         
     async def route(
         self,
         query: str,
         user_cohort: Cohort,
-        context: Optional[Dict] = None
+        context: Optional[Dict] = None,
+        on_category: Optional[Callable[[Category], None]] = None
     ) -> RoutingDecision:
         """
         Route query through hierarchy:
+        0. Lexical pre-routing (skips the LLM calls when confident)
         1. Category detection (sleep/nutrition/exercise)
         2. Intent classification (plan/task/research)
         3. Sub-intent identification
+        
+        Steps 1-3 run as three sequential calls in "cascade" mode, as a
+        single structured call in "joint" mode, or with steps 2-3 started
+        speculatively alongside step 1 in "speculative" mode.
+        
+        on_category is called as soon as the category is known, before
+        intent and sub-intent classification finish, so that callers can
+        start category-dependent work early.
+        
+        Stage latencies are recorded in the component metrics under the
+        cohort and the sub-intent that was chosen.
+        """
+        start = time.perf_counter()
+        stage_ms: Dict[str, float] = {}
+        decision = await self._route(query, user_cohort, on_category, stage_ms)
+        
+        labels = {
+            "cohort": user_cohort.value,
+            "sub_intent": decision.sub_intent_id or "general"
+        }
+        succeeded = decision.metadata.get("source") != "fallback"
+        for stage, elapsed_ms in stage_ms.items():
+            COMPONENT_METRICS.record("router", stage, elapsed_ms, success=succeeded, **labels)
+        COMPONENT_METRICS.record(
+            "router", "route", (time.perf_counter() - start) * 1000, success=succeeded, **labels
+        )
+        if self.cache:
+            COMPONENT_METRICS.record_cache(
+                "router", "route", "cache" in decision.metadata, **labels
+            )
+        return decision
+    
+    async def route_without_llm(self, query: str, user_cohort: Cohort) -> RoutingDecision:
+        """
+        Route with no LLM calls, for requests served in degraded mode.
+        
+        Uses a cached decision if there is one, else the pre-router's best
+        match whatever its confidence, else the cohort's default intent.
         """
         try:
-            # Step 1: Detect category
-            category = await self._detect_category(query)
+            if self.cache:
+                cached = await self.cache.get(query, user_cohort)
+                if cached:
+                    return cached
             
-            # Step 2: Classify intent
-            intent_class = await self._classify_intent(query, user_cohort, category)
+            if self.pre_router:
+                pre_route = self.pre_router.score(query, user_cohort)
+                if pre_route.best:
+                    decision = self._pre_routed(pre_route, user_cohort)
+                    decision.metadata["source"] = "pre_router_degraded"
+                    return decision
+        except Exception as e:
+            logger.error(f"Degraded routing error: {str(e)}")
+        
+        intent_class = _default_intent(user_cohort)
+        return RoutingDecision(
+            category=Category.EXERCISE,
+            intent_class=intent_class,
+            sub_intent_id=None,
+            constraints=list(HIERARCHY_INDEX.constraints_for(
+                user_cohort, intent_class, Category.EXERCISE, None
+            )),
+            confidence=0.0,
+            reasoning=f"Degraded routing to {Category.EXERCISE.value} > {intent_class.value}",
+            metadata={"source": "degraded_default"}
+        )
+    
+    def _pre_routed(self, pre_route: PreRouteResult, user_cohort: Cohort) -> RoutingDecision:
+        """Decision for the pre-router's best match"""
+        best = pre_route.best
+        return RoutingDecision(
+            category=best.category,
+            intent_class=best.intent_class,
+            sub_intent_id=best.sub_intent_id,
+            constraints=list(HIERARCHY_INDEX.constraints_for(
+                user_cohort, best.intent_class, best.category, best.sub_intent_id
+            )),
+            confidence=best.confidence,
+            reasoning=(
+                f"Pre-routed to {best.category.value} > "
+                f"{best.intent_class.value} > {best.sub_intent_id}"
+            ),
+            metadata={
+                "source": "pre_router",
+                "candidates": [m.model_dump() for m in pre_route.matches]
+            }
+        )
+    
+    async def _route(
+        self,
+        query: str,
+        user_cohort: Cohort,
+        on_category: Optional[Callable[[Category], None]],
+        stage_ms: Dict[str, float]
+    ) -> RoutingDecision:
+        """Route a query, adding each stage's latency to stage_ms"""
+        try:
+            # Cached decisions skip pre-routing and the LLM entirely
+            if self.cache:
+                stage_start = time.perf_counter()
+                cached = await self.cache.get(query, user_cohort)
+                stage_ms["cache_lookup"] = (time.perf_counter() - stage_start) * 1000
+                if cached:
+                    return cached
             
-            # Validate intent for cohort
-            if not validate_intent_for_cohort(user_cohort, intent_class):
-                # Fallback to allowed intent
-                cohort_data = CONSTRAINT_HIERARCHY["cohorts"][user_cohort]
-                allowed_intents = cohort_data["allowed_intents"]
-                intent_class = allowed_intents[0] if allowed_intents else IntentClass.PLAN
-                
-            # Step 3: Identify sub-intent
-            sub_intent_id = await self._identify_sub_intent(
-                query, category, intent_class, user_cohort
-            )
+            # Step 0: Lexical pre-routing
+            pre_route = None
+            if self.pre_router:
+                stage_start = time.perf_counter()
+                pre_route = self.pre_router.score(query, user_cohort)
+                stage_ms["pre_router"] = (time.perf_counter() - stage_start) * 1000
+                best = pre_route.best
+                if best and best.confidence >= settings.PRE_ROUTER_CONFIDENCE_THRESHOLD:
+                    return self._pre_routed(pre_route, user_cohort)
+            
+            # Steps 1-3: LLM classification
+            llm_start = time.perf_counter()
+            speculation = {}
+            if self.mode == "joint":
+                category, intent_class, sub_intent_id = await self._classify_joint(
+                    query, user_cohort
+                )
+            elif self.mode == "speculative":
+                category, intent_class, sub_intent_id = await self._classify_speculative(
+                    query, user_cohort, pre_route, speculation, on_category
+                )
+            else:
+                category, intent_class, sub_intent_id = await self._classify_cascade(
+                    query, user_cohort, on_category
+                )
+            
+            llm_ms = (time.perf_counter() - llm_start) * 1000
+            stage_ms[f"llm_{self.mode}"] = llm_ms
             
             # Get applicable constraints
-            constraints = get_applicable_constraints(
+            constraints = list(HIERARCHY_INDEX.constraints_for(
                 user_cohort, intent_class, category, sub_intent_id
-            )
+            ))
             
             # Create routing decision
             decision = RoutingDecision(
@@ -66,10 +226,20 @@ class SemanticRouter:
                 intent_class=intent_class,
                 sub_intent_id=sub_intent_id,
                 constraints=constraints,
-                confidence=0.85,  # TODO: Calculate actual confidence
-                reasoning=f"Routed to {category.value} > {intent_class.value} > {sub_intent_id or 'general'}"
+                confidence=self._llm_confidence(
+                    pre_route, category, intent_class, sub_intent_id
+                ),
+                reasoning=f"Routed to {category.value} > {intent_class.value} > {sub_intent_id or 'general'}",
+                metadata={
+                    "source": f"llm_{self.mode}",
+                    "llm_latency_ms": round(llm_ms, 1),
+                    **({"speculation": speculation} if speculation else {})
+                }
             )
             
+            if self.cache:
+                await self.cache.set(query, user_cohort, decision)
+            
             return decision
             
         except Exception as e:
@@ -81,42 +251,284 @@ class SemanticRouter:
                 sub_intent_id=None,
                 constraints=[],
                 confidence=0.0,
-                reasoning=f"Error in routing: {str(e)}"
+                reasoning=f"Error in routing: {str(e)}",
+                metadata={"source": "fallback"}
             )
     
+    async def _classify_cascade(
+        self,
+        query: str,
+        user_cohort: Cohort,
+        on_category: Optional[Callable[[Category], None]] = None
+    ) -> Tuple[Category, IntentClass, Optional[str]]:
+        """Classify category, intent and sub-intent with one LLM call each"""
+        # Step 1: Detect category
+        category = await self._detect_category(query)
+        if on_category:
+            on_category(category)
+        
+        # Step 2: Classify intent
+        intent_class = await self._classify_intent(query, user_cohort, category)
+        
+        # Validate intent for cohort
+        if not validate_intent_for_cohort(user_cohort, intent_class):
+            intent_class = _default_intent(user_cohort)
+            
+        # Step 3: Identify sub-intent
+        sub_intent_id = await self._identify_sub_intent(
+            query, category, intent_class, user_cohort
+        )
+        
+        return category, intent_class, sub_intent_id
+    
+    async def _classify_speculative(
+        self,
+        query: str,
+        user_cohort: Cohort,
+        pre_route: Optional[PreRouteResult],
+        report: Dict,
+        on_category: Optional[Callable[[Category], None]] = None
+    ) -> Tuple[Category, IntentClass, Optional[str]]:
+        """
+        Run the cascade with intent and sub-intent classification started
+        speculatively for the top candidate categories.
+
+        Category detection and one intent -> sub-intent branch per candidate
+        run concurrently; once the category is known the losing branches are
+        cancelled. The report records how much wall-clock time was saved
+        compared with running the winning path sequentially.
+        """
+        start = time.perf_counter()
+        stage_ms: Dict[str, float] = {}
+        
+        async def timed(stage: str, coro):
+            stage_start = time.perf_counter()
+            result = await coro
+            stage_ms[stage] = (time.perf_counter() - stage_start) * 1000
+            return result
+        
+        async def branch(category: Category) -> Tuple[IntentClass, Optional[str]]:
+            intent_class = await timed(
+                f"intent:{category.value}",
+                self._classify_intent(query, user_cohort, category)
+            )
+            if not validate_intent_for_cohort(user_cohort, intent_class):
+                intent_class = _default_intent(user_cohort)
+            sub_intent_id = await timed(
+                f"sub_intent:{category.value}",
+                self._identify_sub_intent(query, category, intent_class, user_cohort)
+            )
+            return intent_class, sub_intent_id
+        
+        if pre_route:
+            candidates = pre_route.rank_categories()
+        else:
+            candidates = list(Category)
+        candidates = candidates[:settings.ROUTER_SPECULATIVE_CATEGORIES]
+        
+        category_task = asyncio.create_task(timed("category", self._detect_category(query)))
+        branches = {category: asyncio.create_task(branch(category)) for category in candidates}
+        try:
+            category = await category_task
+            if on_category:
+                on_category(category)
+            for candidate, task in branches.items():
+                if candidate != category:
+                    task.cancel()
+            speculation_hit = category in branches
+            if speculation_hit:
+                intent_class, sub_intent_id = await branches[category]
+            else:
+                intent_class, sub_intent_id = await branch(category)
+        finally:
+            pending = [task for task in [category_task, *branches.values()] if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*branches.values(), return_exceptions=True)
+        
+        wall_clock_ms = (time.perf_counter() - start) * 1000
+        sequential_ms = (
+            stage_ms.get("category", 0.0) +
+            stage_ms.get(f"intent:{category.value}", 0.0) +
+            stage_ms.get(f"sub_intent:{category.value}", 0.0)
+        )
+        report.update({
+            "candidates": [candidate.value for candidate in candidates],
+            "hit": speculation_hit,
+            "cancelled_branches": len(branches) - (1 if speculation_hit else 0),
+            "wall_clock_ms": round(wall_clock_ms, 1),
+            "sequential_ms": round(sequential_ms, 1),
+            "saved_ms": round(max(0.0, sequential_ms - wall_clock_ms), 1)
+        })
+        logger.info(
+            f"Speculative routing {'hit' if speculation_hit else 'miss'} for "
+            f"{category.value}: saved {report['saved_ms']}ms"
+        )
+        
+        return category, intent_class, sub_intent_id
+    
+    async def _classify_joint(
+        self,
+        query: str,
+        user_cohort: Cohort
+    ) -> Tuple[Category, IntentClass, Optional[str]]:
+        """Classify category, intent and sub-intent in a single function call"""
+        cohort_data = CONSTRAINT_HIERARCHY["cohorts"][user_cohort]
+        allowed_intents = cohort_data["allowed_intents"]
+        
+        sub_intent_table = [
+            (sid, si) for sid, si in HIERARCHY_INDEX.sub_intents.items()
+            if si.parent_intent in allowed_intents
+        ]
+        
+        category_options = "\n".join([
+            f"- {category.value}: {_CATEGORY_DESCRIPTIONS[category]}"
+            for category in Category
+        ])
+        intent_options = "\n".join([
+            f"- {intent.value}: {_INTENT_DESCRIPTIONS[intent]}"
+            for intent in allowed_intents
+        ])
+        sub_intent_options = "\n".join([
+            f"- {sid} [{si.parent_category.value}/{si.parent_intent.value}]: "
+            f"{si.name} - {si.description}"
+            for sid, si in sub_intent_table
+        ])
+        
+        prompt = f"""
+        Route this health-related query by choosing a category, an intent type
+        and, if one fits well, a sub-intent. A sub-intent must belong to the
+        chosen category and intent type; otherwise answer 'none'.
+        
+        Categories:
+        {category_options}
+        
+        Intent types:
+        {intent_options}
+        
+        Sub-intents [category/intent]:
+        {sub_intent_options}
+        
+        User cohort: {user_cohort.value} ({cohort_data['description']})
+        Query: "{query}"
+        """
+        
+        routing_tool = {
+            "type": "function",
+            "function": {
+                "name": "route_query",
+                "description": "Record the routing decision for a health query",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "category": {
+                            "type": "string",
+                            "enum": [category.value for category in Category]
+                        },
+                        "intent_class": {
+                            "type": "string",
+                            "enum": [intent.value for intent in allowed_intents]
+                        },
+                        "sub_intent_id": {
+                            "type": "string",
+                            "enum": [sid for sid, _ in sub_intent_table] + ["none"]
+                        }
+                    },
+                    "required": ["category", "intent_class", "sub_intent_id"]
+                }
+            }
+        }
+        
+        response = await self.models.create(
+            self.client,
+            "joint",
+            messages=[
+                {"role": "system", "content": "You are a hierarchical router for health queries."},
+                {"role": "user", "content": prompt}
+            ],
+            tools=[routing_tool],
+            tool_choice={"type": "function", "function": {"name": "route_query"}},
+            temperature=0.1
+        )
+        
+        tool_calls = response.choices[0].message.tool_calls or []
+        arguments = json.loads(tool_calls[0].function.arguments) if tool_calls else {}
+        
+        # Validate each level the same way the cascade does
+        try:
+            category = Category(str(arguments.get("category", "")).strip().lower())
+        except ValueError:
+            category = Category.EXERCISE
+        
+        try:
+            intent_class = IntentClass(str(arguments.get("intent_class", "")).strip().lower())
+        except ValueError:
+            intent_class = _default_intent(user_cohort)
+        if not validate_intent_for_cohort(user_cohort, intent_class):
+            intent_class = _default_intent(user_cohort)
+        
+        sub_intent_id = arguments.get("sub_intent_id")
+        sub_intent = HIERARCHY_INDEX.sub_intents.get(sub_intent_id or "")
+        if not (sub_intent and
+                sub_intent.parent_category == category and
+                sub_intent.parent_intent == intent_class):
+            sub_intent_id = None
+        
+        return category, intent_class, sub_intent_id
+    
+    def _llm_confidence(
+        self,
+        pre_route: Optional[PreRouteResult],
+        category: Category,
+        intent_class: IntentClass,
+        sub_intent_id: Optional[str]
+    ) -> float:
+        """
+        Confidence for an LLM-routed decision.
+
+        The LLM's choice alone is worth 0.5; the rest is earned by how much of
+        the lexical evidence agrees with the chosen route.
+        """
+        if not pre_route:
+            return 0.5
+        support = pre_route.support(category, intent_class, sub_intent_id)
+        return round(0.5 + 0.5 * support, 4)
+    
     async def _detect_category(self, query: str) -> Category:
         """Detect health category from query"""
+        category_options = "\n".join([
+            f"- {category.value}: {_CATEGORY_DESCRIPTIONS[category]}"
+            for category in Category
+        ])
+        category_names = ", ".join(category.value for category in Category)
+        
         prompt = f"""
         Classify this health-related query into one of these categories:
-        - sleep: Related to sleep, rest, recovery, circadian rhythms
-        - nutrition: Related to diet, food, supplements, meal planning
-        - exercise: Related to physical activity, training, movement
+        {category_options}
         
         Query: "{query}"
         
-        Respond with only the category name (sleep, nutrition, or exercise).
+        Respond with only the category name ({category_names}).
         """
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
+        response = await self.models.create(
+            self.client,
+            "category",
             messages=[
                 {"role": "system", "content": "You are a health query classifier."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.1,
-            max_tokens=10
+            temperature=0.1
         )
         
         category_str = response.choices[0].message.content.strip().lower()
         
         # Map to enum
-        category_map = {
-            "sleep": Category.SLEEP,
-            "nutrition": Category.NUTRITION,
-            "exercise": Category.EXERCISE
-        }
+        for category in _CATEGORY_DESCRIPTIONS:
+            if category.value == category_str:
+                return category
         
-        return category_map.get(category_str, Category.EXERCISE)
+        return Category.EXERCISE
     
     async def _classify_intent(
         self,
@@ -128,16 +540,9 @@ class SemanticRouter:
         cohort_data = CONSTRAINT_HIERARCHY["cohorts"][user_cohort]
         allowed_intents = cohort_data["allowed_intents"]
         
-        intent_descriptions = {
-            IntentClass.PLAN: "Creating plans, goals, or structured approaches",
-            IntentClass.TASK: "Automating tasks, setting reminders, tracking",
-            IntentClass.OPINION_RESEARCH: "Gathering opinions, comparing philosophies",
-            IntentClass.EVIDENCE_RESEARCH: "Scientific research, studies, evidence"
-        }
-        
         # Build prompt with allowed intents only
         intent_options = "\n".join([
-            f"- {intent.value}: {intent_descriptions[intent]}"
+            f"- {intent.value}: {_INTENT_DESCRIPTIONS[intent]}"
             for intent in allowed_intents
         ])
         
@@ -152,14 +557,14 @@ class SemanticRouter:
         Respond with only the intent type name.
         """
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
+        response = await self.models.create(
+            self.client,
+            "intent",
             messages=[
                 {"role": "system", "content": "You are an intent classifier for health queries."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.1,
-            max_tokens=20
+            temperature=0.1
         )
         
         intent_str = response.choices[0].message.content.strip().lower()
@@ -181,12 +586,7 @@ class SemanticRouter:
     ) -> Optional[str]:
         """Identify specific sub-intent if applicable"""
         # Get matching sub-intents
-        matching_sub_intents = []
-        
-        for sub_intent_id, sub_intent in CONSTRAINT_HIERARCHY["sub_intents"].items():
-            if (sub_intent.parent_category == category and 
-                sub_intent.parent_intent == intent_class):
-                matching_sub_intents.append((sub_intent_id, sub_intent))
+        matching_sub_intents = HIERARCHY_INDEX.sub_intents_for(category, intent_class)
         
         if not matching_sub_intents:
             return None
@@ -210,14 +610,14 @@ class SemanticRouter:
         Respond with only the sub-intent ID or 'none'.
         """
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
+        response = await self.models.create(
+            self.client,
+            "sub_intent",
             messages=[
                 {"role": "system", "content": "You are a precise sub-intent classifier."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.1,
-            max_tokens=50
+            temperature=0.1
         )
         
         result = response.choices[0].message.content.strip()
@@ -236,7 +636,8 @@ class SemanticRouter:
         self,
         routing_decision: RoutingDecision,
         user_cohort: Cohort,
-        trace_id: str
+        trace_id: str,
+        context_sources: Optional[Dict[str, str]] = None
     ) -> Provenance:
         """Create provenance data from routing decision"""
         return Provenance(
@@ -244,8 +645,9 @@ class SemanticRouter:
             intent_class=routing_decision.intent_class,
             category=routing_decision.category,
             sub_intent=routing_decision.sub_intent_id,
-            constraints_applied=[c.dict() for c in routing_decision.constraints],
+            constraints_applied=list(HIERARCHY_INDEX.serialize(routing_decision.constraints)),
             confidence=routing_decision.confidence,
             trace_id=trace_id,
-            reasoning=routing_decision.reasoning
+            reasoning=routing_decision.reasoning,
+            context_sources=context_sources or {}
         )
\ No newline at end of file
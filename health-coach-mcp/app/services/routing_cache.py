@@ -0,0 +1,144 @@
+"""
+Two-tier cache for routing decisions
+
+The first tier is a bounded in-process LRU, the second a shared Redis tier
+with TTL. Entries are keyed by normalized query text, cohort and hierarchy
+version, and are stored without constraints so that every hit is rehydrated
+with freshly resolved constraints.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.core.hierarchy import Cohort, HIERARCHY_VERSION
+from app.core.hierarchy_index import HIERARCHY_INDEX
+from app.models.chat import RoutingDecision
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    return " ".join(_WORD_PATTERN.findall(query.lower()))
+
+
+class RoutingCache:
+    """In-process LRU in front of a shared Redis tier"""
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: int = 86400,
+        redis_client: Optional[redis.Redis] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.counters = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "redis_errors": 0
+        }
+
+    def make_key(self, query: str, user_cohort: Cohort) -> str:
+        """Build the cache key for a query and cohort"""
+        digest = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+        return f"routing:{HIERARCHY_VERSION}:{user_cohort.value}:{digest}"
+
+    async def get(self, query: str, user_cohort: Cohort) -> Optional[RoutingDecision]:
+        """Look up a routing decision, promoting Redis hits into the LRU"""
+        key = self.make_key(query, user_cohort)
+
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, payload = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self._rehydrate(payload, user_cohort, "memory")
+            del self._entries[key]
+
+        if self.redis:
+            try:
+                data = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"Routing cache read failed: {str(e)}")
+                self.counters["redis_errors"] += 1
+                data = None
+            if data:
+                payload = json.loads(data)
+                self._remember(key, payload)
+                self.counters["redis_hits"] += 1
+                return self._rehydrate(payload, user_cohort, "redis")
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(
+        self,
+        query: str,
+        user_cohort: Cohort,
+        decision: RoutingDecision
+    ) -> None:
+        """Store a routing decision in both tiers"""
+        key = self.make_key(query, user_cohort)
+        payload = json.loads(decision.json(exclude={"constraints"}))
+        payload["metadata"].pop("cache", None)
+
+        self._remember(key, payload)
+        self.counters["stores"] += 1
+
+        if self.redis:
+            try:
+                await self.redis.set(key, json.dumps(payload), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Routing cache write failed: {str(e)}")
+                self.counters["redis_errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current occupancy"""
+        lookups = (
+            self.counters["memory_hits"] + self.counters["redis_hits"] + self.counters["misses"]
+        )
+        hits = self.counters["memory_hits"] + self.counters["redis_hits"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hierarchy_version": HIERARCHY_VERSION
+        }
+
+    def _remember(self, key: str, payload: Dict[str, Any]) -> None:
+        """Insert into the LRU tier, evicting the least recently used entry"""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _rehydrate(
+        self,
+        payload: Dict[str, Any],
+        user_cohort: Cohort,
+        tier: str
+    ) -> RoutingDecision:
+        """Rebuild a decision with freshly resolved constraints"""
+        decision = RoutingDecision(**payload)
+        decision.constraints = list(HIERARCHY_INDEX.constraints_for(
+            user_cohort, decision.intent_class, decision.category, decision.sub_intent_id
+        ))
+        decision.metadata = {**decision.metadata, "cache": tier}
+        return decision
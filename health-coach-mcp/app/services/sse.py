@@ -0,0 +1,173 @@
+"""
+Server-sent event writer for streaming chat responses
+
+Model deltas are coalesced into response_chunk frames that are flushed when
+the pending text reaches a byte threshold or the flush interval elapses,
+whichever comes first. The first delta is always flushed immediately so
+that coalescing never delays time to first token.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sse_frame(payload: Dict[str, Any]) -> str:
+    """Encode one SSE data frame"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class SSEWriter:
+    """Frame events and coalesce response deltas for one stream"""
+
+    def __init__(
+        self,
+        trace_id: str,
+        flush_interval_ms: Optional[float] = None,
+        flush_bytes: Optional[int] = None
+    ):
+        self.trace_id = trace_id
+        self.flush_interval = (
+            flush_interval_ms if flush_interval_ms is not None
+            else settings.SSE_FLUSH_INTERVAL_MS
+        ) / 1000
+        self.flush_bytes = flush_bytes if flush_bytes is not None else settings.SSE_FLUSH_BYTES
+        self.started_at = time.perf_counter()
+        self._parts: List[str] = []
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._first_token_at: Optional[float] = None
+        self._last_chunk_frame_at: Optional[float] = None
+        self._inter_frame_ms: List[float] = []
+        self.frames = 0
+        self.chunk_frames = 0
+        self.deltas = 0
+
+    @property
+    def text(self) -> str:
+        """Everything streamed so far"""
+        return "".join(self._parts)
+
+    def event(self, event_type: str, **fields: Any) -> str:
+        """Frame a non-chunk event immediately"""
+        self.frames += 1
+        return sse_frame({"type": event_type, **fields, "timestamp": self.trace_id})
+
+    def reset(self) -> None:
+        """Discard the response text so far, e.g. before regenerating"""
+        self._parts = []
+        self._pending = []
+        self._pending_bytes = 0
+
+    def provenance(self, stage: str, data: Dict[str, Any]) -> str:
+        """Frame a provenance stage event"""
+        return self.event("provenance", stage=stage, data=data)
+
+    async def chunks(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Consume model deltas and yield coalesced response_chunk frames.
+
+        While text is pending the next delta is awaited with a timeout rather
+        than cancelled, so pending text is flushed on schedule even when the
+        model pauses.
+        """
+        iterator = deltas.__aiter__()
+        next_delta: Optional[asyncio.Future] = None
+        try:
+            while True:
+                timeout = self._time_to_flush()
+                if timeout is None and next_delta is None:
+                    # Nothing pending, so there is no deadline to race
+                    try:
+                        delta = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                else:
+                    if next_delta is None:
+                        next_delta = asyncio.ensure_future(iterator.__anext__())
+                    done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+                    if not done:
+                        frame = self.flush()
+                        if frame:
+                            yield frame
+                        continue
+
+                    finished, next_delta = next_delta, None
+                    try:
+                        delta = finished.result()
+                    except StopAsyncIteration:
+                        break
+
+                frame = self._add(delta)
+                if frame:
+                    yield frame
+
+            frame = self.flush()
+            if frame:
+                yield frame
+        finally:
+            if next_delta is not None and not next_delta.done():
+                next_delta.cancel()
+                await asyncio.gather(next_delta, return_exceptions=True)
+
+    def flush(self) -> Optional[str]:
+        """Frame any pending text"""
+        if not self._pending:
+            return None
+        chunk = "".join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+
+        now = time.perf_counter()
+        if self._last_chunk_frame_at is not None:
+            self._inter_frame_ms.append((now - self._last_chunk_frame_at) * 1000)
+        self._last_chunk_frame_at = now
+        self.chunk_frames += 1
+        return self.event("response_chunk", chunk=chunk)
+
+    def stats(self) -> Dict[str, Any]:
+        """TTFT and inter-frame latency for this stream"""
+        gaps = sorted(self._inter_frame_ms)
+        ttft_ms = None
+        if self._first_token_at is not None:
+            ttft_ms = round((self._first_token_at - self.started_at) * 1000, 1)
+        return {
+            "ttft_ms": ttft_ms,
+            "frames": self.frames,
+            "deltas": self.deltas,
+            "chunk_frames": self.chunk_frames,
+            "inter_frame_ms": {
+                "mean": round(sum(gaps) / len(gaps), 1) if gaps else None,
+                "p50": round(gaps[len(gaps) // 2], 1) if gaps else None,
+                "p95": round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))], 1) if gaps else None,
+                "max": round(gaps[-1], 1) if gaps else None
+            }
+        }
+
+    def _add(self, delta: str) -> Optional[str]:
+        """Buffer a delta, returning a frame if a flush is due"""
+        if not delta:
+            return None
+        self.deltas += 1
+        self._parts.append(delta)
+        self._pending.append(delta)
+        self._pending_bytes += len(delta.encode())
+
+        if self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+            return self.flush()
+        if self._pending_bytes >= self.flush_bytes or self._time_to_flush() == 0:
+            return self.flush()
+        return None
+
+    def _time_to_flush(self) -> Optional[float]:
+        """Seconds until pending text must be flushed, or None if nothing is pending"""
+        if not self._pending:
+            return None
+        elapsed = time.perf_counter() - (self._last_chunk_frame_at or self.started_at)
+        return max(0.0, self.flush_interval - elapsed)
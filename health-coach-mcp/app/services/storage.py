@@ -1,35 +1,126 @@
 """
 Storage service for conversation traces and evaluation data
+
+Two layouts are supported, selected by TRACE_STORAGE_MODE:
+
+- "log" (default): each message, routing decision and provenance is appended
+  to a per-session Redis list, next to a small metadata key. A turn costs
+  O(new entries) and concurrent turns on one session cannot overwrite each
+  other. Traces are reconstructed from the log when read, and the
+  evaluation key holds a stub pointing at the session. The log and
+  metadata expire after TRACE_TTL_SECONDS, like the blob; the stub holds
+  no conversation content.
+- "blob": the whole trace is re-serialized under trace:{session_id} on every
+  save, with a full evaluation copy under evaluation:{trace_id}.
+
+Reads fall back to the blob layout, so sessions written before switching to
+the log layout stay readable, and the next turn on such a session migrates
+it to the log under its existing trace ID.
+
+Both layouts maintain sorted-set indexes of trace IDs by last update time,
+globally, per user and per route category and intent, which back paginated
+evaluation queries.
+
+When a TraceArchive is attached, Redis is the hot tier: saved sessions are
+queued for write-behind to Postgres, and reads that miss Redis fall through
+to the archive. Saves also leave a long-lived trace:{session_id}:archived
+marker, so opening a session that is new to Redis only queries the archive
+when the session was ever saved.
 """
+import asyncio
 import logging
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, List, Sequence, Tuple
 import json
 import redis.asyncio as redis
-from datetime import datetime
+from datetime import datetime, timezone
 
 from app.core.config import settings
-from app.models.chat import ConversationTrace
+from app.models.chat import ChatMessage, ConversationTrace, Provenance, RoutingDecision
+from app.services.trace_archive import TraceArchive
 
 logger = logging.getLogger(__name__)
 
+TRACE_TTL_SECONDS = 86400 * 7  # 7 days expiry
+EVALUATION_TTL_SECONDS = 86400 * 30  # 30 days for evaluation
+ARCHIVED_MARKER_TTL_SECONDS = 86400 * 365  # sessions reopened from the archive
+
+# Sorted sets of trace IDs scored by last update time
+INDEX_PREFIX = "evaluation_index:"
+
+# Log entry kinds and the trace field each one is appended to
+_ENTRY_FIELDS = {
+    "message": ("messages", ChatMessage),
+    "routing_decision": ("routing_decisions", RoutingDecision),
+    "provenance": ("provenances", Provenance)
+}
+
+
+def _epoch(value: datetime) -> float:
+    """Index score for a datetime, treating naive values as UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _from_epoch(score: float) -> datetime:
+    """Naive UTC datetime for an index score"""
+    return datetime.fromtimestamp(score, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _encode_cursor(score: float, trace_id: str) -> str:
+    """Page cursor for the last trace returned, at its index score"""
+    return f"{score!r}:{trace_id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, Optional[str]]:
+    """Score and trace ID of a cursor; cursors without a trace ID skip every tie"""
+    score, _, trace_id = cursor.partition(":")
+    return float(score), trace_id or None
+
+
+def _json_default(value: Any) -> Any:
+    """Encode datetimes the way the API does"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
 
 class ConversationStorage:
     """Store and retrieve conversation traces"""
     
-    def __init__(self):
-        self.redis = redis.from_url(settings.REDIS_URL)
-        
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        mode: Optional[str] = None,
+        archive: Optional[TraceArchive] = None
+    ):
+        self.redis = redis_client or redis.from_url(settings.REDIS_URL)
+        self.archive = archive
+        self.mode = mode or settings.TRACE_STORAGE_MODE
+        if self.mode not in ("log", "blob"):
+            logger.warning(f"Unknown trace storage mode '{self.mode}', using log")
+            self.mode = "log"
+    
     async def get_trace(self, session_id: str) -> Optional[ConversationTrace]:
         """Get conversation trace by session ID"""
         try:
-            data = await self.redis.get(f"trace:{session_id}")
-            if data:
-                trace_dict = json.loads(data)
-                return ConversationTrace(**trace_dict)
-            return None
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(f"trace:{session_id}:meta")
+                pipe.lrange(f"trace:{session_id}:log", 0, -1)
+                pipe.get(f"trace:{session_id}")
+                meta, entries, blob = await pipe.execute()
+            
+            if meta:
+                return self._replay(json.loads(meta), entries)
+            if blob:
+                trace = ConversationTrace(**json.loads(blob))
+                self._mark_persisted(trace)
+                return trace
         except Exception as e:
             logger.error(f"Error getting trace: {str(e)}")
             return None
+        return await self._get_archived(session_id=session_id)
     
     async def get_or_create_trace(
         self,
@@ -40,7 +131,7 @@ class ConversationStorage:
         trace = await self.get_trace(session_id)
         if trace:
             return trace
-            
+        
         # Create new trace
         trace = ConversationTrace(
             session_id=session_id,
@@ -49,55 +140,506 @@ class ConversationStorage:
         await self.save_trace(trace)
         return trace
     
-    async def save_trace(self, trace: ConversationTrace) -> None:
-        """Save conversation trace"""
+    async def open_trace(
+        self,
+        session_id: str,
+        user_id: str
+    ) -> ConversationTrace:
+        """
+        Get a trace to append a turn to.
+        
+        In log mode only the session metadata is read; the returned trace
+        has no history and save_trace appends whatever is added to it. A
+        session stored as a blob is migrated to the log first, and one that
+        has aged out of Redis is restored from the archive. In blob mode
+        this is get_or_create_trace.
+        
+        When the stored session cannot be read, the trace returned is
+        detached: save_trace skips it rather than record the turn under a
+        new trace ID.
+        """
+        if self.mode != "log":
+            return await self.get_or_create_trace(session_id, user_id)
+        
         try:
-            data = trace.model_dump_json()
-            await self.redis.set(
-                f"trace:{trace.session_id}",
-                data,
-                ex=86400 * 7  # 7 days expiry
-            )
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(f"trace:{session_id}:meta")
+                pipe.get(f"trace:{session_id}")
+                pipe.exists(f"trace:{session_id}:archived")
+                meta, blob, archived = await pipe.execute()
+            if meta:
+                return self._replay(json.loads(meta), [])
+            if blob:
+                # Written before the log layout; keep its history and trace ID
+                legacy = ConversationTrace(**json.loads(blob))
+                await self._restore(legacy)
+                await self.redis.delete(f"trace:{session_id}")
+                return self._replay(self._meta(legacy), [])
+            if archived and self.archive:
+                trace = await asyncio.wait_for(
+                    self.archive.get_by_session(session_id),
+                    settings.TRACE_ARCHIVE_LOOKUP_TIMEOUT_SECONDS
+                )
+                if trace:
+                    await self._restore(trace)
+                    return self._replay(self._meta(trace), [])
             
-            # Also save for evaluation access
-            await self.redis.set(
-                f"evaluation:{trace.trace_id}",
-                trace.to_evaluation_format(),
-                ex=86400 * 30  # 30 days for evaluation
+            trace = ConversationTrace(session_id=session_id, user_id=user_id)
+            created = await self.redis.set(
+                f"trace:{session_id}:meta",
+                json.dumps(self._meta(trace)),
+                ex=TRACE_TTL_SECONDS,
+                nx=True
             )
-            
+            if not created:
+                # Opened concurrently by another turn
+                data = await self.redis.get(f"trace:{session_id}:meta")
+                trace = self._replay(json.loads(data), [])
+            return trace
+        except Exception as e:
+            logger.error(f"Error opening trace, turn will not be saved: {type(e).__name__} {str(e)}")
+            trace = ConversationTrace(session_id=session_id, user_id=user_id)
+            trace._detached = True
+            return trace
+    
+    async def save_trace(self, trace: ConversationTrace) -> None:
+        """Save conversation trace"""
+        if trace._detached:
+            logger.warning(f"Not saving detached trace for session {trace.session_id}")
+            return
+        try:
+            if self.mode == "log":
+                await self._append(trace)
+            else:
+                await self._save_blob(trace)
         except Exception as e:
             logger.error(f"Error saving trace: {str(e)}")
+            return
+        
+        if self.archive:
+            self.archive.enqueue(trace.session_id)
+    
+    async def get_evaluation_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """Get a trace in evaluation format by trace ID"""
+        data = await self.redis.get(f"evaluation:{trace_id}")
+        if data:
+            return await self._resolve_evaluation(json.loads(data))
+        trace = await self._get_archived(trace_id=trace_id)
+        return self._evaluation_format(trace) if trace else None
     
     async def get_traces_for_evaluation(
         self,
         user_id: Optional[str] = None,
-        limit: int = 50
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        category: Optional[str] = None,
+        intent: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Get traces formatted for evaluation"""
+        """
+        Get traces formatted for evaluation, most recently updated first.
+        
+        Reads walk a sorted-set index (per user, per route or global) and
+        fetch the matching traces with MGET. Once Redis runs out, the page
+        continues from the archive below the last index entry seen, using
+        the same cursor. Pass the returned next_cursor back as cursor to get
+        the next page.
+        
+        Traces are ordered by score, then by trace ID, both descending. The
+        cursor holds both, so traces updated at the same instant are neither
+        skipped nor repeated across pages.
+        """
         try:
-            pattern = f"evaluation:*"
-            keys = []
+            indexes = [
+                key for key, wanted in (
+                    (f"{INDEX_PREFIX}user:{user_id}", user_id),
+                    (f"{INDEX_PREFIX}category:{category}", category),
+                    (f"{INDEX_PREFIX}intent:{intent}", intent)
+                ) if wanted
+            ] or [f"{INDEX_PREFIX}all"]
+            primary, filters = indexes[0], indexes[1:]
             
-            async for key in self.redis.scan_iter(match=pattern):
-                keys.append(key)
-                if len(keys) >= limit:
-                    break
+            # Last index entry seen, as (score, trace ID); ties are re-read and skipped up to it
+            after = _decode_cursor(cursor) if cursor else None
+            max_score = after[0] if after else (_epoch(end) if end else "+inf")
+            min_score = _epoch(start) if start else "-inf"
+            batch_size = max(limit, 1) * 2
+            offset = 0
+            # Upper bound for the archive if Redis runs out
+            floor = after or ((_epoch(end), None) if end else None)
             
-            traces = []
-            for key in keys:
-                data = await self.redis.get(key)
-                if data:
-                    trace_data = json.loads(data)
-                    if not user_id or trace_data.get("user_id") == user_id:
+            traces: List[Dict[str, Any]] = []
+            next_cursor = None
+            while len(traces) < limit:
+                batch = await self.redis.zrevrangebyscore(
+                    primary, max_score, min_score,
+                    start=offset, num=batch_size, withscores=True
+                )
+                unseen = [
+                    (member.decode() if isinstance(member, bytes) else member, score)
+                    for member, score in batch
+                ]
+                if after:
+                    unseen = [
+                        (member, score) for member, score in unseen
+                        if score != after[0] or (after[1] is not None and member < after[1])
+                    ]
+                
+                if unseen:
+                    floor = (unseen[-1][1], unseen[-1][0])
+                    candidates = unseen
+                    if filters:
+                        async with self.redis.pipeline(transaction=False) as pipe:
+                            for member, _ in unseen:
+                                for key in filters:
+                                    pipe.zscore(key, member)
+                            scores = await pipe.execute()
+                        candidates = [
+                            entry for n, entry in enumerate(unseen)
+                            if all(
+                                score is not None
+                                for score in scores[n * len(filters):(n + 1) * len(filters)]
+                            )
+                        ]
+                    
+                    for (member, score), trace_data in zip(
+                        candidates, await self._load_evaluations(candidates)
+                    ):
+                        if trace_data is None:
+                            continue
                         traces.append(trace_data)
+                        next_cursor = _encode_cursor(score, member)
+                        if len(traces) >= limit:
+                            break
+                    
+                    if len(traces) >= limit:
+                        break
+                if len(batch) < batch_size:
+                    next_cursor = None
+                    break
+                if unseen:
+                    after, offset = floor, 0
+                    max_score = after[0]
+                else:
+                    # A full batch of ties already seen; read past them
+                    offset += len(batch)
+            
+            if len(traces) < limit and self.archive:
+                archived, next_cursor = await self._query_archive(
+                    limit - len(traces), floor, user_id, start, category, intent
+                )
+                traces.extend(archived)
             
             return {
                 "traces": traces,
                 "count": len(traces),
+                "next_cursor": next_cursor,
                 "generated_at": datetime.utcnow().isoformat()
             }
-            
+        
         except Exception as e:
             logger.error(f"Error getting evaluation traces: {str(e)}")
-            return {"traces": [], "count": 0}
\ No newline at end of file
+            return {"traces": [], "count": 0, "next_cursor": None}
+    
+    async def rebuild_indexes(self) -> int:
+        """Index evaluation traces written before indexes existed"""
+        indexed = 0
+        async for key in self.redis.scan_iter(match="evaluation:*", count=500):
+            data = await self.redis.get(key)
+            if not data:
+                continue
+            trace_data = json.loads(data)
+            routes = []
+            if trace_data.get("storage") == "log":
+                trace = await self.get_trace(trace_data["session_id"])
+                if trace:
+                    routes = [(d.category.value, d.intent_class.value) for d in trace.routing_decisions]
+            else:
+                for path in trace_data.get("hierarchy_paths", []):
+                    parts = dict(part.split(":", 1) for part in path.split(" > "))
+                    routes.append((parts.get("category"), parts.get("intent")))
+            
+            updated_at = trace_data.get("updated_at") or trace_data.get("created_at")
+            score = _epoch(datetime.fromisoformat(updated_at))
+            async with self.redis.pipeline(transaction=False) as pipe:
+                self._index(pipe, trace_data["trace_id"], trace_data.get("user_id"), routes, score)
+                await pipe.execute()
+            indexed += 1
+        
+        logger.info(f"Rebuilt evaluation indexes for {indexed} traces")
+        return indexed
+    
+    async def _save_blob(self, trace: ConversationTrace) -> None:
+        """Re-serialize the whole trace and its evaluation copy"""
+        async with self.redis.pipeline() as pipe:
+            pipe.set(
+                f"trace:{trace.session_id}",
+                trace.model_dump_json(),
+                ex=TRACE_TTL_SECONDS
+            )
+            
+            # Also save for evaluation access
+            pipe.set(
+                f"evaluation:{trace.trace_id}",
+                json.dumps(trace.to_evaluation_format(), default=_json_default),
+                ex=EVALUATION_TTL_SECONDS
+            )
+            self._index(
+                pipe, trace.trace_id, trace.user_id,
+                [(d.category.value, d.intent_class.value) for d in trace.routing_decisions],
+                time.time()
+            )
+            self._mark_archived(pipe, trace.session_id)
+            await pipe.execute()
+    
+    async def _append(self, trace: ConversationTrace) -> None:
+        """Append entries added since the trace was loaded, in one pipeline"""
+        persisted = trace._persisted
+        entries = []
+        for kind, (field, _) in _ENTRY_FIELDS.items():
+            for item in getattr(trace, field)[persisted.get(field, 0):]:
+                entries.append(f'{{"kind":"{kind}","data":{item.model_dump_json()}}}')
+        
+        session_id = trace.session_id
+        meta = self._meta(trace)
+        now = datetime.utcnow()
+        new_decisions = trace.routing_decisions[persisted.get("routing_decisions", 0):]
+        async with self.redis.pipeline() as pipe:
+            pipe.set(f"trace:{session_id}:meta", json.dumps(meta), ex=TRACE_TTL_SECONDS, nx=True)
+            if entries:
+                pipe.rpush(f"trace:{session_id}:log", *entries)
+            pipe.expire(f"trace:{session_id}:log", TRACE_TTL_SECONDS)
+            pipe.expire(f"trace:{session_id}:meta", TRACE_TTL_SECONDS)
+            pipe.set(
+                f"evaluation:{trace.trace_id}",
+                json.dumps({
+                    **meta,
+                    "storage": "log",
+                    "updated_at": now.isoformat()
+                }),
+                ex=EVALUATION_TTL_SECONDS
+            )
+            self._index(
+                pipe, trace.trace_id, trace.user_id,
+                [(d.category.value, d.intent_class.value) for d in new_decisions],
+                _epoch(now)
+            )
+            self._mark_archived(pipe, trace.session_id)
+            await pipe.execute()
+        
+        self._mark_persisted(trace)
+    
+    async def load_for_archive(
+        self,
+        session_ids: Sequence[str]
+    ) -> List[Tuple[ConversationTrace, datetime]]:
+        """
+        Load traces for the archive worker with their last update times.
+        
+        Update times come from the global index score so archived rows sort
+        and paginate on the same scale as Redis.
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.get(f"trace:{session_id}:meta")
+                pipe.lrange(f"trace:{session_id}:log", 0, -1)
+                pipe.get(f"trace:{session_id}")
+            replies = await pipe.execute()
+        
+        traces = []
+        for n in range(len(session_ids)):
+            meta, entries, blob = replies[3 * n:3 * n + 3]
+            if meta:
+                traces.append(self._replay(json.loads(meta), entries))
+            elif blob:
+                traces.append(ConversationTrace(**json.loads(blob)))
+        if not traces:
+            return []
+        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for trace in traces:
+                pipe.zscore(f"{INDEX_PREFIX}all", trace.trace_id)
+            scores = await pipe.execute()
+        now = time.time()
+        return [
+            (trace, _from_epoch(score if score is not None else now))
+            for trace, score in zip(traces, scores)
+        ]
+    
+    async def _get_archived(
+        self,
+        session_id: Optional[str] = None,
+        trace_id: Optional[str] = None
+    ) -> Optional[ConversationTrace]:
+        """Read a trace from the archive, if one is attached"""
+        if not self.archive:
+            return None
+        try:
+            if session_id:
+                return await self.archive.get_by_session(session_id)
+            return await self.archive.get_by_trace_id(trace_id)
+        except Exception as e:
+            logger.error(f"Error reading archived trace: {str(e)}")
+            return None
+    
+    async def _restore(self, trace: ConversationTrace) -> None:
+        """Write an archived trace back to the Redis log"""
+        await self.redis.set(
+            f"trace:{trace.session_id}:meta",
+            json.dumps(self._meta(trace)),
+            ex=TRACE_TTL_SECONDS
+        )
+        await self.redis.delete(f"trace:{trace.session_id}:log")
+        trace._persisted = {}
+        await self._append(trace)
+    
+    async def _query_archive(
+        self,
+        limit: int,
+        before: Optional[Tuple[float, Optional[str]]],
+        user_id: Optional[str],
+        start: Optional[datetime],
+        category: Optional[str],
+        intent: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Continue an evaluation page from the archive, below a (score, trace
+        ID) position.
+        
+        Traces still indexed in Redis were already returned from there, at
+        their newer score, so they are skipped here.
+        """
+        traces: List[Dict[str, Any]] = []
+        next_cursor = None
+        try:
+            while len(traces) < limit:
+                rows = await self.archive.query(
+                    before=_from_epoch(before[0]) if before else None,
+                    before_trace_id=before[1] if before else None,
+                    limit=limit * 2,
+                    user_id=user_id,
+                    start=start,
+                    category=category,
+                    intent=intent
+                )
+                if not rows:
+                    return traces, None
+                
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for trace, _ in rows:
+                        pipe.zscore(f"{INDEX_PREFIX}all", trace.trace_id)
+                    hot = await pipe.execute()
+                
+                for (trace, updated_at), score in zip(rows, hot):
+                    before = (_epoch(updated_at), trace.trace_id)
+                    if score is not None:
+                        continue
+                    traces.append(self._evaluation_format(trace))
+                    next_cursor = _encode_cursor(*before)
+                    if len(traces) >= limit:
+                        return traces, next_cursor
+                if len(rows) < limit * 2:
+                    return traces, None
+        except Exception as e:
+            logger.error(f"Error querying trace archive: {str(e)}")
+        return traces, next_cursor
+    
+    def _index(
+        self,
+        pipe,
+        trace_id: str,
+        user_id: Optional[str],
+        routes: List[Tuple[Optional[str], Optional[str]]],
+        score: float
+    ) -> None:
+        """Queue index updates for a trace and trim expired members"""
+        keys = [f"{INDEX_PREFIX}all"]
+        if user_id:
+            keys.append(f"{INDEX_PREFIX}user:{user_id}")
+        for category, intent in routes:
+            if category:
+                keys.append(f"{INDEX_PREFIX}category:{category}")
+            if intent:
+                keys.append(f"{INDEX_PREFIX}intent:{intent}")
+        
+        for key in dict.fromkeys(keys):
+            pipe.zadd(key, {trace_id: score})
+            # Evaluation keys expire, so index members older than that are stale
+            pipe.zremrangebyscore(key, "-inf", score - EVALUATION_TTL_SECONDS)
+            pipe.expire(key, EVALUATION_TTL_SECONDS)
+    
+    def _mark_archived(self, pipe, session_id: str) -> None:
+        """Queue the marker that lets open_trace look the session up in the archive"""
+        if self.archive:
+            pipe.set(f"trace:{session_id}:archived", 1, ex=ARCHIVED_MARKER_TTL_SECONDS)
+    
+    async def _load_evaluations(
+        self,
+        entries: List[Tuple[bytes, float]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """MGET evaluation payloads for index entries and expand log stubs"""
+        if not entries:
+            return []
+        trace_ids = [member.decode() if isinstance(member, bytes) else member for member, _ in entries]
+        payloads = await self.redis.mget([f"evaluation:{trace_id}" for trace_id in trace_ids])
+        
+        results: List[Optional[Dict[str, Any]]] = []
+        stubs: Dict[int, str] = {}
+        for position, data in enumerate(payloads):
+            trace_data = json.loads(data) if data else None
+            if trace_data and trace_data.get("storage") == "log":
+                stubs[position] = trace_data["session_id"]
+            results.append(trace_data)
+        
+        if stubs:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for session_id in stubs.values():
+                    pipe.get(f"trace:{session_id}:meta")
+                    pipe.lrange(f"trace:{session_id}:log", 0, -1)
+                replies = await pipe.execute()
+            for n, position in enumerate(stubs):
+                meta, log_entries = replies[2 * n], replies[2 * n + 1]
+                results[position] = self._evaluation_format(
+                    self._replay(json.loads(meta), log_entries)
+                ) if meta else None
+        return results
+    
+    def _evaluation_format(self, trace: ConversationTrace) -> Dict[str, Any]:
+        """Evaluation format with JSON-safe values"""
+        return json.loads(json.dumps(trace.to_evaluation_format(), default=_json_default))
+    
+    async def _resolve_evaluation(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Expand a log-mode evaluation stub into the full evaluation format"""
+        if data.get("storage") != "log":
+            return data
+        trace = await self.get_trace(data["session_id"])
+        if not trace:
+            return None
+        return self._evaluation_format(trace)
+    
+    def _replay(self, meta: Dict[str, Any], entries: List[bytes]) -> ConversationTrace:
+        """Rebuild a trace from its metadata and log entries"""
+        fields: Dict[str, list] = {field: [] for field, _ in _ENTRY_FIELDS.values()}
+        for raw in entries:
+            entry = json.loads(raw)
+            field, model = _ENTRY_FIELDS[entry["kind"]]
+            fields[field].append(model(**entry["data"]))
+        trace = ConversationTrace(**meta, **fields)
+        self._mark_persisted(trace)
+        return trace
+    
+    def _meta(self, trace: ConversationTrace) -> Dict[str, Any]:
+        """Session metadata stored next to the log"""
+        return {
+            "trace_id": trace.trace_id,
+            "session_id": trace.session_id,
+            "user_id": trace.user_id,
+            "created_at": trace.created_at.isoformat()
+        }
+    
+    def _mark_persisted(self, trace: ConversationTrace) -> None:
+        """Record how many entries of each kind are already stored"""
+        trace._persisted = {
+            field: len(getattr(trace, field)) for field, _ in _ENTRY_FIELDS.values()
+        }
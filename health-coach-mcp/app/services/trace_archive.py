@@ -0,0 +1,325 @@
+"""
+Write-behind archive of conversation traces in Postgres
+
+Redis is the hot tier for traces. Whenever a turn is saved its session ID is
+queued here; a background worker drains the queue in batches, loads the
+current traces from Redis and upserts them into Postgres with a single
+INSERT ... ON CONFLICT per batch. A batch the database rejects is split in
+halves to isolate the rows at fault; sessions that keep failing are retried
+a bounded number of times and then abandoned. Reads that miss Redis fall
+through to the archive, so evaluation queries can reach past the Redis TTLs.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+
+from app.models.chat import ConversationTrace
+from app.models.trace import TraceRecord
+
+logger = logging.getLogger(__name__)
+
+# Loads the current traces for a batch of session IDs, with their update times
+TraceLoader = Callable[[Sequence[str]], Awaitable[List[Tuple[ConversationTrace, datetime]]]]
+
+
+class TraceArchive:
+    """Bounded write-behind queue in front of the conversation_traces table"""
+
+    def __init__(
+        self,
+        session_factory,
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 5.0,
+        max_attempts: int = 5
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._queued: Set[str] = set()
+        # Failed flush attempts per session still being retried
+        self._attempts: Dict[str, int] = {}
+        self._loader: Optional[TraceLoader] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Batch being collected and flush in flight, finished by stop()
+        self._batch: List[str] = []
+        self._flushing: Optional[asyncio.Future] = None
+        self.counters = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "archived": 0,
+            "flush_errors": 0,
+            "retried": 0,
+            "abandoned": 0,
+            "max_queue_depth": 0,
+            "last_flush_ms": 0.0,
+            "last_batch_size": 0
+        }
+
+    def start(self, loader: TraceLoader) -> None:
+        """Start the background flush worker"""
+        self._loader = loader
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker after flushing everything still queued"""
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        if self._flushing:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+        batch, self._batch = self._batch, []
+        while batch or not self._queue.empty():
+            batch.extend(self._drain(self.batch_size - len(batch)))
+            flushed = await self._flush(batch)
+            batch = []
+            if not flushed:
+                logger.warning(f"{self._queue.qsize()} traces left unarchived at shutdown")
+                break
+
+    def enqueue(self, session_id: str) -> None:
+        """
+        Queue a session for archiving without blocking the request.
+
+        A session already waiting is not queued twice, since the flush reads
+        its latest state anyway. When the queue is full the session is
+        dropped and counted; Redis still holds it and the next turn on the
+        session queues it again.
+        """
+        if session_id in self._queued:
+            self.counters["coalesced"] += 1
+        elif self._put(session_id):
+            self.counters["enqueued"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and flush counters"""
+        return {
+            **self.counters,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "running": bool(self._worker and not self._worker.done())
+        }
+
+    async def get_by_session(self, session_id: str) -> Optional[ConversationTrace]:
+        """Load an archived trace by session ID"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(TraceRecord.data).where(TraceRecord.session_id == session_id)
+            )
+            data = result.scalar_one_or_none()
+        return ConversationTrace(**data) if data else None
+
+    async def get_by_trace_id(self, trace_id: str) -> Optional[ConversationTrace]:
+        """Load an archived trace by trace ID"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(TraceRecord.data).where(TraceRecord.trace_id == trace_id)
+            )
+            data = result.scalar_one_or_none()
+        return ConversationTrace(**data) if data else None
+
+    async def query(
+        self,
+        before: Optional[datetime],
+        limit: int,
+        user_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        category: Optional[str] = None,
+        intent: Optional[str] = None,
+        before_trace_id: Optional[str] = None
+    ) -> List[Tuple[ConversationTrace, datetime]]:
+        """
+        Archived traces updated before a point in time, newest first.
+        
+        Ties are ordered by trace ID, descending; with before_trace_id only
+        traces after it in that order are returned at the before time.
+        """
+        statement = select(TraceRecord.data, TraceRecord.updated_at)
+        if before and before_trace_id:
+            statement = statement.where(or_(
+                TraceRecord.updated_at < before,
+                and_(TraceRecord.updated_at == before, TraceRecord.trace_id < before_trace_id)
+            ))
+        elif before:
+            statement = statement.where(TraceRecord.updated_at < before)
+        if start:
+            statement = statement.where(TraceRecord.updated_at >= start)
+        if user_id:
+            statement = statement.where(TraceRecord.user_id == user_id)
+        if category:
+            statement = statement.where(TraceRecord.categories.contains([category]))
+        if intent:
+            statement = statement.where(TraceRecord.intents.contains([intent]))
+        statement = statement.order_by(
+            TraceRecord.updated_at.desc(), TraceRecord.trace_id.desc()
+        ).limit(limit)
+
+        async with self.session_factory() as session:
+            result = await session.execute(statement)
+            rows = result.all()
+        return [(ConversationTrace(**data), updated_at) for data, updated_at in rows]
+
+    async def _run(self) -> None:
+        """Flush when a batch fills up or the flush interval elapses"""
+        while True:
+            self._batch = batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._batch = []
+            # Shielded so that stopping the worker never abandons a batch
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            if not await asyncio.shield(self._flushing):
+                # Back off rather than retrying a failing database in a loop
+                await asyncio.sleep(self.flush_interval)
+
+    def _put(self, session_id: str) -> bool:
+        """Add a session to the queue, counting it as dropped if full"""
+        try:
+            self._queue.put_nowait(session_id)
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            return False
+        self._queued.add(session_id)
+        self.counters["max_queue_depth"] = max(
+            self.counters["max_queue_depth"], self._queue.qsize()
+        )
+        return True
+
+    def _drain(self, limit: int) -> List[str]:
+        """Take up to limit queued session IDs without waiting"""
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, session_ids: List[str]) -> bool:
+        """Load a batch from Redis and upsert it into Postgres"""
+        if not session_ids:
+            return True
+        # Sessions saved again from here on need another flush
+        self._queued.difference_update(session_ids)
+        start = time.perf_counter()
+        traces: List[Tuple[ConversationTrace, datetime]] = []
+        try:
+            traces = await self._loader(session_ids)
+        except Exception as e:
+            logger.error(f"Loading {len(session_ids)} sessions for the trace archive failed: {str(e)}")
+            failed = list(session_ids)
+        else:
+            failed = []
+            if traces and not await self._try_upsert(traces):
+                failed = await self._bisect(traces)
+
+        for session_id in set(session_ids).difference(failed):
+            self._attempts.pop(session_id, None)
+        if failed:
+            self.counters["flush_errors"] += 1
+            self._retry(failed)
+
+        written = len(traces) - len(failed) if traces else 0
+        if written:
+            self.counters["flushes"] += 1
+            self.counters["archived"] += written
+            self.counters["last_batch_size"] = written
+            self.counters["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return not failed
+
+    async def _bisect(self, traces: List[Tuple[ConversationTrace, datetime]]) -> List[str]:
+        """
+        Split a rejected batch to write the rows that can be written.
+
+        Returns the session IDs left unwritten. When both halves fail the
+        database is more likely at fault than the rows, so splitting stops.
+        """
+        if len(traces) == 1:
+            return [traces[0][0].session_id]
+        middle = len(traces) // 2
+        first, second = traces[:middle], traces[middle:]
+        first_written = await self._try_upsert(first)
+        second_written = await self._try_upsert(second)
+        if not first_written and not second_written:
+            return [trace.session_id for trace, _ in traces]
+        failed = []
+        if not first_written:
+            failed.extend(await self._bisect(first))
+        if not second_written:
+            failed.extend(await self._bisect(second))
+        return failed
+
+    async def _try_upsert(self, traces: List[Tuple[ConversationTrace, datetime]]) -> bool:
+        """Upsert a batch, logging rather than raising on failure"""
+        try:
+            await self._upsert(traces)
+        except Exception as e:
+            logger.error(f"Trace archive upsert of {len(traces)} sessions failed: {str(e)}")
+            return False
+        return True
+
+    def _retry(self, session_ids: List[str]) -> None:
+        """Queue failed sessions again, abandoning those out of attempts"""
+        for session_id in session_ids:
+            attempts = self._attempts.pop(session_id, 0) + 1
+            if attempts >= self.max_attempts:
+                # Redis still holds the session; its next turn queues it afresh
+                self.counters["abandoned"] += 1
+                logger.error(f"Abandoned archiving session {session_id} after {attempts} attempts")
+                continue
+            # Sessions saved again meanwhile are already queued
+            if session_id in self._queued or self._put(session_id):
+                self._attempts[session_id] = attempts
+                self.counters["retried"] += 1
+
+    async def _upsert(self, traces: List[Tuple[ConversationTrace, datetime]]) -> None:
+        """
+        Bulk INSERT ... ON CONFLICT DO UPDATE, keeping the newest version.
+
+        Rows are matched on session ID, which is unique, so a session that
+        was given a new trace ID replaces its old row rather than failing.
+        """
+        rows = []
+        for trace, updated_at in traces:
+            rows.append({
+                "trace_id": trace.trace_id,
+                "session_id": trace.session_id,
+                "user_id": trace.user_id,
+                "created_at": trace.created_at,
+                "updated_at": updated_at,
+                "message_count": len(trace.messages),
+                "categories": sorted({d.category.value for d in trace.routing_decisions}),
+                "intents": sorted({d.intent_class.value for d in trace.routing_decisions}),
+                "data": trace.model_dump(mode="json")
+            })
+
+        statement = insert(TraceRecord).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[TraceRecord.session_id],
+            set_={
+                column: statement.excluded[column]
+                for column in (
+                    "trace_id", "user_id", "created_at", "updated_at",
+                    "message_count", "categories", "intents", "data"
+                )
+            },
+            where=TraceRecord.updated_at <= statement.excluded.updated_at
+        )
+        async with self.session_factory() as session:
+            await session.execute(statement)
+            await session.commit()
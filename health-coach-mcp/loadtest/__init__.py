@@ -0,0 +1,3 @@
+"""
+Offline load testing for Health Coach MCP
+"""
@@ -0,0 +1,282 @@
+"""
+Load-test driver for the chat endpoints
+
+Replays SyntheticDataGenerator queries against /chat and /chat/stream with
+a fixed number of concurrent clients, each sending its next request as soon
+as the previous one finishes. The JSON report covers, per endpoint:
+- throughput and error rates by cause;
+- client-side latency percentiles, with time to first response chunk for
+  streams;
+- percentiles of the server's own stage timings.
+
+    python -m loadtest.driver --base-url http://localhost:8130 --concurrency 32 --requests 500 --output report.json
+
+Requests carry the user's id in their context by default, so the profile,
+belief and health data retrievers run. --anonymous sends them without it,
+which exercises the response cache.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import uuid4
+
+import httpx
+
+from app.evaluation.synthetic_data import SyntheticDataGenerator
+
+ENDPOINTS = {
+    "chat": "/chat/",
+    "stream": "/chat/stream"
+}
+
+
+@dataclass
+class Sample:
+    """Outcome of one request"""
+    ok: bool
+    latency_ms: float
+    ttft_ms: Optional[float] = None
+    error: Optional[str] = None
+    degraded: bool = False
+    timings_ms: Dict[str, Any] = field(default_factory=dict)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Mean, p50, p95, p99 and max, nearest rank"""
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+    return {
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "max": round(ordered[-1], 1)
+    }
+
+
+def build_requests(count: int, seed: int, personalized: bool) -> List[Dict[str, Any]]:
+    """Chat request bodies from synthetic queries, each sent by a user of its cohort"""
+    generator = SyntheticDataGenerator(seed=seed)
+    users = generator.generate_users(max(10, count // 10))
+    queries = generator.generate_queries(count)
+    by_cohort: Dict[str, Iterator[str]] = {}
+    for cohort in {user.cohort for user in users}:
+        by_cohort[cohort.value] = itertools.cycle(
+            [user.user_id for user in users if user.cohort == cohort]
+        )
+    fallback = itertools.cycle([user.user_id for user in users])
+
+    bodies = []
+    for query in queries:
+        user_id = next(by_cohort.get(query.user_cohort.value, fallback))
+        bodies.append({
+            "message": query.text,
+            "user_id": user_id,
+            "cohort": query.user_cohort.value,
+            "context": {**query.context, "user_id": user_id} if personalized else dict(query.context),
+            "include_provenance": True
+        })
+    return bodies
+
+
+async def send_chat(client: httpx.AsyncClient, body: Dict[str, Any]) -> Sample:
+    """POST /chat and wait for the whole response"""
+    start = time.perf_counter()
+    try:
+        response = await client.post(ENDPOINTS["chat"], json=body)
+    except httpx.HTTPError as e:
+        return Sample(False, (time.perf_counter() - start) * 1000, error=type(e).__name__)
+    latency_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        return Sample(False, latency_ms, error=f"http_{response.status_code}")
+    metadata = response.json().get("metadata", {})
+    return Sample(
+        True,
+        latency_ms,
+        degraded=bool(metadata.get("degraded")),
+        timings_ms=metadata.get("timings_ms", {})
+    )
+
+
+async def send_stream(client: httpx.AsyncClient, body: Dict[str, Any]) -> Sample:
+    """POST /chat/stream, timing the first response chunk and the complete event"""
+    start = time.perf_counter()
+    ttft_ms = None
+    complete: Optional[Dict[str, Any]] = None
+    error = None
+    try:
+        async with client.stream("POST", ENDPOINTS["stream"], json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return Sample(
+                    False, (time.perf_counter() - start) * 1000, error=f"http_{response.status_code}"
+                )
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event.get("type") == "response_chunk" and ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                elif event.get("type") == "complete":
+                    complete = event
+                elif event.get("type") == "error":
+                    error = "stream_error"
+    except httpx.HTTPError as e:
+        return Sample(False, (time.perf_counter() - start) * 1000, ttft_ms, error=type(e).__name__)
+    latency_ms = (time.perf_counter() - start) * 1000
+    if error or complete is None:
+        return Sample(False, latency_ms, ttft_ms, error=error or "incomplete_stream")
+    return Sample(
+        True,
+        latency_ms,
+        ttft_ms,
+        degraded=bool(complete.get("degraded")),
+        timings_ms=complete.get("timings_ms", {})
+    )
+
+
+def summarize(samples: List[Sample], elapsed: float, streaming: bool) -> Dict[str, Any]:
+    """Report section for one endpoint"""
+    succeeded = [sample for sample in samples if sample.ok]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if not sample.ok:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+
+    # Stage timings are milliseconds since request entry; nested values are skipped
+    stages: Dict[str, List[float]] = {}
+    for sample in succeeded:
+        for stage, value in sample.timings_ms.items():
+            if isinstance(value, (int, float)):
+                stages.setdefault(stage, []).append(value)
+
+    report = {
+        "requests": len(samples),
+        "succeeded": len(succeeded),
+        "failed": len(samples) - len(succeeded),
+        "error_rate": round((len(samples) - len(succeeded)) / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+        "degraded": sum(sample.degraded for sample in succeeded),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(succeeded) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": percentiles([sample.latency_ms for sample in succeeded])
+    }
+    if streaming:
+        report["ttft_ms"] = percentiles(
+            [sample.ttft_ms for sample in succeeded if sample.ttft_ms is not None]
+        )
+    report["server_timings_ms"] = {stage: percentiles(values) for stage, values in sorted(stages.items())}
+    return report
+
+
+async def run_endpoint(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    bodies: List[Dict[str, Any]],
+    concurrency: int,
+    duration: Optional[float]
+) -> Dict[str, Any]:
+    """
+    Drive one endpoint with a closed loop of concurrent clients.
+
+    Sends every body once, or cycles through them until duration seconds
+    have passed.
+    """
+    send = send_stream if endpoint == "stream" else send_chat
+    pending = itertools.cycle(bodies) if duration else iter(bodies)
+    samples: List[Sample] = []
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    async def worker() -> None:
+        for body in pending:
+            if deadline and time.perf_counter() >= deadline:
+                return
+            # Every request opens its own session
+            samples.append(await send(client, {**body, "session_id": f"loadtest-{uuid4()}"}))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - start, endpoint == "stream")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run every requested endpoint in turn and build the report"""
+    bodies = build_requests(args.requests, args.seed, personalized=not args.anonymous)
+    headers = {"Authorization": f"Bearer {args.api_key}"} if args.api_key else {}
+    report: Dict[str, Any] = {
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {
+            "base_url": args.base_url,
+            "endpoints": args.endpoints,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration_seconds": args.duration,
+            "personalized": not args.anonymous,
+            "seed": args.seed
+        },
+        "endpoints": {}
+    }
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers=headers,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    ) as client:
+        for endpoint in args.endpoints:
+            if args.warmup:
+                await run_endpoint(client, endpoint, bodies[:args.warmup], args.concurrency, None)
+            report["endpoints"][endpoint] = await run_endpoint(
+                client, endpoint, bodies, args.concurrency, args.duration
+            )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8130")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"), help="defaults to $API_KEY")
+    parser.add_argument(
+        "--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS),
+        help="endpoints to drive, one after another"
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="synthetic queries sent per endpoint")
+    parser.add_argument("--duration", type=float, default=None, help="cycle through the queries for this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent before measuring each endpoint")
+    parser.add_argument("--anonymous", action="store_true", help="send no user context")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", default=None, help="also write the report to this file")
+    parser.add_argument(
+        "--max-error-rate", type=float, default=None,
+        help="exit with status 1 if any endpoint's error rate is higher"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.max_error_rate is not None and any(
+        section["error_rate"] > args.max_error_rate for section in report["endpoints"].values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
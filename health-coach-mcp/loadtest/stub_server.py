@@ -0,0 +1,323 @@
+"""
+OpenAI-compatible stub and stub retriever backends for load testing
+
+One process serves POST /v1/chat/completions, with streaming and usage,
+plus the profile-mcp, em-mcp and dd-mcp endpoints the retrievers call. With
+it, the service runs end to end without an OpenAI key or the other services:
+
+    python -m loadtest.stub_server --port 8199 --ttft-ms 300 --tokens-per-second 60
+
+Start health-coach-mcp with OPENAI_BASE_URL=http://localhost:8199/v1. Set
+PROFILE_MCP_URL, EM_MCP_URL and DD_MCP_URL to http://localhost:8199.
+
+Each completion waits for a time to first token, drawn from a lognormal
+distribution around --ttft-ms, and then emits tokens at
+--tokens-per-second. Routing prompts get answers the router accepts:
+- the category named in the query;
+- the first allowed intent;
+- the first sub-intent that fits both.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.core.hierarchy import Category, IntentClass
+
+_QUERY_PATTERN = re.compile(r'Query: "(.*)"')
+_OPTION_PATTERN = re.compile(r"^\s*- (\w+):", re.MULTILINE)
+_SUB_INTENT_PATTERN = re.compile(r"^\s*- (\w+) \[(\w+)/(\w+)\]", re.MULTILINE)
+
+_FILLER = (
+    "consistency matters more than intensity so start with a small change you can keep "
+    "for two weeks then review how you feel and adjust one variable at a time"
+).split()
+
+
+@dataclass
+class Latency:
+    """Lognormal latency around a median; sigma 0 gives a fixed latency"""
+    median_ms: float
+    sigma: float = 0.0
+
+    def sample(self) -> float:
+        """One latency in seconds"""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(random.gauss(0, self.sigma)) / 1000
+
+
+@dataclass
+class StubConfig:
+    """Latency, token rate and failure injection for the stub"""
+    ttft: Latency = field(default_factory=lambda: Latency(300, 0.3))
+    tokens_per_second: float = 60.0
+    completion_tokens: int = 200
+    retriever_latency: Latency = field(default_factory=lambda: Latency(40, 0.3))
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+
+
+def _category(prompt: str) -> str:
+    """The category named in the query, else exercise"""
+    match = _QUERY_PATTERN.search(prompt)
+    query = (match.group(1) if match else prompt).lower()
+    for category in Category:
+        if category.value in query:
+            return category.value
+    return Category.EXERCISE.value
+
+
+def _first_intent(options: List[str]) -> str:
+    intents = {intent.value for intent in IntentClass}
+    return next((option for option in options if option in intents), IntentClass.PLAN.value)
+
+
+def _route_arguments(prompt: str, tool: Dict[str, Any]) -> Dict[str, str]:
+    """Arguments for the joint router's route_query function call"""
+    properties = tool.get("function", {}).get("parameters", {}).get("properties", {})
+    category = _category(prompt)
+    intent = _first_intent(properties.get("intent_class", {}).get("enum", []))
+    sub_intent = next(
+        (sid for sid, c, i in _SUB_INTENT_PATTERN.findall(prompt) if (c, i) == (category, intent)),
+        "none"
+    )
+    return {"category": category, "intent_class": intent, "sub_intent_id": sub_intent}
+
+
+def _answer(messages: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Completion text for a routing prompt or a coaching response"""
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    if "Respond with only the category name" in prompt:
+        return _category(prompt)
+    if "Respond with only the intent type name" in prompt:
+        return _first_intent(_OPTION_PATTERN.findall(prompt))
+    if "Respond with only the sub-intent ID" in prompt:
+        options = _OPTION_PATTERN.findall(prompt)
+        return options[0] if options else "none"
+    return " ".join(_FILLER[i % len(_FILLER)] for i in range(max_tokens))
+
+
+def _usage(messages: List[Dict[str, Any]], completion_tokens: int) -> Dict[str, Any]:
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0}
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    """Stub app serving chat completions and the retriever backends"""
+    app = FastAPI(title="Health Coach load-test stub")
+    stats = {
+        "completions": 0,
+        "streams": 0,
+        "errors": 0,
+        "rate_limited": 0,
+        "retriever_calls": 0
+    }
+
+    def injected_failure() -> Optional[JSONResponse]:
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"Retry-After": "1"}
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected failure (stub)", "type": "server_error"}},
+                status_code=500
+            )
+        return None
+
+    async def stream_tokens(
+        completion_id: str,
+        model: str,
+        tokens: List[str],
+        usage: Optional[Dict[str, Any]]
+    ) -> AsyncIterator[str]:
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        await asyncio.sleep(config.ttft.sample())
+        for i, token in enumerate(tokens):
+            if i and config.tokens_per_second > 0:
+                await asyncio.sleep(1 / config.tokens_per_second)
+            yield _chunk(completion_id, model, {"content": token})
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        if usage:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage
+            }
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = injected_failure()
+        if failure:
+            return failure
+
+        messages = body.get("messages", [])
+        model = body.get("model", "stub")
+        max_tokens = min(body.get("max_tokens") or config.completion_tokens, config.completion_tokens)
+        completion_id = f"chatcmpl-stub-{uuid4().hex[:12]}"
+
+        tools = body.get("tools") or []
+        if tools:
+            text = None
+            tool_calls = [{
+                "id": f"call_{uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": tools[0].get("function", {}).get("name", "route_query"),
+                    "arguments": json.dumps(_route_arguments(str(messages[-1].get("content", "")), tools[0]))
+                }
+            }]
+            completion_tokens = 20
+        else:
+            text = _answer(messages, max_tokens)
+            tool_calls = None
+            completion_tokens = len(text.split())
+
+        if body.get("stream") and text is not None:
+            stats["streams"] += 1
+            words = text.split(" ")
+            tokens = [words[0]] + [f" {word}" for word in words[1:]]
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            return StreamingResponse(
+                stream_tokens(
+                    completion_id, model, tokens,
+                    _usage(messages, completion_tokens) if include_usage else None
+                ),
+                media_type="text/event-stream"
+            )
+
+        stats["completions"] += 1
+        generation = (completion_tokens - 1) / config.tokens_per_second if config.tokens_per_second > 0 else 0
+        await asyncio.sleep(config.ttft.sample() + max(0.0, generation))
+        message: Dict[str, Any] = {"role": "assistant", "content": text}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop"
+            }],
+            "usage": _usage(messages, completion_tokens)
+        }
+
+    async def retriever_delay() -> None:
+        stats["retriever_calls"] += 1
+        await asyncio.sleep(config.retriever_latency.sample())
+
+    @app.get("/users/{user_id}/profile")
+    async def user_profile(user_id: str):
+        await retriever_delay()
+        return {
+            "user_id": user_id,
+            "demographics": {"age": 25 + sum(map(ord, user_id)) % 40},
+            "preferences": {"workout_time": "morning"},
+            "health_goals": ["sleep more consistently", "build strength"]
+        }
+
+    @app.get("/beliefs")
+    async def beliefs(user_id: str, topic: str = "health", limit: int = 5):
+        await retriever_delay()
+        return {
+            "beliefs": [
+                {
+                    "id": f"{user_id}-{topic}-{i}",
+                    "content": f"Belief {i + 1} about {topic.replace('_', ' ')}",
+                    "type": "statement",
+                    "confidence": 0.7,
+                    "created_at": "2024-01-01T00:00:00"
+                }
+                for i in range(limit)
+            ]
+        }
+
+    @app.get("/biomarkers")
+    async def biomarkers(user_id: str, types: str = ""):
+        await retriever_delay()
+        return {
+            "biomarkers": [
+                {"name": name, "latest_value": 50 + i, "unit": "", "trend": "stable"}
+                for i, name in enumerate(filter(None, types.split(",")))
+            ],
+            "trends": {}
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8199)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="median time to first token")
+    parser.add_argument("--ttft-sigma", type=float, default=0.3, help="lognormal spread of the time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="token rate after the first token; 0 is instant")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="tokens per coaching response, capped by max_tokens")
+    parser.add_argument("--retriever-latency-ms", type=float, default=40, help="median latency of the stub retriever backends")
+    parser.add_argument("--retriever-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of completions answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config = StubConfig(
+        ttft=Latency(args.ttft_ms, args.ttft_sigma),
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        retriever_latency=Latency(args.retriever_latency_ms, args.retriever_sigma),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
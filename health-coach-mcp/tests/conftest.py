@@ -0,0 +1,15 @@
+import os
+
+# Settings are read at import time and require an API key
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import fakeredis.aioredis
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    """In-memory Redis shared by the storage under test"""
+    client = fakeredis.aioredis.FakeRedis()
+    yield client
+    await client.aclose()
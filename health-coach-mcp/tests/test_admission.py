@@ -0,0 +1,57 @@
+import pytest
+
+from app.services.admission import AdmissionController, Overloaded
+
+
+def test_rejects_beyond_in_flight_limit_with_retry_after():
+    controller = AdmissionController("chat", max_in_flight=2)
+    controller.admit()
+    controller.admit()
+
+    with pytest.raises(Overloaded) as rejected:
+        controller.admit()
+    assert rejected.value.status_code == 503
+    assert int(rejected.value.headers["Retry-After"]) >= 1
+    assert controller.counters == {"admitted": 2, "degraded": 0, "rejected": 1}
+
+
+def test_release_frees_the_slot_once():
+    controller = AdmissionController("chat", max_in_flight=1)
+    ticket = controller.admit()
+    ticket.release()
+    ticket.release()
+    assert controller.in_flight == 0
+    assert controller.avg_duration_ms > 0
+
+    controller.admit()
+    with pytest.raises(Overloaded):
+        controller.admit()
+    assert controller.in_flight == 1
+
+
+def test_degraded_admission_up_to_its_own_cap():
+    controller = AdmissionController("stream", max_in_flight=1, degrade_max_in_flight=1)
+    full = controller.admit()
+    degraded = controller.admit()
+    assert not full.degraded and degraded.degraded
+    with pytest.raises(Overloaded):
+        controller.admit()
+
+    degraded.release()
+    assert controller.degraded_in_flight == 0
+    assert controller.in_flight == 1
+    assert controller.admit().degraded
+
+
+def test_rejects_when_estimated_wait_is_too_long():
+    wait_ms = [0.0]
+    controller = AdmissionController(
+        "chat", max_in_flight=10, max_queue_wait_ms=1000, wait_estimator=lambda: wait_ms[0]
+    )
+    controller.admit().release()
+
+    wait_ms[0] = 2500.0
+    with pytest.raises(Overloaded) as rejected:
+        controller.admit()
+    assert rejected.value.headers["Retry-After"] == "3"
+    assert controller.in_flight == 0
@@ -0,0 +1,105 @@
+import pytest
+
+from app.core.hierarchy import CONSTRAINT_HIERARCHY
+from app.evaluation.constraint_engine import (
+    CONSTRAINT_ENGINE,
+    ConstraintEngine,
+    ConstraintRule,
+    StreamingConstraintMonitor,
+    constraint_specs,
+    hierarchy_constraints,
+)
+
+
+def spec(constraint_id: str):
+    """Evaluation spec for a hierarchy constraint"""
+    constraints = {c.id: c for c in hierarchy_constraints(CONSTRAINT_HIERARCHY)}
+    return constraint_specs([constraints[constraint_id]])[0]
+
+
+def test_every_rule_binds_to_a_hierarchy_constraint():
+    bound = {index for rules in CONSTRAINT_ENGINE.bindings.values() for index in rules}
+    assert bound == set(range(len(CONSTRAINT_ENGINE.rules)))
+
+
+def test_forbidden_jargon_and_anecdotes_are_violations():
+    result = CONSTRAINT_ENGINE.evaluate(
+        "My friend swears by it, thanks to thermogenesis.", [spec("c1"), spec("si3")]
+    )
+    assert not result["passed"]
+    assert [v["constraint_id"] for v in result["violations"]] == ["c1", "si3"]
+    assert result["score"] == 1.0 - 0.3 - 0.3
+
+
+def test_required_research_citation():
+    assert not CONSTRAINT_ENGINE.evaluate("Walk more.", [spec("si1")])["passed"]
+    result = CONSTRAINT_ENGINE.evaluate("A meta-analysis found walking helps.", [spec("si1")])
+    assert result == {"passed": True, "violations": [], "suggestions": [], "score": 1.0}
+
+
+def test_constraints_outside_the_hierarchy_are_bound_on_first_use():
+    custom = ("x1", "tone", "Keep it simple", "low")
+    result = CONSTRAINT_ENGINE.evaluate("Gluconeogenesis explained.", [custom])
+    assert result["violations"][0]["constraint_id"] == "x1"
+    assert result["score"] == 0.9
+
+
+def test_term_inside_a_longer_match_still_counts():
+    engine = ConstraintEngine(rules=(
+        ConstraintRule("tone", "plain", ("case study",), "forbid", "case", "drop it"),
+        ConstraintRule("data_source", "cited", ("study",), "require", "uncited", "cite"),
+    ), hierarchy=None)
+    assert engine.bindings == {}
+    assert engine.scan("One Case Study showed it.") == {0, 1}
+    result = engine.evaluate("One case study showed it.", [
+        ("a", "tone", "plain words", "medium"), ("b", "data_source", "cited work", "high")
+    ])
+    assert [v["constraint_id"] for v in result["violations"]] == ["a"]
+
+
+class Deltas:
+    """Async delta source that records how far it was read and whether it was closed"""
+
+    def __init__(self, deltas):
+        self.deltas = list(deltas)
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == len(self.deltas):
+            raise StopAsyncIteration
+        self.sent += 1
+        return self.deltas[self.sent - 1]
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_monitor_finds_a_term_split_across_deltas():
+    monitor = StreamingConstraintMonitor([spec("c1")])
+    assert monitor.active
+    assert monitor.feed("This is thermo") is None
+    violation = monitor.feed("Genesis at work.")
+    assert violation["constraint_id"] == "c1"
+    assert monitor.feed("more text") is violation
+
+
+def test_monitor_ignores_other_severities_and_require_rules():
+    low = ("c1", "tone", "Simple language", "low")
+    assert not StreamingConstraintMonitor([low, spec("si1")]).active
+    assert StreamingConstraintMonitor([low], severities=("low",)).active
+
+
+@pytest.mark.asyncio
+async def test_watch_stops_before_the_violating_delta_and_closes_the_source():
+    source = Deltas(["Try walking. ", "My friend ", "did it.", "Unread."])
+    monitor = StreamingConstraintMonitor([spec("si3")])
+
+    passed = [delta async for delta in monitor.watch(source)]
+    assert passed == ["Try walking. "]
+    assert monitor.violation["constraint_id"] == "si3"
+    assert source.sent == 2
+    assert source.closed
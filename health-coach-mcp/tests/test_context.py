@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from app.core.hierarchy import Category, IntentClass
+from app.models.chat import RoutingDecision
+from app.services.context import EMPTY, INCLUDED, SKIPPED, TIMED_OUT, ContextFetch
+
+
+class SlowRetriever:
+    """Stands in for all three retrievers, answering after a fixed delay"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def _answer(self, value):
+        await asyncio.sleep(self.delay)
+        return value
+
+    def get_user_profile(self, user_id):
+        return self._answer({"summary": f"profile for {user_id}"})
+
+    def get_relevant_beliefs(self, user_id, category):
+        return self._answer([{"content": "sleep matters"}])
+
+    def get_recent_data(self, user_id, category):
+        return self._answer({"summary": "hrv: 40"})
+
+
+class EmptyProfileRetriever(SlowRetriever):
+    """Profile retriever for a user who has no profile"""
+
+    def __init__(self):
+        super().__init__(delay=0)
+
+    def get_user_profile(self, user_id):
+        return self._answer(None)
+
+
+def plan_decision() -> RoutingDecision:
+    return RoutingDecision(
+        category=Category.SLEEP,
+        intent_class=IntentClass.PLAN,
+        confidence=1.0,
+        reasoning="test"
+    )
+
+
+def make_fetch(delay: float, budget_ms: int, deadline_ms: int = 1000, user_id="u1") -> ContextFetch:
+    retriever = SlowRetriever(delay)
+    fetch = ContextFetch(retriever, retriever, retriever, user_id=user_id, budget_ms=budget_ms)
+    fetch.deadlines_ms = {source: deadline_ms for source in fetch.deadlines_ms}
+    return fetch
+
+
+@pytest.mark.asyncio
+async def test_slow_routing_does_not_consume_budget():
+    """Sources started after routing get the whole budget"""
+    fetch = make_fetch(delay=0.05, budget_ms=200)
+    fetch.start_profile()
+
+    # Routing takes longer than the whole budget
+    await asyncio.sleep(0.3)
+    fetch.start_decision(plan_decision())
+    context, status = await fetch.collect()
+
+    assert status == {
+        "user_profile": INCLUDED,
+        "user_beliefs": INCLUDED,
+        "health_data": INCLUDED
+    }
+    assert context["health_data"] == {"summary": "hrv: 40"}
+
+
+@pytest.mark.asyncio
+async def test_source_deadline_times_out():
+    fetch = make_fetch(delay=0.5, budget_ms=2000, deadline_ms=50)
+    fetch.start_decision(plan_decision())
+    context, status = await fetch.collect()
+
+    assert context == {}
+    assert set(status.values()) == {TIMED_OUT}
+
+
+@pytest.mark.asyncio
+async def test_budget_cancels_pending_sources():
+    fetch = make_fetch(delay=0.5, budget_ms=50, deadline_ms=5000)
+    fetch.start_decision(plan_decision())
+
+    started = asyncio.get_running_loop().time()
+    _, status = await fetch.collect()
+
+    assert asyncio.get_running_loop().time() - started < 0.3
+    assert set(status.values()) == {TIMED_OUT}
+    await asyncio.gather(*fetch._tasks.values(), return_exceptions=True)
+    assert all(task.cancelled() for task in fetch._tasks.values())
+
+
+@pytest.mark.asyncio
+async def test_health_data_skipped_for_research_intents():
+    fetch = make_fetch(delay=0, budget_ms=200)
+    decision = plan_decision()
+    decision.intent_class = IntentClass.EVIDENCE_RESEARCH
+    fetch.start_decision(decision)
+    _, status = await fetch.collect()
+
+    assert status["health_data"] == SKIPPED
+    assert status["user_profile"] == INCLUDED
+
+
+@pytest.mark.asyncio
+async def test_anonymous_requests_skip_every_source():
+    fetch = make_fetch(delay=0, budget_ms=200, user_id=None)
+    fetch.start_profile()
+    fetch.start_decision(plan_decision())
+    context, status = await fetch.collect()
+
+    assert context == {}
+    assert set(status.values()) == {SKIPPED}
+
+
+@pytest.mark.asyncio
+async def test_empty_results_are_reported():
+    fetch = make_fetch(delay=0, budget_ms=200)
+    fetch.profile_retriever = EmptyProfileRetriever()
+    fetch.start_profile()
+    fetch.start_decision(plan_decision())
+    _, status = await fetch.collect()
+
+    assert status["user_profile"] == EMPTY
@@ -0,0 +1,18 @@
+from app.core.hierarchy import CONSTRAINT_HIERARCHY, Cohort
+from app.core.hierarchy_index import HIERARCHY_INDEX
+
+
+def test_serialize_matches_constraint_dicts():
+    constraints = CONSTRAINT_HIERARCHY["cohorts"][Cohort.SEDENTARY_BEGINNER]["constraints"]
+    assert list(HIERARCHY_INDEX.serialize(constraints)) == [c.dict() for c in constraints]
+
+
+def test_serialize_returns_copies():
+    constraints = HIERARCHY_INDEX.cohort_constraints[Cohort.SEDENTARY_BEGINNER]
+    first = HIERARCHY_INDEX.serialize(constraints)
+    first[0]["description"] = "changed"
+    first[0]["tools_required"].append("changed")
+    first[0]["failure_modes"].clear()
+
+    second = HIERARCHY_INDEX.serialize(constraints)
+    assert second[0] == constraints[0].dict()
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from app.services.llm_governor import LLMGovernor
+
+
+def rate_limit_error(retry_after=None) -> RateLimitError:
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(
+        429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    )
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class FakeClient:
+    """OpenAI client stand-in that raises the queued errors, then answers"""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request):
+        self.calls.append((time.monotonic(), request))
+        await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        if request.get("stream"):
+            return FakeStream()
+        return "response"
+
+
+class FakeStream:
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for chunk in ("a", "b"):
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def request(**kwargs):
+    return {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 10, **kwargs}
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_halves_limit_and_honours_retry_after():
+    governor = LLMGovernor(initial_concurrency=16)
+    client = FakeClient(errors=[rate_limit_error(retry_after=0.2)])
+
+    assert await governor.create(client, "generation", **request()) == "response"
+    (first, _), (second, _) = client.calls
+    assert second - first >= 0.2
+    assert governor.concurrency_limit == 8
+    assert governor.counters["rate_limited"] == 1
+    assert governor.counters["retries"] == 1
+    assert governor.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_burst_lowers_limit_once():
+    governor = LLMGovernor(initial_concurrency=16, max_retries=0)
+    client = FakeClient(errors=[rate_limit_error(retry_after=0.01) for _ in range(4)])
+
+    results = await asyncio.gather(
+        *(governor.create(client, "generation", **request()) for _ in range(4)),
+        return_exceptions=True
+    )
+    assert all(isinstance(result, RateLimitError) for result in results)
+    assert governor.concurrency_limit == 8
+    assert governor.counters["rate_limited"] == 4
+
+
+@pytest.mark.asyncio
+async def test_retries_exhausted_raise_and_free_the_slot():
+    governor = LLMGovernor(max_retries=1)
+    client = FakeClient(errors=[rate_limit_error(retry_after=0.01), rate_limit_error(retry_after=0.01)])
+
+    with pytest.raises(RateLimitError):
+        await governor.create(client, "generation", **request())
+    assert len(client.calls) == 2
+    assert governor.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_other_errors_free_the_slot():
+    governor = LLMGovernor()
+    client = FakeClient(errors=[ValueError("bad request")])
+
+    with pytest.raises(ValueError):
+        await governor.create(client, "generation", **request())
+    assert governor.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_slot_until_closed():
+    governor = LLMGovernor()
+    stream = await governor.create(FakeClient(), "generation", **request(stream=True))
+    assert governor.in_flight == 1
+
+    await stream.close()
+    await stream.close()
+    assert governor.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_hold_a_slot():
+    governor = LLMGovernor(initial_concurrency=1, min_concurrency=1, max_concurrency=1)
+    client = FakeClient(delay=0.1)
+    running = asyncio.create_task(governor.create(client, "generation", **request()))
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(governor.create(client, "generation", **request()))
+    await asyncio.sleep(0)
+    assert governor.stats()["queued"]["generation"] == 1
+
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+    assert await running == "response"
+    assert governor.in_flight == 0
+    assert governor.stats()["queued"]["generation"] == 0
+
+
+@pytest.mark.asyncio
+async def test_routing_lane_is_dispatched_first():
+    governor = LLMGovernor(initial_concurrency=1, min_concurrency=1, max_concurrency=1)
+    client = FakeClient(delay=0.05)
+    first = asyncio.create_task(governor.create(client, "generation", **request(user="first")))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.create_task(governor.create(client, lane, **request(user=lane)))
+        for lane in ("batch", "generation", "routing")
+    ]
+    await asyncio.gather(first, *queued)
+
+    assert [call["user"] for _, call in client.calls] == ["first", "routing", "generation", "batch"]
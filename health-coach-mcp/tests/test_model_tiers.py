@@ -0,0 +1,148 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm_governor import GovernedClient, LLMGovernor
+from app.services import model_tiers
+from app.services.model_tiers import ModelTiers, StageModel
+
+
+class FakeClient:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, **request):
+        self.models.append(model)
+        await asyncio.sleep(self.delay)
+        return "response"
+
+
+def make_tiers(**kwargs) -> ModelTiers:
+    stage = StageModel(
+        stage="generation",
+        model="primary",
+        fallback_model="fallback",
+        max_tokens=100,
+        timeout_seconds=10.0,
+        p95_budget_ms=100.0
+    )
+    return ModelTiers({"generation": stage}, min_samples=5, **kwargs)
+
+
+def breach(tiers: ModelTiers) -> None:
+    for _ in range(5):
+        tiers.window("generation", "primary").add(500.0)
+    assert tiers.select("generation") == "fallback"
+
+
+@pytest.mark.asyncio
+async def test_primary_is_probed_while_over_budget():
+    tiers = make_tiers(probe_fraction=0.25)
+    breach(tiers)
+    client = FakeClient()
+    for _ in range(8):
+        await tiers.create(client, "generation", messages=[])
+
+    assert client.models == ["fallback", "fallback", "fallback", "primary"] * 2
+    assert tiers.counters["probe_calls"] == 2
+    assert tiers.counters["fallback_calls"] == 6
+
+
+def test_stays_on_fallback_until_primary_has_fresh_samples():
+    tiers = make_tiers()
+    breach(tiers)
+    window = tiers.window("generation", "primary")
+
+    # The slow samples aging out is not enough on its own
+    window.samples.clear()
+    assert tiers.select("generation") == "fallback"
+    for _ in range(4):
+        window.add(20.0)
+    assert tiers.select("generation") == "fallback"
+
+    window.add(20.0)
+    assert tiers.select("generation") == "primary"
+
+
+@pytest.mark.asyncio
+async def test_no_probes_when_disabled():
+    tiers = make_tiers(probe_fraction=0)
+    breach(tiers)
+    client = FakeClient()
+    for _ in range(40):
+        await tiers.create(client, "generation", messages=[])
+    assert set(client.models) == {"fallback"}
+
+
+@pytest.mark.asyncio
+async def test_governor_queueing_is_not_counted_as_model_latency():
+    tiers = make_tiers()
+    governor = LLMGovernor(initial_concurrency=1, min_concurrency=1, max_concurrency=1)
+    client = GovernedClient(FakeClient(delay=0.05), governor, "generation")
+
+    # Each call waits behind the others for the single slot
+    await asyncio.gather(*(tiers.create(client, "generation", messages=[]) for _ in range(5)))
+    samples = [ms for _, ms in tiers.window("generation", "primary").samples]
+    assert len(samples) == 5
+    assert max(samples) < 100
+    assert tiers.select("generation") == "primary"
+
+
+def test_stats_and_metrics_do_not_switch_models():
+    tiers = make_tiers()
+    for _ in range(5):
+        tiers.window("generation", "primary").add(500.0)
+
+    tiers.stats()
+    tiers.prometheus()
+    assert tiers.active_model("generation") == "primary"
+    assert tiers.stats()["stages"]["generation"]["active_model"] == "primary"
+    assert tiers.select("generation") == "fallback"
+    assert tiers.stats()["stages"]["generation"]["active_model"] == "fallback"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_light_stage_recovers_from_fallback(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_tiers.time, "monotonic", clock)
+    # One call a minute: far too few for 5% probing to reach min_samples
+    tiers = make_tiers(window_seconds=300.0)
+    breach(tiers)
+    client = FakeClient()
+    for _ in range(10):
+        clock.now += 60
+        await tiers.create(client, "generation", messages=[])
+
+    assert "primary" in client.models[:2]
+    assert tiers.active_model("generation") == "primary"
+
+
+@pytest.mark.asyncio
+async def test_light_stage_stays_on_fallback_while_probes_are_slow(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_tiers.time, "monotonic", clock)
+    tiers = make_tiers(window_seconds=300.0)
+    breach(tiers)
+
+    class SlowPrimary(FakeClient):
+        async def create_timed(self, model, **request):
+            response = await self.create(model, **request)
+            return response, 500.0 if model == "primary" else 20.0
+
+    client = SlowPrimary()
+    for _ in range(8):
+        clock.now += 60
+        await tiers.create(client, "generation", messages=[])
+    assert tiers.counters["probe_calls"] == 8
+    assert tiers.active_model("generation") == "fallback"
@@ -0,0 +1,35 @@
+import pytest
+
+from app.core.config import settings
+from app.services.response_cache import ResponseCache
+
+
+def test_default_generation_temperature_is_not_cached():
+    cache = ResponseCache(max_temperature=settings.RESPONSE_CACHE_MAX_TEMPERATURE)
+    assert cache.bypass(None, settings.GENERATION_TEMPERATURE)
+    assert cache.counters["bypassed_temperature"] == 1
+
+
+def test_bypass_reasons_are_counted_in_order():
+    cache = ResponseCache(max_temperature=0.3)
+    assert cache.bypass({"profile": {"age": 40}}, 0.9, feedback="too long")
+    assert cache.bypass(None, 0.9, feedback="too long")
+    assert cache.bypass(None, 0.31)
+    assert not cache.bypass({}, 0.3)
+    assert not cache.bypass(None, 0.0)
+    assert {k: v for k, v in cache.counters.items() if k.startswith("bypassed_")} == {
+        "bypassed_personalized": 1, "bypassed_feedback": 1, "bypassed_temperature": 1
+    }
+
+
+@pytest.mark.asyncio
+async def test_redis_hits_are_promoted_into_memory(redis_client):
+    await ResponseCache(redis_client=redis_client).set("k", "cached answer")
+
+    cache = ResponseCache(redis_client=redis_client)
+    assert await cache.get("k") == "cached answer"
+    assert await cache.get("k") == "cached answer"
+    assert await cache.get("other") is None
+    assert cache.counters["redis_hits"] == 1
+    assert cache.counters["memory_hits"] == 1
+    assert cache.counters["misses"] == 1
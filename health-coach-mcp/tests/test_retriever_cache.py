@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.services.retriever_cache import RetrieverCache
+
+
+class Upstream:
+    """Fetch stand-in whose calls block until released, returning numbered values"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self):
+        self.calls += 1
+        value = {"version": self.calls}
+        await self.release.wait()
+        return value
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_fetch():
+    cache = RetrieverCache(ttl_seconds={"profile": 60})
+    upstream = Upstream()
+    key = cache.make_key("profile", "u1")
+
+    waiters = [asyncio.create_task(cache.get_or_fetch(key, upstream.fetch)) for _ in range(3)]
+    await asyncio.sleep(0)
+    upstream.release.set()
+    assert await asyncio.gather(*waiters) == [{"version": 1}] * 3
+    assert upstream.calls == 1
+    assert await cache.get_or_fetch(key, upstream.fetch) == {"version": 1}
+    assert cache.counters["fresh_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_miss_after_invalidate_does_not_join_the_earlier_fetch():
+    cache = RetrieverCache(ttl_seconds={"profile": 60})
+    upstream = Upstream()
+    key = cache.make_key("profile", "u1")
+
+    before = asyncio.create_task(cache.get_or_fetch(key, upstream.fetch))
+    await asyncio.sleep(0)
+    cache.invalidate("u1")
+    after = asyncio.create_task(cache.get_or_fetch(key, upstream.fetch))
+    await asyncio.sleep(0)
+    upstream.release.set()
+
+    assert await before == {"version": 1}
+    assert await after == {"version": 2}
+    assert upstream.calls == 2
+    assert cache._entries[key][1] == {"version": 2}
+
+
+@pytest.mark.asyncio
+async def test_invalidated_fetch_does_not_repopulate():
+    cache = RetrieverCache(ttl_seconds={"profile": 60, "beliefs": 60})
+    upstream = Upstream()
+    profile = cache.make_key("profile", "u1")
+    beliefs = cache.make_key("beliefs", "u1", "sleep")
+
+    fetches = [
+        asyncio.create_task(cache.get_or_fetch(key, upstream.fetch)) for key in (profile, beliefs)
+    ]
+    await asyncio.sleep(0)
+    cache.invalidate("u1", source="profile")
+    upstream.release.set()
+    await asyncio.gather(*fetches)
+
+    assert list(cache._entries) == [beliefs]
+    assert cache.stats()["refreshing"] == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidation_leaves_no_per_user_state():
+    cache = RetrieverCache(ttl_seconds={"profile": 60})
+    upstream = Upstream()
+    upstream.release.set()
+
+    for user_id in ("u1", "u2", "u3"):
+        await cache.get_or_fetch(cache.make_key("profile", user_id), upstream.fetch)
+        cache.invalidate(user_id)
+    cache.invalidate("never-seen")
+
+    assert not cache._entries
+    assert not cache._keys_by_user
+    assert not cache._inflight
+    assert not cache._tasks
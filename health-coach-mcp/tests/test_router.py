@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.core.hierarchy import Category, Cohort, IntentClass
+from app.services.pre_router import PreRouteMatch, PreRouteResult
+from app.services.router import _CATEGORY_DESCRIPTIONS, SemanticRouter
+
+SUB_INTENT = "evidence_research_nutrition_meta_analysis"
+
+
+class FixedPreRouter:
+    """Pre-router stand-in that puts one sub-intent first with a set confidence"""
+
+    def __init__(self, confidence=None):
+        self.confidence = confidence
+
+    def score(self, query, user_cohort):
+        if self.confidence is None:
+            return PreRouteResult(matches=[], scores={})
+        match = PreRouteMatch(
+            category=Category.NUTRITION,
+            intent_class=IntentClass.EVIDENCE_RESEARCH,
+            sub_intent_id=SUB_INTENT,
+            score=1.0,
+            confidence=self.confidence
+        )
+        return PreRouteResult(matches=[match], scores={SUB_INTENT: 1.0})
+
+
+class ScriptedModels:
+    """Model tiers stand-in answering each stage from a script"""
+
+    def __init__(self, answers=None, error=None):
+        self.answers = answers or {}
+        self.error = error
+        self.calls = []
+
+    async def create(self, client, stage, **request):
+        self.calls.append((stage, request))
+        if self.error:
+            raise self.error
+        message = SimpleNamespace(content=self.answers[stage])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_router(pre_router, models) -> SemanticRouter:
+    router = SemanticRouter(pre_router=pre_router, mode="cascade", client=object())
+    router.models = models
+    return router
+
+
+LLM_ANSWERS = {"category": "nutrition", "intent": "evidence_research", "sub_intent": SUB_INTENT}
+
+
+@pytest.mark.asyncio
+async def test_confident_pre_route_skips_the_llm():
+    models = ScriptedModels()
+    router = make_router(FixedPreRouter(settings.PRE_ROUTER_CONFIDENCE_THRESHOLD), models)
+
+    decision = await router.route("does creatine work", Cohort.OPTIMIZER)
+    assert decision.metadata["source"] == "pre_router"
+    assert decision.sub_intent_id == SUB_INTENT
+    assert decision.constraints
+    assert models.calls == []
+
+
+@pytest.mark.asyncio
+async def test_pre_route_below_threshold_falls_through_to_the_llm():
+    models = ScriptedModels(LLM_ANSWERS)
+    router = make_router(FixedPreRouter(settings.PRE_ROUTER_CONFIDENCE_THRESHOLD - 0.01), models)
+
+    decision = await router.route("does creatine work", Cohort.OPTIMIZER)
+    assert decision.metadata["source"] == "llm_cascade"
+    assert [stage for stage, _ in models.calls] == ["category", "intent", "sub_intent"]
+    assert decision.sub_intent_id == SUB_INTENT
+    # The LLM agrees with the strongest lexical evidence
+    assert decision.confidence == 1.0
+
+    category_prompt = models.calls[0][1]["messages"][1]["content"]
+    for category, description in _CATEGORY_DESCRIPTIONS.items():
+        assert f"- {category.value}: {description}" in category_prompt
+
+
+@pytest.mark.asyncio
+async def test_unknown_category_answer_defaults_to_exercise():
+    router = make_router(None, ScriptedModels({"category": "hydration"}))
+    assert await router._detect_category("how much water") == Category.EXERCISE
+
+
+@pytest.mark.asyncio
+async def test_llm_failure_returns_the_fallback_route():
+    router = make_router(FixedPreRouter(0.1), ScriptedModels(error=RuntimeError("upstream down")))
+
+    decision = await router.route("does creatine work", Cohort.OPTIMIZER)
+    assert decision.metadata["source"] == "fallback"
+    assert decision.category == Category.EXERCISE
+    assert decision.confidence == 0.0
+
+
+@pytest.mark.asyncio
+async def test_degraded_routing_takes_any_pre_route_then_the_cohort_default():
+    models = ScriptedModels()
+    decision = await make_router(FixedPreRouter(0.1), models).route_without_llm(
+        "does creatine work", Cohort.OPTIMIZER
+    )
+    assert decision.metadata["source"] == "pre_router_degraded"
+    assert decision.sub_intent_id == SUB_INTENT
+
+    decision = await make_router(FixedPreRouter(), models).route_without_llm(
+        "hello", Cohort.SEDENTARY_BEGINNER
+    )
+    assert decision.metadata["source"] == "degraded_default"
+    assert decision.intent_class == IntentClass.PLAN
+    assert models.calls == []
@@ -0,0 +1,230 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from app.core.config import settings
+from app.core.hierarchy import Category, IntentClass
+from app.models.chat import ChatMessage, ConversationTrace, RoutingDecision
+from app.services.storage import TRACE_TTL_SECONDS, ConversationStorage
+
+
+def decision(category=Category.SLEEP, intent=IntentClass.PLAN) -> RoutingDecision:
+    return RoutingDecision(category=category, intent_class=intent, confidence=0.9, reasoning="test")
+
+
+async def add_turn(storage: ConversationStorage, session_id: str, text: str) -> ConversationTrace:
+    trace = await storage.open_trace(session_id=session_id, user_id="u1")
+    trace.messages.append(ChatMessage(role="user", content=text))
+    trace.routing_decisions.append(decision())
+    trace.messages.append(ChatMessage(role="assistant", content=f"answer to {text}"))
+    await storage.save_trace(trace)
+    return trace
+
+
+@pytest.mark.asyncio
+async def test_log_mode_appends_and_replays_turns(redis_client):
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    first = await add_turn(storage, "s1", "one")
+    second = await add_turn(storage, "s1", "two")
+
+    assert second.trace_id == first.trace_id
+    trace = await storage.get_trace("s1")
+    assert [m.content for m in trace.messages] == ["one", "answer to one", "two", "answer to two"]
+    assert len(trace.routing_decisions) == 2
+    assert await redis_client.llen("trace:s1:log") == 6
+
+
+@pytest.mark.asyncio
+async def test_log_mode_open_trace_reads_no_history(redis_client):
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    await add_turn(storage, "s1", "one")
+
+    trace = await storage.open_trace(session_id="s1", user_id="u1")
+    assert trace.messages == []
+    # Saving without new entries appends nothing
+    await storage.save_trace(trace)
+    assert await redis_client.llen("trace:s1:log") == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_do_not_overwrite_each_other(redis_client):
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    await asyncio.gather(*(add_turn(storage, "s1", f"turn {n}") for n in range(5)))
+
+    trace = await storage.get_trace("s1")
+    assert sorted(m.content for m in trace.messages if m.role == "user") == [f"turn {n}" for n in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_log_mode_evaluation_trace_is_expanded(redis_client):
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    trace = await add_turn(storage, "s1", "one")
+
+    evaluation = await storage.get_evaluation_trace(trace.trace_id)
+    assert evaluation["session_id"] == "s1"
+    assert [turn["content"] for turn in evaluation["conversation"]] == ["one", "answer to one"]
+
+
+@pytest.mark.asyncio
+async def test_blob_sessions_stay_readable_in_log_mode(redis_client):
+    blob_storage = ConversationStorage(redis_client=redis_client, mode="blob")
+    original = await add_turn(blob_storage, "s1", "one")
+
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    trace = await storage.get_trace("s1")
+    assert trace.trace_id == original.trace_id
+    assert [m.content for m in trace.messages] == ["one", "answer to one"]
+
+
+@pytest.mark.asyncio
+async def test_blob_session_is_migrated_on_next_turn(redis_client):
+    blob_storage = ConversationStorage(redis_client=redis_client, mode="blob")
+    original = await add_turn(blob_storage, "s1", "one")
+
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    trace = await add_turn(storage, "s1", "two")
+
+    assert trace.trace_id == original.trace_id
+    migrated = await storage.get_trace("s1")
+    assert migrated.trace_id == original.trace_id
+    assert [m.content for m in migrated.messages] == ["one", "answer to one", "two", "answer to two"]
+    assert len(migrated.routing_decisions) == 2
+    assert not await redis_client.exists("trace:s1")
+    meta = json.loads(await redis_client.get("trace:s1:meta"))
+    assert meta["trace_id"] == original.trace_id
+
+    evaluation = await storage.get_evaluation_trace(original.trace_id)
+    assert len(evaluation["conversation"]) == 4
+
+
+@pytest.mark.asyncio
+async def test_log_mode_keeps_conversation_content_for_the_trace_ttl(redis_client):
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    trace = await add_turn(storage, "s1", "one")
+
+    for key in ("trace:s1:log", "trace:s1:meta"):
+        ttl = await redis_client.ttl(key)
+        assert 0 < ttl <= TRACE_TTL_SECONDS
+    # The evaluation stub only points at the session
+    stub = json.loads(await redis_client.get(f"evaluation:{trace.trace_id}"))
+    assert "conversation" not in stub and "messages" not in stub
+
+
+class StubArchive:
+    """Archive stand-in serving one stored trace, or failing"""
+
+    def __init__(self, trace=None, delay=0.0, error=None, rows=()):
+        self.trace = trace
+        self.delay = delay
+        self.error = error
+        self.lookups = 0
+        # (trace, updated_at) pairs served by query
+        self.rows = list(rows)
+
+    def enqueue(self, session_id):
+        pass
+
+    async def get_by_session(self, session_id):
+        self.lookups += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.trace
+
+    async def query(self, before, limit, user_id=None, start=None, category=None,
+                    intent=None, before_trace_id=None):
+        rows = sorted(self.rows, key=lambda row: (row[1], row[0].trace_id), reverse=True)
+        if before:
+            rows = [
+                (trace, updated_at) for trace, updated_at in rows
+                if updated_at < before or (
+                    before_trace_id and updated_at == before and trace.trace_id < before_trace_id
+                )
+            ]
+        return rows[:limit]
+
+
+async def expire_from_redis(redis_client, session_id):
+    await redis_client.delete(f"trace:{session_id}:meta", f"trace:{session_id}:log")
+
+
+@pytest.mark.asyncio
+async def test_new_sessions_skip_the_archive(redis_client):
+    archive = StubArchive()
+    storage = ConversationStorage(redis_client=redis_client, mode="log", archive=archive)
+    await storage.open_trace(session_id="s1", user_id="u1")
+    assert archive.lookups == 0
+
+
+@pytest.mark.asyncio
+async def test_expired_session_reopens_from_archive(redis_client):
+    archive = StubArchive()
+    storage = ConversationStorage(redis_client=redis_client, mode="log", archive=archive)
+    first = await add_turn(storage, "s1", "one")
+    archive.trace = await storage.get_trace("s1")
+    await expire_from_redis(redis_client, "s1")
+
+    second = await add_turn(storage, "s1", "two")
+    assert archive.lookups == 1
+    assert second.trace_id == first.trace_id
+    trace = await storage.get_trace("s1")
+    assert [m.content for m in trace.messages] == ["one", "answer to one", "two", "answer to two"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("archive", [
+    StubArchive(error=RuntimeError("archive down")),
+    StubArchive(delay=5.0)
+])
+async def test_archive_failure_does_not_fork_the_session(redis_client, archive, monkeypatch):
+    monkeypatch.setattr(settings, "TRACE_ARCHIVE_LOOKUP_TIMEOUT_SECONDS", 0.05)
+    storage = ConversationStorage(redis_client=redis_client, mode="log", archive=archive)
+    await add_turn(storage, "s1", "one")
+    await expire_from_redis(redis_client, "s1")
+
+    await add_turn(storage, "s1", "two")
+    assert await redis_client.get("trace:s1:meta") is None
+    assert await redis_client.llen("trace:s1:log") == 0
+
+
+async def read_all_pages(storage, limit, **filters):
+    trace_ids, cursor = [], None
+    while True:
+        page = await storage.get_traces_for_evaluation(limit=limit, cursor=cursor, **filters)
+        trace_ids.extend(trace["trace_id"] for trace in page["traces"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return trace_ids
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+async def test_pagination_returns_tied_traces_once(redis_client, limit):
+    storage = ConversationStorage(redis_client=redis_client, mode="log")
+    traces = [await add_turn(storage, f"s{i}", "hello") for i in range(7)]
+    # Every trace updated at the same instant, in every index
+    for key in await redis_client.keys("evaluation_index:*"):
+        await redis_client.zadd(key, {trace.trace_id: 1700000000.0 for trace in traces})
+
+    expected = sorted((trace.trace_id for trace in traces), reverse=True)
+    assert await read_all_pages(storage, limit) == expected
+    assert await read_all_pages(storage, limit, user_id="u1", category="sleep") == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [1, 2, 4])
+async def test_pagination_continues_into_archive_across_ties(redis_client, limit):
+    archived_at = datetime(2023, 11, 1)
+    cold = [ConversationTrace(session_id=f"old{i}", user_id="u1") for i in range(5)]
+    archive = StubArchive(rows=[(trace, archived_at) for trace in cold])
+    storage = ConversationStorage(redis_client=redis_client, mode="log", archive=archive)
+    hot = [await add_turn(storage, f"s{i}", "hello") for i in range(3)]
+    await redis_client.zadd("evaluation_index:all", {trace.trace_id: 1700000000.0 for trace in hot})
+
+    trace_ids = await read_all_pages(storage, limit)
+    assert trace_ids == (
+        sorted((trace.trace_id for trace in hot), reverse=True)
+        + sorted((trace.trace_id for trace in cold), reverse=True)
+    )
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.chat import ConversationTrace
+from app.services.trace_archive import TraceArchive
+
+
+class RecordingSession:
+    """Async session stand-in that keeps the statements it executes"""
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.executed.append(statement)
+
+    async def commit(self):
+        pass
+
+
+def make_archive(**kwargs) -> TraceArchive:
+    archive = TraceArchive(session_factory=None, **kwargs)
+
+    async def loader(session_ids):
+        return [
+            (ConversationTrace(session_id=sid, user_id="u1"), datetime(2024, 1, 1))
+            for sid in session_ids
+        ]
+
+    archive._loader = loader
+    return archive
+
+
+def failing_upsert(archive: TraceArchive, bad=(), down=False):
+    """Replace the upsert with one that rejects batches holding a bad session"""
+    calls = []
+
+    async def upsert(traces):
+        session_ids = [trace.session_id for trace, _ in traces]
+        calls.append(session_ids)
+        if down or set(session_ids) & set(bad):
+            raise RuntimeError("rejected")
+        written.extend(session_ids)
+
+    written = []
+    archive._upsert = upsert
+    return calls, written
+
+
+@pytest.mark.asyncio
+async def test_upsert_conflicts_on_session_id():
+    executed = []
+    archive = TraceArchive(session_factory=lambda: RecordingSession(executed))
+    trace = ConversationTrace(session_id="s1", user_id="u1")
+    await archive._upsert([(trace, datetime(2024, 1, 1))])
+
+    sql = str(executed[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (session_id) DO UPDATE" in sql
+    assert "trace_id = excluded.trace_id" in sql
+
+
+@pytest.mark.asyncio
+async def test_flush_isolates_rows_the_database_rejects():
+    archive = make_archive()
+    calls, written = failing_upsert(archive, bad={"s3"})
+    sessions = [f"s{i}" for i in range(8)]
+
+    assert not await archive._flush(sessions)
+    assert sorted(written) == sorted(set(sessions) - {"s3"})
+    assert archive._drain(10) == ["s3"]
+    assert archive.counters["archived"] == 7
+    assert archive.counters["retried"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_abandons_sessions_out_of_attempts():
+    archive = make_archive(max_attempts=3)
+    failing_upsert(archive, bad={"s1"})
+
+    for _ in range(3):
+        assert not await archive._flush(archive._drain(10) or ["s1", "s2"])
+    assert archive.counters["retried"] == 2
+    assert archive.counters["abandoned"] == 1
+    assert archive._queue.empty()
+    assert "s1" not in archive._attempts
+
+
+@pytest.mark.asyncio
+async def test_flush_stops_splitting_when_the_database_is_down():
+    archive = make_archive()
+    calls, written = failing_upsert(archive, down=True)
+    sessions = [f"s{i}" for i in range(64)]
+
+    assert not await archive._flush(sessions)
+    # The batch and its two halves, rather than every row on its own
+    assert len(calls) == 3
+    assert written == []
+    assert sorted(archive._drain(100)) == sorted(sessions)
+
+
+@pytest.mark.asyncio
+async def test_success_resets_attempts():
+    archive = make_archive(max_attempts=2)
+    failing_upsert(archive, down=True)
+    await archive._flush(["s1"])
+    assert archive._attempts == {"s1": 1}
+
+    failing_upsert(archive)
+    assert await archive._flush(archive._drain(10))
+    assert archive._attempts == {}
+    assert archive.counters["abandoned"] == 0